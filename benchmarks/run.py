@@ -0,0 +1,199 @@
+"""Run the benchmark suite and store timings per commit.
+
+    python -m benchmarks.run                       # every benchmark at 1k, 14k and 1M items
+    python -m benchmarks.run --sizes 1k 14k -k irt # a subset
+    python -m benchmarks.run --compare HEAD~1      # ratios against an earlier stored run
+
+Results go to benchmarks/results/<commit>.json (with a -dirty suffix when the
+working tree has uncommitted changes), together with the Python / NumPy /
+pandas versions and CPU count, so timings from different commits on the same
+machine can be compared.
+"""
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+from tabulate import tabulate
+from benchmarks.suite import BENCHMARKS, MAX_GRID_CELLS, SIZES
+from benchmarks.synthetic import ROOT, Synthetic
+
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+
+def git(*args):
+    try:
+        return subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def commit_id():
+    """Short hash of HEAD, suffixed -dirty when tracked files are modified."""
+    sha = git("rev-parse", "--short", "HEAD") or "unknown"
+    return sha + ("-dirty" if git("status", "--porcelain", "--untracked-files=no") else "")
+
+
+def machine():
+    return {"python": platform.python_version(), "numpy": np.__version__,
+            "pandas": pd.__version__, "platform": platform.platform(),
+            "cpu_count": os.cpu_count()}
+
+
+def time_call(fn, min_time=1.0, max_runs=20):
+    """Wall-clock seconds of each call: at least one, then repeat until `min_time` has passed."""
+    times = []
+    while not times or (sum(times) < min_time and len(times) < max_runs):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def cases(sizes, pattern=None):
+    """(key, spec, size, grid point) for every selected benchmark run."""
+    for name, spec in BENCHMARKS.items():
+        if pattern and not any(p in name for p in pattern):
+            continue
+        if spec["sizes"] is None:
+            yield name, spec, None, None
+            continue
+        for size in (s for s in sizes if s in spec["sizes"]):
+            for point in spec["grid"] or [None]:
+                if point is not None:
+                    models, perts = point
+                    if SIZES[size] * models * (perts + 1) > MAX_GRID_CELLS:
+                        continue
+                    yield f"{name}[{size},{models}x{perts}]", spec, size, point
+                else:
+                    yield f"{name}[{size}]", spec, size, None
+
+
+def run(sizes, pattern=None, min_time=1.0, max_runs=20):
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="bcr-bench-") as workdir:
+        fixtures = {}
+        for key, spec, size, point in cases(sizes, pattern):
+            quiet = io.StringIO()
+            with contextlib.redirect_stdout(quiet), warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                if size is None:
+                    fn = spec["fn"](workdir)
+                else:
+                    if size not in fixtures:
+                        fixtures[size] = Synthetic(SIZES[size], workdir)
+                    fn = spec["fn"](fixtures[size], *(point or ()))
+                times = time_call(fn, min_time, max_runs)
+            entry = {"benchmark": spec["name"], "items": SIZES.get(size),
+                     "min": min(times), "median": statistics.median(times), "runs": len(times)}
+            if point is not None:
+                entry["models"], entry["perturbations"] = point
+            results[key] = entry
+            print(f"  {key:52} {format_time(entry['min']):>10}  ({len(times)} runs)", flush=True)
+    return results
+
+
+def format_time(seconds):
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.0f} µs"
+    if seconds < 1:
+        return f"{seconds * 1e3:.1f} ms"
+    return f"{seconds:.2f} s"
+
+
+def find_results(ref):
+    """Stored results for a path, a commit (any git revision) or a stored commit-id prefix."""
+    if os.path.isfile(ref):
+        return ref
+    sha = git("rev-parse", "--short", ref) or ref
+    exact = os.path.join(RESULTS_DIR, f"{sha}.json")
+    matches = [exact] if os.path.exists(exact) else \
+        sorted(glob.glob(os.path.join(RESULTS_DIR, f"{sha}*.json")))
+    if not matches:
+        raise SystemExit(f"No stored benchmark results for '{ref}' in {RESULTS_DIR}")
+    return matches[0]
+
+
+def compare(current, reference, threshold=1.2):
+    """Print min-time ratios current / reference; returns the keys that regressed."""
+    rows, regressed = [], []
+    for key, entry in current.items():
+        ref = reference.get(key)
+        if ref is None:
+            continue
+        ratio = entry["min"] / ref["min"]
+        flag = ""
+        if ratio > threshold:
+            flag = "slower"
+            regressed.append(key)
+        elif ratio < 1 / threshold:
+            flag = "faster"
+        rows.append([key, format_time(ref["min"]), format_time(entry["min"]), f"{ratio:.2f}×", flag])
+    print(tabulate(rows, headers=["Benchmark", "Reference", "Current", "Ratio", ""],
+                   tablefmt="simple"))
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the benchmark suite")
+    parser.add_argument("--sizes", nargs="+", choices=list(SIZES), default=list(SIZES))
+    parser.add_argument("-k", dest="pattern", nargs="+", default=None,
+                        help="Only benchmarks whose name contains one of these substrings")
+    parser.add_argument("--min-time", type=float, default=1.0,
+                        help="Repeat each benchmark until this many seconds have passed")
+    parser.add_argument("--max-runs", type=int, default=20)
+    parser.add_argument("--compare", default=None,
+                        help="Stored results (file, commit or revision such as HEAD~1) to compare with")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="Ratio beyond which a benchmark counts as slower / faster")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    parser.add_argument("--no-save", action="store_true")
+    parser.add_argument("--list", action="store_true", help="List benchmark runs and exit")
+    args = parser.parse_args()
+
+    if args.list:
+        for key, *_ in cases(args.sizes, args.pattern):
+            print(key)
+        return
+
+    commit = commit_id()
+    print(f"Benchmarks at {commit} ({', '.join(args.sizes)} items)")
+    results = run(args.sizes, args.pattern, args.min_time, args.max_runs)
+
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{commit}.json")
+        stored = {}
+        if os.path.exists(path):                      # keep benchmarks not re-run this time
+            with open(path) as f:
+                stored = json.load(f)["results"]
+        stored.update(results)
+        with open(path, "w") as f:
+            json.dump({"commit": commit, "date": datetime.now(timezone.utc).isoformat(),
+                       "machine": machine(), "results": stored}, f, indent=2)
+        print(f"\nSaved {path}")
+
+    if args.compare:
+        ref_path = find_results(args.compare)
+        with open(ref_path) as f:
+            reference = json.load(f)
+        print(f"\nCompared with {reference['commit']} ({os.path.basename(ref_path)}):")
+        regressed = compare(results, reference["results"], args.threshold)
+        if regressed and args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""Benchmarks of the data pipeline and metric hot paths.
+
+Each benchmark is registered with @benchmark and receives its fixture (and
+grid parameters); it does any setup untimed and returns the zero-argument
+callable that the runner times. `sizes` picks the dataset sizes it runs at,
+`grid` the (models, perturbations) combinations; combinations whose
+correctness tensor exceeds MAX_GRID_CELLS are skipped.
+"""
+import asyncio
+import json
+import os
+import numpy as np
+from src.utils.dataset import load_mmlu, stratified_indices, stratified_sample
+from src.utils.perturb import inject_noise, inject_noise_batch, shuffle_choices, shuffle_choices_batch
+from src.metrics import (construct_validity, coverage, difficulty_discrimination,
+                         external_validity, power_ci, robustness, robustness_multi)
+from src.metrics.construct_validity import cohens_kappa, encode_labels, fleiss_kappa
+from src.metrics.irt import fit_irt
+from src.metrics.paired import paired_stats
+from src.export_table import create_html_table
+from src.evaluation.stub_server import start_stub_server
+from src.utils.backends import OpenAICompatibleBackend
+from src.utils.concurrency import map_bounded
+from benchmarks.synthetic import ROOT, Synthetic
+
+SIZES = {"1k": 1_000, "14k": 14_000, "1m": 1_000_000}
+GRID = [(1, 3), (8, 3), (32, 6)]        # (models, perturbations)
+MAX_GRID_CELLS = 50_000_000             # items × models × variants per grid point
+
+BENCHMARKS = {}
+
+
+def benchmark(name, sizes=tuple(SIZES), grid=None):
+    """Register `fn(fixture[, models, perts]) -> callable` as benchmark `name`.
+
+    sizes : dataset sizes to run at (keys of SIZES); None runs once, without a fixture
+    grid  : (models, perturbations) pairs to run at, passed as extra arguments
+    """
+    def decorator(fn):
+        BENCHMARKS[name] = {"name": name, "fn": fn, "sizes": sizes, "grid": grid}
+        return fn
+    return decorator
+
+
+# ---------------------------------------------------------------- data pipeline
+@benchmark("load_mmlu[csv]")
+def load_csv(data):
+    path = data.path(".csv")
+    return lambda: load_mmlu(path)
+
+
+@benchmark("load_mmlu[parquet]")
+def load_parquet(data):
+    path = data.path(".parquet")
+    return lambda: load_mmlu(path)
+
+
+@benchmark("stratified_sample")
+def sample(data):
+    df = data.df
+    return lambda: stratified_sample(df, frac=0.02)
+
+
+@benchmark("stratified_indices[x200]")
+def sample_many(data):
+    subjects = data.df["subject"]
+    return lambda: stratified_indices(subjects, frac=0.02, n_samples=200)
+
+
+@benchmark("inject_noise")
+def noise(data):
+    questions = data.df["question"].tolist()
+    return lambda: [inject_noise(q) for q in questions]
+
+
+@benchmark("inject_noise_batch")
+def noise_batch(data):
+    questions, ids = data.df["question"].tolist(), data.df["item_id"].tolist()
+    return lambda: inject_noise_batch(questions, ids)
+
+
+@benchmark("shuffle_choices")
+def shuffle(data):
+    rows = list(zip(data.df["choices"], data.df["answer"]))
+    return lambda: [shuffle_choices(c, a) for c, a in rows]
+
+
+@benchmark("shuffle_choices_batch")
+def shuffle_batch(data):
+    df = data.df
+    return lambda: shuffle_choices_batch(df["choices"].tolist(), df["answer"].to_numpy(),
+                                         df["item_id"].tolist())
+
+
+# ---------------------------------------------------------------- statistics
+@benchmark("bootstrap_ci")
+def bootstrap(data):
+    correct = data.vectors()[0]
+    return lambda: power_ci.bootstrap_ci(correct, n_boot=1000)
+
+
+@benchmark("cohens_kappa")
+def kappa(data):
+    rng = np.random.default_rng(1)
+    y1 = data.df["subject"].to_numpy()
+    y2 = np.where(rng.random(len(y1)) < 0.8, y1, rng.permutation(y1))
+    return lambda: cohens_kappa(y1, y2)
+
+
+@benchmark("fleiss_kappa[3 raters]")
+def fleiss(data):
+    rng = np.random.default_rng(2)
+    y = data.df["subject"].to_numpy()
+    raters = [np.where(rng.random(len(y)) < 0.8, y, rng.permutation(y)) for _ in range(3)]
+    codes, labels = encode_labels(*raters)
+    return lambda: fleiss_kappa(codes, len(labels))
+
+
+@benchmark("paired_stats", grid=GRID)
+def paired(data, models, perts):
+    C = data.correct(models, perts)[:, 0, :].T
+    return lambda: paired_stats(C[0], C[1:], n_boot=1000)
+
+
+@benchmark("fit_irt[2pl]", sizes=("1k", "14k"), grid=GRID)
+def irt(data, models, perts):
+    responses, _ = data.matrix(models, perts).responses()
+    return lambda: fit_irt(responses, model="2pl")
+
+
+# ---------------------------------------------------------------- metrics
+@benchmark("coverage.main")
+def coverage_main(data):
+    path = data.path(".parquet")
+    return lambda: coverage.main(path)
+
+
+@benchmark("external_validity.main")
+def external_validity_main(data):
+    correct, df = data.vectors()[0], data.df
+    return lambda: external_validity.main(correct, df)
+
+
+@benchmark("difficulty_discrimination.main", grid=GRID)
+def difficulty_main(data, models, perts):
+    matrix = data.matrix(models, perts)
+    return lambda: difficulty_discrimination.main(matrix=matrix, irt="off")
+
+
+@benchmark("robustness.main")
+def robustness_main(data):
+    orig, pert = data.vectors(1)
+    return lambda: robustness.main(orig, pert, n_boot=1000)
+
+
+@benchmark("robustness_multi.main", grid=GRID)
+def robustness_multi_main(data, models, perts):
+    matrix = data.matrix(models, perts)
+    return lambda: robustness_multi.main(matrix=matrix, n_boot=1000)
+
+
+@benchmark("power_ci.main")
+def power_main(data):
+    correct = data.vectors()[0]
+    return lambda: power_ci.main(correct, method="bootstrap", n_boot=1000)
+
+
+@benchmark("construct_validity.main[stub]", sizes=("1k", "14k"))
+def construct_validity_main(data):
+    server, base_url = start_stub_server()          # zero latency, cache off: batching + pool
+    path = data.path(".parquet")
+    constructs = os.path.join(ROOT, "config", "constructs.yml")
+
+    def run():
+        previous = os.environ.get("BCR_CACHE")
+        os.environ["BCR_CACHE"] = "off"
+        try:
+            construct_validity.main(constructs, path, base_url=base_url)
+        finally:
+            if previous is None:
+                os.environ.pop("BCR_CACHE")
+            else:
+                os.environ["BCR_CACHE"] = previous
+    return run
+
+
+@benchmark("backend.achat[stub,2000 requests]", sizes=None)
+def backend_roundtrips(workdir):
+    server, base_url = start_stub_server()          # zero latency: measures client overhead
+    backend = OpenAICompatibleBackend(base_url)
+    messages = [[{"role": "user", "content": f"Question {i}\n0) a\n1) b"}] for i in range(2000)]
+
+    async def one(m):
+        return await backend.achat("stub", m, max_tokens=4)
+    return lambda: asyncio.run(map_bounded(one, messages, concurrency=32))
+
+
+@benchmark("create_html_table", sizes=None)
+def html_table(workdir):
+    data = Synthetic(1_000, workdir)
+    vectors = data.vectors()
+    results = {
+        "construct_validity": {"kappa": 0.82, "score": 3},
+        "coverage": coverage.main(data.path(".parquet")),
+        "external_validity": external_validity.main(vectors[0], data.df),
+        "difficulty_discrimination": difficulty_discrimination.main(vectors),
+        "robustness": robustness.main(vectors[0], vectors[1], n_boot=200),
+        "power_ci": power_ci.main(vectors[0], method="wilson"),
+    }
+    out = os.path.join(workdir, "data", "metrics_results")
+    os.makedirs(out, exist_ok=True)
+    with open(os.path.join(out, "all_metrics_results.json"), "w") as f:
+        json.dump(results, f)
+
+    def run():
+        cwd = os.getcwd()
+        os.chdir(workdir)               # create_html_table reads and writes relative paths
+        try:
+            create_html_table()
+        finally:
+            os.chdir(cwd)
+    return run
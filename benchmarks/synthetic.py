@@ -0,0 +1,79 @@
+"""Synthetic MMLU-shaped datasets and correctness tensors for the benchmarks.
+
+Items are drawn over the real MMLU subjects (config/slices.json) with uneven
+subject sizes; correctness comes from a 2PL-style model of item difficulty,
+model ability and a per-perturbation accuracy drop, so metrics see realistic
+mixes of ceiling, floor and discriminating items.
+"""
+import json
+import os
+from functools import cached_property
+import numpy as np
+import pandas as pd
+from src.utils.dataset import add_item_ids, save_mmlu
+from src.utils.predictions import CorrectnessMatrix
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SLICES = os.path.join(ROOT, "config", "slices.json")
+
+
+def mmlu_subjects():
+    with open(SLICES, encoding="utf-8") as f:
+        return sorted({s for subs in json.load(f).values() for s in subs})
+
+
+class Synthetic:
+    """Lazily built fixture of `n` items; files are written under `workdir`."""
+
+    def __init__(self, n, workdir, seed=0):
+        self.n = n
+        self.workdir = workdir
+        self.seed = seed
+        self._correct = {}
+
+    @cached_property
+    def df(self):
+        rng = np.random.default_rng(self.seed)
+        subjects = np.array(mmlu_subjects())
+        weights = rng.dirichlet(np.full(len(subjects), 2.0))
+        subject = subjects[rng.choice(len(subjects), size=self.n, p=weights)]
+        df = pd.DataFrame({
+            "question": [f"Question {i} on {s.replace('_', ' ')}: which of the following "
+                         f"statements about case {i % 97} is correct?"
+                         for i, s in enumerate(subject)],
+            "subject": subject,
+            "choices": [[f"Option {k} for item {i}" for k in "ABCD"] for i in range(self.n)],
+            "answer": rng.integers(0, 4, size=self.n),
+        })
+        return add_item_ids(df)
+
+    def path(self, suffix):
+        """The dataset written once in the format given by `suffix` (.csv / .parquet / .arrow)."""
+        path = os.path.join(self.workdir, f"mmlu_{self.n}{suffix}")
+        if not os.path.exists(path):
+            save_mmlu(self.df, path)
+        return path
+
+    def correct(self, models=1, perts=3):
+        """(N, models, perts + 1) uint8 correctness; variant 0 is the original."""
+        key = (models, perts)
+        if key not in self._correct:
+            rng = np.random.default_rng([self.seed, models, perts])
+            b = rng.normal(-0.5, 1.5, size=self.n)
+            a = rng.lognormal(0.0, 0.4, size=self.n)
+            theta = rng.normal(0.0, 1.0, size=models)
+            drop = np.concatenate([[0.0], rng.uniform(0.05, 0.4, size=perts)])
+            z = a[:, None, None] * (theta[None, :, None] - drop[None, None, :] - b[:, None, None])
+            u = rng.random(z.shape, dtype=np.float32)
+            self._correct[key] = (u < 1 / (1 + np.exp(-z))).astype(np.uint8)
+        return self._correct[key]
+
+    def vectors(self, perts=3):
+        """Original + `perts` perturbed correctness vectors of one model."""
+        C = self.correct(1, perts)
+        return [C[:, 0, v] for v in range(perts + 1)]
+
+    def matrix(self, models, perts):
+        return CorrectnessMatrix(self.correct(models, perts), self.df["item_id"],
+                                 [f"model{m}" for m in range(models)],
+                                 ["original"] + [f"pert{p}" for p in range(perts)])
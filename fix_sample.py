@@ -1,14 +1,36 @@
+import argparse
+import numpy as np
 import pandas as pd
-from src.utils.dataset import load_mmlu, stratified_sample
+from src.utils.dataset import load_mmlu, save_mmlu, stratified_indices
+
+parser = argparse.ArgumentParser(description="Create a stratified sample of the dataset")
+parser.add_argument("--src", default="data/raw/mmlu_test.csv")
+parser.add_argument("--frac", type=float, default=0.02)
+parser.add_argument("--n", type=int, default=None, help="Exact sample size (overrides --frac)")
+parser.add_argument("--seed", type=int, default=42)
+parser.add_argument("--out", default=None,
+                    help="Output dataset (default: data/raw/mmlu_test_sampled_<frac>.csv, "
+                         "or ..._sampled_n<n>.csv with --n)")
+parser.add_argument("--n-samples", type=int, default=1,
+                    help="Independent samples to draw; all index sets go to --indices")
+parser.add_argument("--indices", default=None, help="Save the (n_samples, n) row positions as .npy")
+args = parser.parse_args()
 
 # Load original dataset
-df = load_mmlu('data/raw/mmlu_test.csv')
+df = load_mmlu(args.src)
 print(f'Original dataset size: {len(df)}')
 
-# Sample 2%
-sampled = stratified_sample(df, frac=0.02, seed=42)
+# Sample (exact largest-remainder allocation across subjects)
+idx = stratified_indices(df["subject"], n=args.n, frac=args.frac, seed=args.seed,
+                         n_samples=args.n_samples)
+sampled = df.iloc[idx[0]].reset_index(drop=True)
 print(f'Sampled dataset size: {len(sampled)}')
 
 # Save sampled dataset
-sampled.to_csv('data/raw/mmlu_test_sampled_0.02.csv', index=False)
-print('Saved sampled dataset') 
\ No newline at end of file
+size = f'n{args.n}' if args.n is not None else args.frac
+out = args.out or f'data/raw/mmlu_test_sampled_{size}.csv'
+save_mmlu(sampled, out)
+print(f'Saved sampled dataset to {out}')
+if args.indices:
+    np.save(args.indices, idx)
+    print(f'Saved {len(idx)} index sets to {args.indices}')
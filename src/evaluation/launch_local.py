@@ -0,0 +1,64 @@
+"""
+launch_local.py
+Run a sharded evaluation on one machine: start the stub backend, launch one
+run_llm_eval.py process per shard, then merge the shards.
+
+    python -m src.evaluation.launch_local --dataset data/raw/mmlu_test.csv --shards 4
+"""
+import argparse
+import os
+import subprocess
+import sys
+from src.evaluation.stub_server import add_behaviour_args, behaviour_from_args, start_stub_server
+from src.utils.dataset import load_mmlu
+from src.metrics.online import describe, merge_states, save_states, state_path
+from src.utils.predictions import merge_predictions, save_predictions
+
+
+def shard_path(out, i, n):
+    root, ext = os.path.splitext(out)
+    return f"{root}.shard{i}of{n}{ext}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sharded evaluation against a local stub backend")
+    parser.add_argument("--dataset", default="data/raw/mmlu_test_sampled_0.02.csv")
+    parser.add_argument("--out", default="data/predictions/stub_preds.csv")
+    parser.add_argument("--shards", type=int, default=4, help="Worker processes")
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight per shard")
+    parser.add_argument("--base-url", default=None,
+                        help="Use this endpoint instead of starting the stub")
+    add_behaviour_args(parser)
+    parser.set_defaults(latency=0.05)
+    args = parser.parse_args()
+
+    base_url = args.base_url
+    if base_url is None:
+        server, base_url = start_stub_server(latency=args.latency, **behaviour_from_args(args))
+        print(f"Stub backend at {base_url}")
+
+    paths = [shard_path(args.out, i, args.shards) for i in range(args.shards)]
+    procs = [subprocess.Popen([sys.executable, "-m", "src.evaluation.run_llm_eval",
+                               "--dataset", args.dataset, "--out", path,
+                               "--shard", f"{i}/{args.shards}", "--base-url", base_url,
+                               "--concurrency", str(args.concurrency), "--cache", "off"],
+                              stdout=subprocess.DEVNULL)
+             for i, path in enumerate(paths)]
+    failed = [i for i, p in enumerate(procs) if p.wait() != 0]
+    if args.base_url is None:
+        print("Stub stats:", server.RequestHandlerClass.stats)
+    if failed:
+        raise SystemExit(f"✗ shards {failed} failed")
+
+    merged = merge_predictions(paths, item_ids=load_mmlu(args.dataset)["item_id"])
+    save_predictions(merged, args.out)
+    print(f"✓ {args.shards} shards merged → {args.out}: {len(merged)} items, "
+          f"accuracy {merged['is_correct'].mean() * 100:.2f}%")
+    states = merge_states(paths)
+    if states is not None:
+        save_states(states, state_path(args.out))
+        print("Scores:", describe(states))
+
+
+if __name__ == "__main__":
+    main()
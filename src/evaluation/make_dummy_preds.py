@@ -2,7 +2,8 @@
 import numpy as np
 import pandas as pd
 import os
-from src.utils.dataset import load_mmlu         
+from src.utils.dataset import load_mmlu
+from src.utils.predictions import save_predictions
 
 # Create directories if they don't exist
 os.makedirs("data/raw", exist_ok=True)
@@ -16,9 +17,11 @@ rng = np.random.default_rng(seed=0)
 rand = [rng.integers(0, len(opts)) for opts in df["choices"]]
 
 df_out = pd.DataFrame({
-    "is_correct": pd.Series(rand == df["answer"]).astype(int)
+    "item_id": df["item_id"],
+    "choice": rand,
+    "is_correct": (np.array(rand) == df["answer"].to_numpy()).astype(int),
 })
 output_path = "data/predictions/dummy_preds_sampled.csv"
-df_out.to_csv(output_path, index=False)
+save_predictions(df_out, output_path)
 print(f"Saved dummy predictions to {output_path}")
 print("Dummy accuracy:", df_out['is_correct'].mean()*100, "%")
@@ -0,0 +1,41 @@
+"""Merge sharded prediction files (run_llm_eval.py --shard i/n) into one.
+
+    python -m src.evaluation.merge_shards data/predictions/gpt4_preds.csv \
+        data/predictions/shards/gpt4_preds.*.csv --dataset data/raw/mmlu_test.csv
+
+When every shard has its streaming-score sidecar (<shard>.scores.json, written
+by run_llm_eval.py), the states are merged too and saved next to the output.
+"""
+import argparse
+from src.utils.dataset import load_mmlu
+from src.metrics.online import describe, merge_states, save_states, state_path
+from src.utils.predictions import merge_predictions, save_predictions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge prediction shards into one file")
+    parser.add_argument("out", help="Merged prediction file (.csv, .parquet or .arrow)")
+    parser.add_argument("shards", nargs="+", help="Shard prediction files")
+    parser.add_argument("--dataset", default=None,
+                        help="Check coverage against this dataset and order records like it")
+    parser.add_argument("--allow-missing", action="store_true",
+                        help="Write the merge even if some dataset items have no record")
+    args = parser.parse_args()
+
+    item_ids = load_mmlu(args.dataset)["item_id"] if args.dataset else None
+    try:
+        merged = merge_predictions(args.shards, item_ids=item_ids,
+                                   allow_missing=args.allow_missing)
+    except ValueError as e:
+        raise SystemExit(f"✗ {e}")
+    save_predictions(merged, args.out)
+    print(f"✓ Merged {len(args.shards)} shards → {args.out}: {len(merged)} items, "
+          f"accuracy {merged['is_correct'].mean() * 100:.2f}%")
+    states = merge_states(args.shards)
+    if states is not None:
+        save_states(states, state_path(args.out))
+        print("Scores:", describe(states))
+
+
+if __name__ == "__main__":
+    main()
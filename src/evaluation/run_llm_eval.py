@@ -1,82 +1,246 @@
 """Run LLM evaluation on MMLU test set and save predictions."""
 import argparse
-import time
+import asyncio
 import os
+import time
 import numpy as np
 import pandas as pd
-import openai
 from tqdm import tqdm
 from dotenv import load_dotenv
-from src.utils.dataset import load_mmlu, stratified_sample
-import ast
+from src.utils.dataset import load_mmlu, parse_shard, shard_of
+from src.utils.concurrency import RateLimiter, map_bounded, retry_async
+from src.utils.cache import DEFAULT_PATH, CacheMiss, ResponseCache, acached_chat
+from src.utils.checkpoint import JsonlCheckpoint
+from src.utils.backends import TIMEOUT, BackendError, make_backend
+from src.utils.predictions import RECORD_COLUMNS, save_predictions
+from src.metrics.online import (AccuracyAccumulator, CoverageAccumulator,
+                                ExternalValidityAccumulator, describe, save_states,
+                                state_path)
 
 load_dotenv(override=True)
 
-parser = argparse.ArgumentParser()
-parser.add_argument("--dataset", default="data/raw/mmlu_test.csv")
-parser.add_argument("--out",     default="data/predictions/gpt4_preds.csv")
-
-# Create directories if they don't exist
-os.makedirs("data/raw", exist_ok=True)
-os.makedirs("data/predictions", exist_ok=True)
-
 # ------------------------------------------------------------------ config
 MODEL            = "gpt-4.1"           # Updated from gpt-4o-mini
 TEMPERATURE      = 0                 # deterministic
-MAX_RETRIES      = 3                 # simple exponential back-off
-SAMPLE_FRACTION  = 0.02 #0.7              # use full dataset
-SEED             = 42
+MAX_RETRIES      = 3                 # jittered exponential back-off (API and unparseable replies)
+MAX_TOKENS       = 4
+CONCURRENCY      = 16                # requests in flight
+FLUSH_EVERY      = 50                # checkpoint flush interval (items)
 # -------------------------------------------------------------------------
 
-# Debug prints for API key
-print("API Key from env:", os.environ.get("OPENAI_API_KEY", "Not found"))
-openai.api_key = os.environ["OPENAI_API_KEY"]
-print("OpenAI API Key set to:", openai.api_key)
 
-rng              = np.random.default_rng(SEED)
-args = parser.parse_args()
-df  = pd.read_csv(args.dataset)
-
-pred_correct: list[int] = []
-
-def query_llm(question: str, choices: list[str]) -> int | None:  # type: ignore
-    """Return the choice index the model believes is correct (0-based)."""
-    prompt = (
+def build_prompt(question: str, choices: list[str]) -> str:
+    """Format one multiple-choice item as a zero-shot prompt."""
+    return (
         "You are an expert test-solver. Choose the single best answer.\n\n"
         f"QUESTION:\n{question}\n\nOPTIONS:\n" +
         "\n".join(f"{i}) {opt}" for i, opt in enumerate(choices)) +
         "\n\nAnswer with the option *number* only (0-based)."
     )
-    for attempt in range(1, MAX_RETRIES + 1):
-        try:
-            resp = openai.chat.completions.create(
-                model=MODEL,
-                temperature=TEMPERATURE,
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=4,
-            )
-            content = resp.choices[0].message.content
-            if content is None:
-                return None
-            txt = content.strip()
-            # quick clean-up: grab first integer in response
-            choice_idx = int(next(filter(str.isdigit, txt)))
-            return choice_idx
-        except (openai.APIError, ValueError, StopIteration) as e:
-            if attempt == MAX_RETRIES:
-                print(" ✗ giving up:", e)
-                return None
-            sleep = 2 ** attempt
-            print(f"Retry {attempt}/{MAX_RETRIES} in {sleep}s … ({e})")
-            time.sleep(sleep)
-
-# ---------------- main loop ------------------------------------------------
-for row in tqdm(df.itertuples(), total=len(df), desc="LLM-eval"):
-    assert isinstance(row.question, str)
-    choices = ast.literal_eval(row.choices)  # Convert string representation of list to actual list
-    idx = query_llm(row.question, choices)
-    pred_correct.append(int(idx == row.answer) if idx is not None else 0)
-
-pd.DataFrame({"is_correct": pred_correct}).to_csv(args.out, index=False)
-acc = np.mean(pred_correct) * 100
-print(f"\nSaved {args.out}  —  accuracy {acc:.2f}% on {len(df)} items")
+
+
+def parse_choice(content: str) -> int:
+    """Grab the first digit in a model reply; raise ValueError if there is none."""
+    digit = next(filter(str.isdigit, content.strip()), None)
+    if digit is None:
+        raise ValueError(f"no option number in reply {content!r}")
+    return int(digit)
+
+
+async def query_llm(backend, question: str, choices: list[str], model=MODEL,
+                    limiter=None, cache=None, meta=None) -> int | None:
+    """Return the choice index the model believes is correct (0-based).
+
+    A `meta` dict, if given, receives latency (including retries), token usage,
+    whether the reply came from the cache, and the raw reply. A reply without
+    an option number scores None; a request that failed for good also returns
+    None but sets meta["error"], so callers can leave the item unscored.
+    """
+    prompt = build_prompt(question, choices)
+    meta = {} if meta is None else meta
+    start = time.perf_counter()
+
+    async def call():
+        content = await acached_chat(
+            backend, cache,
+            model=model,
+            temperature=TEMPERATURE,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=MAX_TOKENS,
+            limiter=limiter,
+            meta=meta,
+        )
+        meta["raw"] = content
+        return None if content is None else parse_choice(content)
+
+    try:      # the backend retries failed requests; this re-asks after an unparseable reply
+        return await retry_async(call, max_retries=MAX_RETRIES, retry_on=(ValueError,))
+    except ValueError as e:
+        print(" ✗ no answer:", e)
+        return None
+    except BackendError as e:
+        print(" ✗ giving up:", e)
+        meta["error"] = str(e)
+        return None
+    except CacheMiss:
+        meta["error"] = "not in the cache (replay)"
+        return None
+    finally:
+        meta["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+
+async def evaluate(df: pd.DataFrame, backend, model=MODEL, concurrency=CONCURRENCY,
+                   limiter=None, cache=None, on_record=None, tracker=None) -> list[dict]:
+    """Score every row of `df` concurrently; returns one record per row, in row order.
+
+    Rows whose request failed get None instead of a record and are neither
+    counted nor passed on, so a resumed run asks again.
+    `on_record(record)` is called as each item finishes (e.g. to checkpoint it).
+    `tracker` (an AccuracyAccumulator) shows running accuracy and its CI.
+    """
+    bar = tqdm(total=len(df), desc="LLM-eval")
+    tracker = AccuracyAccumulator() if tracker is None else tracker
+
+    async def score(row):
+        meta = {}
+        idx = await query_llm(backend, row.question, row.choices, model=model,
+                              limiter=limiter, cache=cache, meta=meta)
+        if "error" in meta:
+            return None
+        return {
+            "item_id": row.item_id,
+            "choice": idx,
+            "is_correct": int(idx == row.answer) if idx is not None else 0,
+            "latency_ms": meta.get("latency_ms"),
+            "prompt_tokens": meta.get("prompt_tokens"),
+            "completion_tokens": meta.get("completion_tokens"),
+            "cached": meta.get("cached"),
+            "raw": meta.get("raw"),
+        }
+
+    def done(i, record):
+        bar.update(1)
+        if record is None:
+            return
+        tracker.update(record["is_correct"])
+        r = tracker.result()
+        bar.set_postfix_str(f"acc {r['accuracy']:.1f}% [{r['ci_lower']:.1f}, {r['ci_upper']:.1f}]",
+                            refresh=False)
+        if on_record is not None:
+            on_record(record)
+
+    try:
+        return await map_bounded(score, df.itertuples(), concurrency=concurrency,
+                                 on_result=done)
+    finally:
+        bar.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset", default="data/raw/mmlu_test.csv")
+    parser.add_argument("--out",     default="data/predictions/gpt4_preds.csv",
+                        help="Prediction records; .parquet/.arrow for the columnar format")
+    parser.add_argument("--model",   default=MODEL)
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY,
+                        help="Maximum requests in flight")
+    parser.add_argument("--rpm", type=float, default=None, help="Requests-per-minute cap")
+    parser.add_argument("--tpm", type=float, default=None, help="Tokens-per-minute cap")
+    parser.add_argument("--backend", default=None,
+                        help="'openai', an OpenAI-compatible base URL or 'module:callable' "
+                             "for an in-process model (default: --base-url, else OpenAI)")
+    parser.add_argument("--timeout", type=float, default=TIMEOUT, help="Seconds per request")
+    parser.add_argument("--base-url", default=None,
+                        help="OpenAI-compatible endpoint, e.g. a local stub server "
+                             "(default: $BCR_BASE_URL, then $OPENAI_BASE_URL)")
+    parser.add_argument("--cache", choices=["on", "off", "replay"], default="on",
+                        help="Response cache mode; 'replay' never calls the API")
+    parser.add_argument("--cache-path", default=DEFAULT_PATH)
+    parser.add_argument("--cache-max-mb", type=float, default=None,
+                        help="Evict least-recently-used responses beyond this size")
+    parser.add_argument("--checkpoint", default=None,
+                        help="Per-item JSONL sidecar (default: <out>.ckpt.jsonl)")
+    parser.add_argument("--flush-every", type=int, default=FLUSH_EVERY,
+                        help="Flush the checkpoint every N completed items")
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip items already in the checkpoint instead of starting over")
+    parser.add_argument("--shard", default=None, metavar="I/N",
+                        help="Only evaluate shard I of N (items split by a stable hash of item_id)")
+    args = parser.parse_args()
+
+    # Create directories if they don't exist
+    os.makedirs("data/raw", exist_ok=True)
+    os.makedirs("data/predictions", exist_ok=True)
+
+    backend = make_backend(args.backend or args.base_url, max_retries=MAX_RETRIES,
+                           timeout=args.timeout, replay=(args.cache == "replay"))
+    limiter = RateLimiter(args.rpm, args.tpm) if (args.rpm or args.tpm) else None
+    cache = None
+    if args.cache != "off":
+        max_bytes = int(args.cache_max_mb * 2**20) if args.cache_max_mb else None
+        cache = ResponseCache(args.cache_path, max_bytes=max_bytes, replay=(args.cache == "replay"))
+
+    df = load_mmlu(args.dataset)
+    if args.shard:
+        i, n = parse_shard(args.shard)
+        df = df[shard_of(df["item_id"], n) == i]
+        print(f"Shard {i}/{n}: {len(df)} items")
+    ckpt = JsonlCheckpoint(args.checkpoint or args.out + ".ckpt.jsonl", flush_every=args.flush_every)
+    if args.resume:
+        done = ckpt.load()
+        print(f"Resuming: {len(done)} items already in {ckpt.path}")
+    else:
+        done = {}
+        ckpt.reset()
+
+    # identical items share an id, so each one is only paid for once
+    todo = df[~df["item_id"].isin(done)].drop_duplicates("item_id")
+    # streaming BCR scores, seeded from resumed records and saved next to the output
+    subject_of = dict(zip(df["item_id"], df["subject"]))
+    tracker = AccuracyAccumulator()
+    live = {"power_ci": tracker, "coverage": CoverageAccumulator(),
+            "external_validity": ExternalValidityAccumulator()}
+
+    def track(record):
+        subject = subject_of.get(record["item_id"])
+        if subject is None:
+            return
+        live["coverage"].update(subject)
+        live["external_validity"].update(subject, record["is_correct"])
+
+    def on_record(record):
+        ckpt.append(record)
+        track(record)
+
+    for r in done.values():
+        tracker.update(r["is_correct"])
+        track(r)
+    try:
+        results = asyncio.run(evaluate(todo, backend, model=args.model,
+                                       concurrency=args.concurrency, limiter=limiter,
+                                       cache=cache, on_record=on_record, tracker=tracker))
+    finally:
+        ckpt.flush()
+
+    # one record per item, in dataset order; items without a record are left out
+    records = ckpt.load()
+    rows = [records[i] for i in dict.fromkeys(df["item_id"]) if i in records]
+    save_predictions(pd.DataFrame(rows, columns=RECORD_COLUMNS), args.out)
+    save_states(live, state_path(args.out))
+    n_items = df["item_id"].nunique()            # duplicate rows share one record
+    if rows:
+        acc = np.mean([r["is_correct"] for r in rows]) * 100
+        print(f"\nSaved {args.out}  —  accuracy {acc:.2f}% on {len(rows)} of {n_items} items")
+    else:
+        print(f"\nSaved {args.out}  —  no item of {n_items} scored yet")
+    print("Scores:", describe(live))
+    print(f"Backend {backend}:", backend.stats)
+    if cache is not None:
+        print("Cache:", cache.stats())
+    failed = sum(r is None for r in results)
+    if failed:
+        raise SystemExit(f"{failed} items failed; rerun with --resume to retry them")
+
+
+if __name__ == "__main__":
+    main()
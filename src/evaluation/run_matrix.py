@@ -0,0 +1,240 @@
+"""Evaluate several models on several dataset variants and save one correctness tensor.
+
+All (model, variant, item) requests share one worker pool and rate budget;
+each provider can additionally be given its own limits and backend (an
+OpenAI-compatible server or an in-process callable). The result is an
+item × model × variant CorrectnessMatrix (.npz) that difficulty_discrimination
+and robustness_multi read directly.
+"""
+import argparse
+import asyncio
+import numpy as np
+from tqdm import tqdm
+from dotenv import load_dotenv
+from src.utils.dataset import load_mmlu
+from src.utils.concurrency import LimiterChain, RateLimiter, map_bounded
+from src.utils.cache import DEFAULT_PATH, ResponseCache
+from src.utils.checkpoint import JsonlCheckpoint
+from src.utils.backends import make_backend
+from src.utils.endpoint import resolve_api_key, resolve_base_url
+from src.utils.predictions import CorrectnessMatrix
+from src.evaluation.run_llm_eval import CONCURRENCY, FLUSH_EVERY, MODEL, query_llm
+from src.metrics.online import DifficultyAccumulator
+
+load_dotenv(override=True)
+
+DEFAULT_VARIANTS = {
+    "original":   "data/raw/mmlu_test_sampled_0.02.csv",
+    "paraphrase": "data/predictions/mmlu_paraphrase_sampled.csv",
+    "noise":      "data/perturbed/mmlu_noise.csv",
+    "shuffle":    "data/perturbed/mmlu_shuffle.csv",
+}
+DEFAULT_PROVIDER = "openai"
+
+
+def parse_model(spec: str, providers=()) -> tuple[str, str]:
+    """'provider:model' → (provider, model) for a known provider; else the OpenAI provider.
+
+    Only the first ':' separates, and only after a known provider, so model
+    names with colons survive: 'llama3:8b' is an OpenAI model name, while
+    'local:llama3:8b' is model 'llama3:8b' of provider 'local'.
+    """
+    provider, sep, model = spec.partition(":")
+    if sep and (provider in providers or provider == DEFAULT_PROVIDER):
+        return provider, model
+    return DEFAULT_PROVIDER, spec
+
+
+def parse_pairs(values, what):
+    """['name=value', ...] → {name: value}."""
+    out = {}
+    for v in values or []:
+        name, sep, value = v.partition("=")
+        if not sep:
+            raise SystemExit(f"--{what} expects NAME=VALUE, got {v!r}")
+        out[name] = value
+    return out
+
+
+def parse_limit(value: str) -> RateLimiter:
+    """'RPM[,TPM]' → RateLimiter (either part may be empty)."""
+    rpm, _, tpm = value.partition(",")
+    return RateLimiter(float(rpm) if rpm else None, float(tpm) if tpm else None)
+
+
+def provider_backend(provider: str, target=None, replay=False):
+    """Backend for a provider: an OpenAI-compatible base URL, 'module:callable' or OpenAI.
+
+    HTTP backends take their key from <PROVIDER>_API_KEY or BCR_API_KEY (OPENAI_API_KEY
+    only for the OpenAI API itself); the default provider follows $BCR_BASE_URL /
+    $OPENAI_BASE_URL when no target is given. With `replay` no key is needed.
+    """
+    if provider == DEFAULT_PROVIDER:
+        target = target or resolve_base_url()
+    api_key = None
+    if not replay and (target is None or "://" in target):
+        api_key = resolve_api_key(target, env=(f"{provider.upper()}_API_KEY", "BCR_API_KEY"))
+    return make_backend(target, api_key=api_key, replay=replay)
+
+
+def cell_key(model: str, variant: str, item_id: str) -> str:
+    return f"{model}|{variant}|{item_id}"
+
+
+def cell_item(key: str) -> str:
+    """The item id of a cell key."""
+    return key.split("|", 2)[2]
+
+
+async def evaluate_matrix(jobs, backends, limiters, concurrency=CONCURRENCY, cache=None,
+                          on_record=None, tracker=None):
+    """Score (model_spec, variant, row) jobs through one shared pool.
+
+    Cells whose request failed give None and are not passed to `on_record`,
+    so they stay missing and a resumed run asks again. `tracker` (a
+    DifficultyAccumulator over all model × variant cells of an item) shows
+    the running ceiling/floor share of completed items.
+    """
+    bar = tqdm(total=len(jobs), desc="LLM-matrix")
+
+    async def score(job):
+        spec, variant, row = job
+        provider, model = parse_model(spec, backends)
+        meta = {}
+        idx = await query_llm(backends[provider], row.question, row.choices, model=model,
+                              limiter=limiters[provider], cache=cache, meta=meta)
+        if "error" in meta:
+            return None
+        return {
+            "key": cell_key(spec, variant, row.item_id),
+            "choice": idx,
+            "is_correct": int(idx == row.answer) if idx is not None else 0,
+        }
+
+    def done(i, record):
+        bar.update(1)
+        if record is None:
+            return
+        if tracker is not None:
+            tracker.update(cell_item(record["key"]), record["is_correct"])
+            r = tracker.result()
+            if r["total_items"]:
+                bar.set_postfix_str(f"ceiling/floor {r['total_percentage']:.1f}% "
+                                    f"of {r['total_items']}", refresh=False)
+        if on_record is not None:
+            on_record(record)
+
+    try:
+        return await map_bounded(score, jobs, concurrency=concurrency, on_result=done)
+    finally:
+        bar.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--models", nargs="+", default=[MODEL],
+                        help="Model names, optionally 'provider:model'")
+    parser.add_argument("--variants", nargs="+", default=None,
+                        help="NAME=DATASET pairs; the first is the baseline "
+                             "(default: original, paraphrase, noise, shuffle)")
+    parser.add_argument("--provider", nargs="*", default=[],
+                        help="NAME=BASE_URL for OpenAI-compatible providers, or "
+                             "NAME=module:callable for in-process models")
+    parser.add_argument("--limit", nargs="*", default=[],
+                        help="PROVIDER=RPM[,TPM] per-provider rate limits")
+    parser.add_argument("--out", default="data/predictions/matrix.npz")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY,
+                        help="Requests in flight across all cells")
+    parser.add_argument("--rpm", type=float, default=None, help="Global requests-per-minute cap")
+    parser.add_argument("--tpm", type=float, default=None, help="Global tokens-per-minute cap")
+    parser.add_argument("--cache", choices=["on", "off", "replay"], default="on")
+    parser.add_argument("--cache-path", default=DEFAULT_PATH)
+    parser.add_argument("--checkpoint", default=None,
+                        help="Per-cell JSONL sidecar (default: <out>.ckpt.jsonl)")
+    parser.add_argument("--flush-every", type=int, default=FLUSH_EVERY)
+    parser.add_argument("--resume", action="store_true")
+    args = parser.parse_args()
+
+    variants = parse_pairs(args.variants, "variants") if args.variants else DEFAULT_VARIANTS
+    targets = parse_pairs(args.provider, "provider")
+    provider_limits = parse_pairs(args.limit, "limit")
+    providers = sorted({parse_model(m, targets)[0] for m in args.models})
+
+    backends = {p: provider_backend(p, targets.get(p), replay=(args.cache == "replay"))
+                for p in providers}
+    shared = RateLimiter(args.rpm, args.tpm) if (args.rpm or args.tpm) else None
+    limiters = {p: LimiterChain(shared, parse_limit(provider_limits[p])
+                                if p in provider_limits else None) for p in providers}
+    cache = None
+    if args.cache != "off":
+        cache = ResponseCache(args.cache_path, replay=(args.cache == "replay"))
+
+    frames = {name: load_mmlu(path) for name, path in variants.items()}
+    item_ids = list(next(iter(frames.values()))["item_id"])
+    for name, df in frames.items():
+        missing = set(item_ids) - set(df["item_id"])
+        if missing:
+            raise SystemExit(f"Variant '{name}' lacks {len(missing)} items of the baseline")
+
+    ckpt = JsonlCheckpoint(args.checkpoint or args.out + ".ckpt.jsonl",
+                           flush_every=args.flush_every, key="key")
+    if args.resume:
+        done = ckpt.load()
+        print(f"Resuming: {len(done)} cells already in {ckpt.path}")
+    else:
+        done = {}
+        ckpt.reset()
+
+    # item-major order keeps every provider busy from the start
+    rows = {name: list(df[df["item_id"].isin(item_ids)].drop_duplicates("item_id").itertuples())
+            for name, df in frames.items()}
+    jobs = [(m, name, rs[i])
+            for i in range(max(map(len, rows.values())))
+            for name, rs in rows.items() if i < len(rs)
+            for m in args.models
+            if cell_key(m, name, rs[i].item_id) not in done]
+    print(f"{len(args.models)} models × {len(variants)} variants × {len(item_ids)} items; "
+          f"{len(jobs)} requests to make")
+    wanted = {cell_key(m, v, i) for m in args.models for v in variants for i in item_ids}
+    tracker = DifficultyAccumulator(n_files=len(args.models) * len(variants))
+    for key, r in done.items():
+        if key in wanted:
+            tracker.update(cell_item(key), r["is_correct"])
+    try:
+        results = asyncio.run(evaluate_matrix(jobs, backends, limiters,
+                                              concurrency=args.concurrency, cache=cache,
+                                              on_record=ckpt.append, tracker=tracker))
+    finally:
+        ckpt.flush()
+
+    # failed cells have no record: stored as missing, never as wrong answers
+    records = ckpt.load()
+    cells = [[[records.get(cell_key(m, v, i)) for v in variants]
+              for m in args.models] for i in item_ids]
+    present = np.array([[[r is not None for r in vs] for vs in ms] for ms in cells], dtype=bool)
+    correct = np.array([[[r["is_correct"] if r is not None else 0 for r in vs] for vs in ms]
+                        for ms in cells], dtype=np.uint8)
+    matrix = CorrectnessMatrix(correct, item_ids, args.models, list(variants), present=present)
+    matrix.save(args.out)
+    print(f"\nSaved {args.out}: {matrix}")
+    with np.errstate(invalid="ignore", divide="ignore"):
+        acc = 100 * (correct * present).sum(axis=0) / present.sum(axis=0)     # (models, variants)
+    for m_idx, m in enumerate(args.models):
+        accs = "  ".join(f"{v} {acc[m_idx, v_idx]:5.1f}%" for v_idx, v in enumerate(variants))
+        print(f"  {m:24} {accs}")
+    r = tracker.result()
+    if r["total_items"]:
+        print(f"Ceiling/floor: {r['ceiling_items']} + {r['floor_items']} of {r['total_items']} "
+              f"complete items ({r['total_percentage']:.1f}%) → {r['score']}/3")
+    for p, backend in backends.items():
+        print(f"Backend {p} {backend}:", backend.stats)
+    if cache is not None:
+        print("Cache:", cache.stats())
+    failed = sum(r is None for r in results)
+    if failed:
+        raise SystemExit(f"{failed} cells failed and are stored as missing; "
+                         "rerun with --resume to retry them")
+
+
+if __name__ == "__main__":
+    main()
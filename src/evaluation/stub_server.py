@@ -0,0 +1,267 @@
+"""
+stub_server.py
+OpenAI-compatible chat-completions server for offline throughput and load tests.
+
+    python -m src.evaluation.stub_server --port 8080 --latency 0.2
+    python -m src.evaluation.stub_server --latency 0.3 --latency-dist lognormal --jitter 0.5 \\
+        --rate-429 0.05 --error-rate 0.01 --rpm 600
+    BCR_BASE_URL=http://localhost:8080/v1 python -m src.evaluation.run_llm_eval ...
+
+Replies are deterministic functions of the prompt and recognise the repo's
+request shapes: multiple-choice prompts get an option number, paraphrase
+prompts get the requested number of lines, and construct-tagging prompts get
+subject ids from the offered list (as JSON in JSON mode). Latency follows a
+fixed, uniform, exponential or lognormal distribution; a share of requests
+can be answered with 429 (with Retry-After) or 500, and --rpm enforces a
+server-side request budget. GET /stats reports request counters.
+"""
+import argparse
+import ast
+import json
+import math
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LATENCY_DISTS = ("fixed", "uniform", "exponential", "lognormal")
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256         # default of 5 drops connections under load
+
+
+def _h(*parts):
+    return zlib.crc32("\x1f".join(map(str, parts)).encode("utf-8"))
+
+
+def latency_sampler(latency=0.0, dist="fixed", jitter=0.0, seed=0):
+    """Return a thread-safe `() -> seconds` drawing from the named distribution.
+
+    fixed       : always `latency`
+    uniform     : latency ± jitter
+    exponential : mean `latency`
+    lognormal   : median `latency`, log-scale sigma `jitter`
+    """
+    if dist not in LATENCY_DISTS:
+        raise ValueError(f"latency distribution must be one of {LATENCY_DISTS}, got {dist!r}")
+    rng, lock = random.Random(seed), threading.Lock()
+
+    def draw():
+        with lock:
+            if dist == "uniform":
+                return max(0.0, rng.uniform(latency - jitter, latency + jitter))
+            if dist == "exponential":
+                return rng.expovariate(1 / latency) if latency > 0 else 0.0
+            if dist == "lognormal":
+                return latency * math.exp(rng.gauss(0.0, jitter))
+            return latency
+    return draw
+
+
+def _labels(prompt):
+    """The subject-id list of a construct-tagging prompt, or None."""
+    m = re.search(r"from this list(?: to each question)?: (\[.*?\])", prompt, re.S)
+    if m is None:
+        return None
+    try:
+        return list(ast.literal_eval(m.group(1)))
+    except (ValueError, SyntaxError):
+        return None
+
+
+def stub_reply(prompt, temperature=0.0, json_mode=False, label_noise=0.1):
+    """Deterministic reply text for one prompt.
+
+    Construct tags agree across temperatures except for a `label_noise`
+    share of (question, temperature) pairs, so kappas are high but not 1.
+    """
+    labels = _labels(prompt)
+    if labels:
+        def tag(q):
+            k = _h(q) % len(labels)
+            if _h(q, temperature) % 1000 < 1000 * label_noise:
+                k = _h(q, temperature, "alt") % len(labels)
+            return labels[k]
+        numbered = re.findall(r"^(\d+)\. (.*)$", prompt, re.M)
+        if json_mode or numbered:
+            return json.dumps({n: tag(q) for n, q in numbered})
+        return tag(prompt.rsplit("Q:", 1)[-1].strip())
+
+    m = re.search(r"Write (\d+) distinct paraphrases", prompt)
+    stem = prompt.rsplit("Q:", 1)[-1].strip()
+    if m:
+        return "\n".join(f"{i}. In other words ({i}): {stem}" for i in range(1, int(m.group(1)) + 1))
+    if prompt.startswith("Paraphrase"):
+        return f"In other words: {stem}"
+
+    n_options = len(re.findall(r"^\d+\) ", prompt, re.M)) or 4
+    return str(_h(prompt) % n_options)
+
+
+def make_handler(latency=0.0, latency_dist="fixed", jitter=0.0, rate_429=0.0, error_rate=0.0,
+                 rpm=None, retry_after=1.0, label_noise=0.1, seed=0):
+    """Build a request handler with the given latency distribution and failure rates."""
+    sample_latency = latency_sampler(latency, latency_dist, jitter, seed)
+    rng = random.Random(seed + 1)
+    lock = threading.Lock()
+    stats = {"requests": 0, "ok": 0, "rate_limited": 0, "errors": 0,
+             "in_flight": 0, "max_in_flight": 0}
+    bucket = {"tokens": rpm or 0.0, "stamp": time.monotonic()}
+
+    def admit():
+        """Outcome of one request: 'ok', '429' or '500'."""
+        with lock:
+            if rpm:
+                now = time.monotonic()
+                bucket["tokens"] = min(rpm, bucket["tokens"] + (now - bucket["stamp"]) * rpm / 60)
+                bucket["stamp"] = now
+                if bucket["tokens"] < 1:
+                    return "429"
+                bucket["tokens"] -= 1
+            u = rng.random()
+        if u < rate_429:
+            return "429"
+        if u < rate_429 + error_rate:
+            return "500"
+        return "ok"
+
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"         # keep-alive for pooled clients
+
+        def _send_json(self, status, obj, headers=()):
+            payload = json.dumps(obj).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for k, v in headers:
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/stats"):
+                with lock:
+                    self._send_json(200, dict(stats))
+            else:
+                self._send_json(404, {"error": {"message": "not found", "type": "invalid_request_error"}})
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send_json(404, {"error": {"message": "not found", "type": "invalid_request_error"}})
+                return
+            with lock:
+                stats["requests"] += 1
+                stats["in_flight"] += 1
+                stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+            try:
+                self._complete(body)
+            finally:
+                with lock:
+                    stats["in_flight"] -= 1
+
+        def _complete(self, body):
+            outcome = admit()
+            time.sleep(sample_latency())
+            if outcome == "429":
+                with lock:
+                    stats["rate_limited"] += 1
+                self._send_json(429, {"error": {"message": "Rate limit reached (stub)",
+                                                "type": "requests", "code": "rate_limit_exceeded"}},
+                                headers=[("Retry-After", f"{retry_after:g}")])
+                return
+            if outcome == "500":
+                with lock:
+                    stats["errors"] += 1
+                self._send_json(500, {"error": {"message": "Internal error (stub)",
+                                                "type": "server_error"}})
+                return
+
+            prompt = "".join(str(m.get("content", "")) for m in body.get("messages", []))
+            json_mode = (body.get("response_format") or {}).get("type") == "json_object"
+            answer = stub_reply(prompt, body.get("temperature", 0.0), json_mode, label_noise)
+            with lock:
+                stats["ok"] += 1
+            self._send_json(200, {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "stub"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": answer},
+                    "finish_reason": "stop",
+                }],
+                "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(answer) // 4 + 1,
+                          "total_tokens": len(prompt) // 4 + len(answer) // 4 + 1},
+            })
+
+        def log_message(self, *args):
+            pass
+
+    StubHandler.stats = stats
+    return StubHandler
+
+
+def start_stub_server(host="127.0.0.1", port=0, latency=0.0, **behaviour):
+    """Start the stub in a daemon thread; returns (server, base_url).
+
+    `behaviour` takes the keyword arguments of make_handler; the live request
+    counters are at `server.RequestHandlerClass.stats`.
+    """
+    server = StubServer((host, port), make_handler(latency, **behaviour))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+def add_behaviour_args(parser):
+    """Latency / failure flags shared by the stub and the scripts that launch it."""
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Seconds per request (mean / median, see --latency-dist)")
+    parser.add_argument("--latency-dist", choices=LATENCY_DISTS, default="fixed")
+    parser.add_argument("--jitter", type=float, default=0.0,
+                        help="Half-width (uniform) or log-scale sigma (lognormal) of the latency")
+    parser.add_argument("--rate-429", type=float, default=0.0,
+                        help="Share of requests answered 429 Too Many Requests")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="Share of requests answered 500")
+    parser.add_argument("--rpm", type=float, default=None,
+                        help="Server-side requests-per-minute budget; excess gets 429")
+    parser.add_argument("--retry-after", type=float, default=1.0,
+                        help="Retry-After seconds sent with 429s")
+    parser.add_argument("--label-noise", type=float, default=0.1,
+                        help="Share of construct tags that change with temperature")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def behaviour_from_args(args):
+    return {"latency_dist": args.latency_dist, "jitter": args.jitter, "rate_429": args.rate_429,
+            "error_rate": args.error_rate, "rpm": args.rpm, "retry_after": args.retry_after,
+            "label_noise": args.label_noise, "seed": args.seed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a stub chat-completions endpoint")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    add_behaviour_args(parser)
+    args = parser.parse_args()
+
+    handler = make_handler(args.latency, **behaviour_from_args(args))
+    server = StubServer((args.host, args.port), handler)
+    print(f"Stub completions at http://{args.host}:{args.port}/v1  "
+          f"(latency {args.latency}s {args.latency_dist}, 429 {args.rate_429:.0%}, "
+          f"500 {args.error_rate:.0%}, rpm {args.rpm or '∞'})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+        print("Stats:", json.dumps(handler.stats))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,65 +1,203 @@
 """
 make_paraphrase_set.py
-Generate a paraphrased version of every MMLU question using GPT-4.
+Generate paraphrased versions of every MMLU question using GPT-4.
 Saves mmlu_paraphrase_sampled.csv with the same columns as mmlu_test_sampled_0.02.csv.
+
+Identical stems are paraphrased once, requests run concurrently under optional
+rate limits, and each finished stem is appended to a JSONL checkpoint so an
+interrupted run can continue with --resume.
 """
+import argparse
+import asyncio
+import hashlib
 import os
-import time
-import openai
+import re
 from tqdm import tqdm
 from dotenv import load_dotenv
-from src.utils.dataset import load_mmlu
+from src.utils.dataset import load_mmlu, save_mmlu
+from src.utils.concurrency import RateLimiter, map_bounded, retry_async
+from src.utils.cache import CacheMiss, cache_from_env, acached_chat
+from src.utils.checkpoint import JsonlCheckpoint
+from src.utils.backends import TIMEOUT, BackendError, make_backend
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Create directories if they don't exist
-os.makedirs("data/raw", exist_ok=True)
-os.makedirs("data/predictions", exist_ok=True)
-
-openai.api_key = os.environ["OPENAI_API_KEY"]
-print(openai.api_key)
-if not openai.api_key:
-    raise ValueError("OPENAI_API_KEY not found in environment variables")
-
-SRC_PATH   = "data/raw/mmlu_test_sampled_0.02.csv"
-OUT_PATH   = "data/predictions/mmlu_paraphrase_sampled.csv"
-MODEL      = "gpt-4"
-TEMP       = 0.7       # higher → more diverse wording
-MAX_RETRY  = 3
-
-# Load sampled dataset
-df = load_mmlu(SRC_PATH)               # choices parsed into lists
-print(f"Loaded sampled dataset with {len(df)} questions")
-paraphrased = []
-
-def paraphrase(text: str) -> str:  # type: ignore
-    """Paraphrase a question while preserving its meaning using GPT-4."""
-    prompt = (
-        "Paraphrase the following multiple-choice question stem. "
-        "Keep meaning identical, don't add context, under 1 sentence longer.\n\n"
+SRC_PATH    = "data/raw/mmlu_test_sampled_0.02.csv"
+OUT_PATH    = "data/predictions/mmlu_paraphrase_sampled.csv"
+MODEL       = "gpt-4"
+TEMP        = 0.7       # higher → more diverse wording
+MAX_RETRY   = 3         # API failures and short replies
+MAX_TOKENS  = 100       # per paraphrase
+CONCURRENCY = 16        # requests in flight
+FLUSH_EVERY = 50        # checkpoint flush interval (stems)
+
+
+def stem_id(text: str) -> str:
+    """Stable id of a question stem; identical stems share one paraphrase request."""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def build_prompt(text: str, n: int = 1) -> str:
+    if n == 1:
+        return (
+            "Paraphrase the following multiple-choice question stem. "
+            "Keep meaning identical, don't add context, under 1 sentence longer.\n\n"
+            f"Q: {text}"
+        )
+    return (
+        f"Write {n} distinct paraphrases of the following multiple-choice question stem. "
+        "Keep meaning identical, don't add context, each under 1 sentence longer. "
+        f"Return exactly {n} lines numbered 1. to {n}. and nothing else.\n\n"
         f"Q: {text}"
     )
-    for k in range(1, MAX_RETRY+1):
+
+
+def parse_paraphrases(content: str, n: int = 1) -> list[str]:
+    """Split a reply into `n` paraphrases; raise ValueError if it is short."""
+    if content is None:
+        raise ValueError("Empty response from API")
+    if n == 1:
+        return [content.strip()]
+    lines = [re.sub(r"^\s*\d+[.)]\s*", "", l).strip() for l in content.splitlines()]
+    lines = [l for l in lines if l]
+    if len(lines) < n:
+        raise ValueError(f"expected {n} paraphrases, got {len(lines)}")
+    return lines[:n]
+
+
+async def paraphrase(backend, text: str, n: int = 1, model=MODEL, temperature=TEMP,
+                     limiter=None, cache=None, sample=None) -> list[str]:
+    """Return `n` paraphrases of a question stem from a single request.
+
+    Sampled paraphrases are cached only under a `sample` index, so a rerun
+    without one draws fresh wordings.
+    """
+    async def call():
+        content = await acached_chat(
+            backend, cache,
+            model=model,
+            temperature=temperature,
+            messages=[{"role": "user", "content": build_prompt(text, n)}],
+            max_tokens=MAX_TOKENS * n,
+            limiter=limiter,
+            sample=sample,
+            validate=lambda c: parse_paraphrases(c, n),
+        )
+        return parse_paraphrases(content, n)
+
+    # the backend retries failed requests; this re-asks after a short reply
+    return await retry_async(call, max_retries=MAX_RETRY, retry_on=(ValueError,))
+
+
+async def generate(stems: dict, backend, n=1, model=MODEL, temperature=TEMP,
+                   concurrency=CONCURRENCY, limiter=None, cache=None, sample=None,
+                   on_record=None):
+    """Paraphrase every {stem_id: text} concurrently; `on_record` sees each result."""
+    bar = tqdm(total=len(stems), desc="Paraphrasing")
+    failed = []
+
+    async def one(item):
+        sid, text = item
         try:
-            r = openai.chat.completions.create(
-                    model=MODEL,
-                    temperature=TEMP,
-                    messages=[{"role":"user","content":prompt}],
-                    max_tokens=100)
-            content = r.choices[0].message.content
-            if content is None:
-                raise ValueError("Empty response from API")
-            return content.strip()
-        except (openai.APIError, ValueError, StopIteration):
-            if k == MAX_RETRY:
-                raise
-            time.sleep(2**k)
-
-for q in tqdm(df["question"], desc="Paraphrasing"):
-    paraphrased.append(paraphrase(q))
-
-df_out = df.copy()
-df_out["question"] = paraphrased
-df_out.to_csv(OUT_PATH, index=False)
-print(f"✓ Saved paraphrased version to {OUT_PATH}")
+            paras = await paraphrase(backend, text, n=n, model=model, temperature=temperature,
+                                     limiter=limiter, cache=cache, sample=sample)
+        except (BackendError, ValueError, CacheMiss) as e:
+            print(" ✗ giving up:", e)
+            failed.append(sid)
+            return None
+        return {"stem_id": sid, "paraphrases": paras}
+
+    def done(i, record):
+        bar.update(1)
+        if record is not None and on_record is not None:
+            on_record(record)
+
+    try:
+        await map_bounded(one, stems.items(), concurrency=concurrency, on_result=done)
+    finally:
+        bar.close()
+    return failed
+
+
+def variant_path(path: str, k: int) -> str:
+    """Output file for paraphrase k (k > 0 gets a `_p<k>` suffix)."""
+    root, ext = os.path.splitext(path)
+    return path if k == 0 else f"{root}_p{k}{ext}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate paraphrased dataset variants")
+    parser.add_argument("--src", default=SRC_PATH)
+    parser.add_argument("--out", default=OUT_PATH,
+                        help="Paraphrase 0; paraphrase k>0 goes to <out>_p<k>")
+    parser.add_argument("--model", default=MODEL)
+    parser.add_argument("--temperature", type=float, default=TEMP)
+    parser.add_argument("--n-paraphrases", type=int, default=1,
+                        help="Paraphrases per stem, generated in one request")
+    parser.add_argument("--sample", type=int, default=None,
+                        help="Cache paraphrases under this sample index: reruns with the same "
+                             "index replay them, a new index draws fresh ones "
+                             "(default: sampled paraphrases are not cached)")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    parser.add_argument("--rpm", type=float, default=None, help="Requests-per-minute cap")
+    parser.add_argument("--tpm", type=float, default=None, help="Tokens-per-minute cap")
+    parser.add_argument("--backend", default=None,
+                        help="'openai', an OpenAI-compatible base URL or 'module:callable' "
+                             "(default: --base-url, else OpenAI)")
+    parser.add_argument("--timeout", type=float, default=TIMEOUT, help="Seconds per request")
+    parser.add_argument("--base-url", default=None,
+                        help="OpenAI-compatible endpoint, e.g. a local stub server "
+                             "(default: $BCR_BASE_URL, then $OPENAI_BASE_URL)")
+    parser.add_argument("--checkpoint", default=None,
+                        help="Per-stem JSONL sidecar (default: <out>.ckpt.jsonl)")
+    parser.add_argument("--flush-every", type=int, default=FLUSH_EVERY)
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip stems already in the checkpoint instead of starting over")
+    args = parser.parse_args()
+
+    cache = cache_from_env()            # BCR_CACHE=on|off|replay
+    backend = make_backend(args.backend or args.base_url, max_retries=MAX_RETRY,
+                           timeout=args.timeout, replay=cache is not None and cache.replay)
+    limiter = RateLimiter(args.rpm, args.tpm) if (args.rpm or args.tpm) else None
+
+    df = load_mmlu(args.src)               # choices parsed into lists
+    print(f"Loaded sampled dataset with {len(df)} questions")
+    ids = [stem_id(q) for q in df["question"]]
+    stems = dict(zip(ids, df["question"]))
+    print(f"{len(stems)} unique stems")
+
+    ckpt = JsonlCheckpoint(args.checkpoint or args.out + ".ckpt.jsonl",
+                           flush_every=args.flush_every, key="stem_id")
+    if args.resume:
+        done = {sid: r for sid, r in ckpt.load().items()
+                if len(r["paraphrases"]) >= args.n_paraphrases}
+        print(f"Resuming: {len(done)} stems already in {ckpt.path}")
+    else:
+        done = {}
+        ckpt.reset()
+
+    todo = {sid: text for sid, text in stems.items() if sid not in done}
+    try:
+        failed = asyncio.run(generate(todo, backend, n=args.n_paraphrases, model=args.model,
+                                      temperature=args.temperature, concurrency=args.concurrency,
+                                      limiter=limiter, cache=cache, sample=args.sample,
+                                      on_record=ckpt.append))
+    finally:
+        ckpt.flush()
+    print(f"Backend {backend}:", backend.stats)
+    if cache is not None:
+        print("Cache:", cache.stats())
+    if failed:
+        raise SystemExit(f"{len(failed)} stems failed; rerun with --resume to retry them")
+
+    records = ckpt.load()
+    for k in range(args.n_paraphrases):
+        df_out = df.copy()
+        df_out["question"] = [records[sid]["paraphrases"][k] for sid in ids]
+        save_mmlu(df_out, variant_path(args.out, k))
+        print(f"✓ Saved paraphrased version to {variant_path(args.out, k)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,38 +1,46 @@
-import pandas as pd
-import random
+import argparse
 import os
-from src.utils.dataset import load_mmlu
-from src.utils.perturb import inject_noise, shuffle_choices
+from src.utils.dataset import load_mmlu, save_mmlu, choices_column
+from src.utils.perturb import inject_noise_batch, shuffle_choices_batch
+
+parser = argparse.ArgumentParser(description="Generate surface-noise and distractor-shuffle variants")
+parser.add_argument("--src", default="data/raw/mmlu_test_sampled_0.02.csv")
+parser.add_argument("--seed", type=int, default=42)
+parser.add_argument("--replicates", type=int, default=1,
+                    help="independent shuffles per item; replicate r>0 goes to mmlu_shuffle_r<r>")
+parser.add_argument("--format", choices=["csv", "parquet", "arrow"], default="csv")
+parser.add_argument("--n-jobs", type=int, default=1,
+                    help="worker processes for the noise engine (useful for 1M+ items)")
+args = parser.parse_args()
 
 # Create directories if they don't exist
 os.makedirs("data/raw", exist_ok=True)
 os.makedirs("data/perturbed", exist_ok=True)
 
-random.seed(42)
-
 # Load sampled dataset
-src = load_mmlu("data/raw/mmlu_test_sampled_0.02.csv")
+src = load_mmlu(args.src)
 print(f"Loaded sampled dataset with {len(src)} questions")
 
 # 2-A  Surface-noise version ----------------------------------------
 noise = src.copy()
-noise["question"] = noise["question"].apply(inject_noise)
-noise_path = "data/perturbed/mmlu_noise.csv"
-noise.to_csv(noise_path, index=False)
+noise["question"] = inject_noise_batch(noise["question"], noise["item_id"],
+                                       seed=args.seed, n_jobs=args.n_jobs)
+noise_path = f"data/perturbed/mmlu_noise.{args.format}"
+save_mmlu(noise, noise_path)
 
 # 2-B  Distractor-shuffle version -----------------------------------
-shuf_rows = []
-for _, row in src.iterrows():
-    new_choices, new_ans = shuffle_choices(row["choices"], row["answer"])
-    shuf_rows.append({
-        "question": row["question"],
-        "subject" : row["subject"],
-        "choices" : new_choices,
-        "answer"  : new_ans,
-    })
-shuffle_path = "data/perturbed/mmlu_shuffle.csv"
-pd.DataFrame(shuf_rows).to_csv(shuffle_path, index=False)
+# all K×N permutations in one pass; each replicate is written as its own set
+choices, answers = shuffle_choices_batch(src["choices"], src["answer"], src["item_id"],
+                                         seed=args.seed, replicates=args.replicates)
+shuffle_paths = []
+for r in range(args.replicates):
+    shuf = src[["question", "subject", "item_id"]].copy()
+    shuf["choices"] = choices_column(choices[r], index=shuf.index)
+    shuf["answer"]  = answers[r]
+    suffix = "" if r == 0 else f"_r{r}"
+    shuffle_paths.append(f"data/perturbed/mmlu_shuffle{suffix}.{args.format}")
+    save_mmlu(shuf[["question", "subject", "choices", "answer", "item_id"]], shuffle_paths[-1])
 
 print(f"✓ Generated perturbed versions of sampled dataset:")
 print(f"  - Noise version: {noise_path}")
-print(f"  - Shuffle version: {shuffle_path}")
+print(f"  - Shuffle version: {', '.join(shuffle_paths)}")
@@ -1,53 +1,149 @@
 # construct_validity.py  (minimal)
+from concurrent.futures import ThreadPoolExecutor
 from itertools import combinations
 import time
-import os
 import json
-import openai
 import numpy as np
 import dotenv
 from src.utils.dataset import load_mmlu
+from src.utils.cache import CacheMiss, cache_from_env, cached_chat
+from src.utils.backends import BackendError, make_backend
+from src.metrics.registry import register_metric
 
 dotenv.load_dotenv()
 
-def main(constructs_path="config/constructs.yml", data_path="data/raw/mmlu_test_sampled_0.02.csv"):
+TAG_MODEL   = "gpt-4o-mini"
+BATCH_SIZE  = 20        # questions per tagging request
+MAX_WORKERS = 8         # concurrent tagging requests
+
+
+def encode_labels(*raters):
+    """Integer-code several label sequences against one shared label set.
+
+    Returns (codes, labels) where codes has shape (R, N).
+    """
+    labels, inv = np.unique(np.concatenate([np.asarray(r, dtype=str) for r in raters]),
+                            return_inverse=True)
+    return inv.reshape(len(raters), -1), labels
+
+
+def cohens_kappa(y1, y2):
+    """Calculate Cohen's Kappa between two raters."""
+    codes, labels = encode_labels(y1, y2)
+    return cohens_kappa_codes(codes[0], codes[1], len(labels))
+
+
+def cohens_kappa_codes(a, b, n):
+    """Cohen's Kappa for two integer-coded label vectors with `n` labels."""
+    conf_mat = np.bincount(a * n + b, minlength=n * n).reshape(n, n)
+
+    total = conf_mat.sum()
+    po = np.trace(conf_mat) / total
+    pe = np.dot(conf_mat.sum(axis=0), conf_mat.sum(axis=1)) / total ** 2
+    return (po - pe) / (1 - pe) if pe != 1 else 0
+
+
+def fleiss_kappa(codes, n_labels):
+    """Fleiss' Kappa for an (R raters, N items) matrix of integer-coded labels."""
+    R, N = codes.shape
+    items = np.broadcast_to(np.arange(N), codes.shape)
+    counts = np.bincount((items * n_labels + codes).ravel(),
+                         minlength=N * n_labels).reshape(N, n_labels)   # n_ij
+
+    p_i = (np.sum(counts * counts, axis=1) - R) / (R * (R - 1))
+    p_j = counts.sum(axis=0) / (N * R)
+    po, pe = p_i.mean(), np.dot(p_j, p_j)
+    return (po - pe) / (1 - pe) if pe != 1 else 0
+
+
+@register_metric(
+    'construct_validity',
+    description='Construct Validity',
+    inputs=['constructs_path', 'data_path', 'batch_size', 'max_workers', 'base_url'],
+    outputs=['kappa', 'fleiss_kappa', 'score', 'temperatures', 'kappas', 'untagged'],
+    levels={
+        3: 'Excellent construct validity (κ ≥ 0.8)',
+        2: 'Good construct validity (0.6 ≤ κ < 0.8)',
+        1: 'Fair construct validity (0.4 ≤ κ < 0.6)',
+        0: 'Poor construct validity (κ < 0.4)'
+    },
+    metadata=lambda r: f"κ = {r['kappa']:.3f}",
+    kind='io',
+    timeout=3600,
+)
+def main(constructs_path="config/constructs.yml", data_path="data/raw/mmlu_test_sampled_0.02.csv",
+         batch_size=BATCH_SIZE, max_workers=MAX_WORKERS, base_url=None):
     print("Loading constructs and dataset...")
     constructs = json.load(open(constructs_path, encoding="utf-8"))
-    df = load_mmlu(data_path)
+    df = load_mmlu(data_path, columns=["question"])
     print(f"Loaded {len(df)} questions")
-
-    def cohens_kappa(y1, y2):
-        """Calculate Cohen's Kappa between two raters."""
-        labels = sorted(set(y1) | set(y2))
-        n = len(labels)
-        conf_mat = np.zeros((n, n))
-        for a, b in zip(y1, y2):
-            i, j = labels.index(a), labels.index(b)
-            conf_mat[i, j] += 1
-        
-        po = np.sum(np.diag(conf_mat)) / np.sum(conf_mat)
-        pe = np.sum(np.sum(conf_mat, axis=0) * np.sum(conf_mat, axis=1)) / (np.sum(conf_mat) ** 2)
-        return (po - pe) / (1 - pe) if pe != 1 else 0
+    cache = cache_from_env()            # BCR_CACHE=on|off|replay
+    backend = make_backend(base_url, replay=cache is not None and cache.replay)  # or $BCR_BASE_URL
 
     def llm_tag(q, temp):
-        """Assign ONE subject id from this list: {list(constructs)}."""
+        """Assign ONE subject id from this list: {list(constructs)}; None if the request fails."""
         prompt = f"""Assign ONE subject id from this list: {list(constructs)}.
         Only return the id.\nQ: {q}"""
-        r = openai.chat.completions.create(
-            model="gpt-4o-mini", temperature=temp,
-            messages=[{"role":"user","content":prompt}],
-            max_tokens=5)
-        return r.choices[0].message.content.strip()
+        try:
+            content = cached_chat(
+                backend, cache,
+                model=TAG_MODEL, temperature=temp,
+                messages=[{"role":"user","content":prompt}],
+                max_tokens=5, sample=0)     # one cached tagging per temperature
+        except (BackendError, CacheMiss):
+            return None
+        return content.strip() if isinstance(content, str) else None
+
+    def llm_tag_batch(questions, temp):
+        """Tag a batch of questions in one JSON-mode request; single-question fallback."""
+        numbered = "\n".join(f"{i}. {q}" for i, q in enumerate(questions, 1))
+        prompt = (f"Assign ONE subject id from this list to each question: {list(constructs)}.\n"
+                  'Return a JSON object mapping each question number to its id, e.g. {"1": "anatomy"}.\n\n'
+                  f"{numbered}")
+        try:
+            content = cached_chat(
+                backend, cache,
+                model=TAG_MODEL, temperature=temp,
+                messages=[{"role":"user","content":prompt}],
+                max_tokens=16 * len(questions) + 16, sample=0,
+                response_format={"type": "json_object"})
+            parsed = json.loads(content)
+        except (BackendError, CacheMiss, json.JSONDecodeError, TypeError):
+            parsed = {}
+        if not isinstance(parsed, dict):
+            parsed = {}
+        tags = [parsed.get(str(i)) for i in range(1, len(questions) + 1)]
+        return [t.strip() if isinstance(t, str) else llm_tag(q, temp)
+                for t, q in zip(tags, questions)]
 
     print("Starting LLM tagging with 3 temperatures... start time:", start_time := time.time())
     temps = [0.2,0.4,0.6]               # 3 "raters"
-    tags  = {t: df["question"].apply(lambda q, temp=t: llm_tag(q,temp)) for t in temps}
+    questions = df["question"].tolist()
+    batches = [questions[i:i + batch_size] for i in range(0, len(questions), batch_size)]
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {t: [pool.submit(llm_tag_batch, b, t) for b in batches] for t in temps}
+        tags = {t: [tag for f in fs for tag in f.result()] for t, fs in futures.items()}
     print("Finished LLM tagging... elapsed time:", time.time()- start_time)
+    print(f"Backend {backend}:", backend.stats)
+    if cache is not None:
+        print("Cache:", cache.stats())
 
-    print("Calculating Cohen's Kappa between raters...")
+    # questions some rater could not tag are left out, like unscored items elsewhere
+    tagged = [all(tags[t][i] is not None for t in temps) for i in range(len(questions))]
+    missing = tagged.count(False)
+    if missing:
+        print(f"{missing} of {len(questions)} questions could not be tagged and are left out")
+    if missing == len(questions):
+        raise RuntimeError("no question was tagged by every rater")
+
+    print("Calculating Cohen's and Fleiss' Kappa between raters...")
+    codes, labels = encode_labels(*([tag for tag, ok in zip(tags[t], tagged) if ok]
+                                    for t in temps))
     # pair-wise κ then average
-    kappas = [cohens_kappa(tags[a], tags[b]) for a,b in combinations(temps,2)]
+    kappas = [cohens_kappa_codes(codes[a], codes[b], len(labels))
+              for a,b in combinations(range(len(temps)),2)]
     kappa  = np.mean(kappas)
+    fleiss = fleiss_kappa(codes, len(labels))
 
     def rubric(k):
         """Convert Cohen's Kappa to BCR Construct Validity score (0-3)."""
@@ -60,13 +156,15 @@ def main(constructs_path="config/constructs.yml", data_path="data/raw/mmlu_test_
         return 0
 
     score = rubric(kappa)
-    print(f"Cohen κ = {kappa:.3f} → BCR Construct Validity {score} / 3")
-    
+    print(f"Cohen κ = {kappa:.3f}  (Fleiss κ = {fleiss:.3f}) → BCR Construct Validity {score} / 3")
+
     return {
         "kappa": float(kappa),
+        "fleiss_kappa": float(fleiss),
         "score": int(score),
         "temperatures": temps,
-        "kappas": [float(k) for k in kappas]
+        "kappas": [float(k) for k in kappas],
+        "untagged": missing
     }
 
 if __name__ == "__main__":
@@ -4,11 +4,34 @@ import math
 import pandas as pd
 import json
 from src.utils.dataset import load_mmlu     # the same helper that parses choices
+from src.metrics.registry import register_metric
+from src.metrics.slices import SLICES_PATH, breakdown as slice_breakdown
 
-def main(data_path="data/raw/mmlu_test.csv", max_rows=None):
-    thresholds = [(0.90, 3), (0.75, 2), (0.50, 1)]
+THRESHOLDS = [(0.90, 3), (0.75, 2), (0.50, 1)]   # H/Hmax ⇒ rubric
 
-    df = load_mmlu(data_path)
+def rubric(x):
+    """Convert normalized entropy to BCR Coverage score (0-3)."""
+    for thr, s in THRESHOLDS:
+        if x >= thr:
+            return s
+    return 0
+
+@register_metric(
+    'coverage',
+    description='Coverage',
+    inputs=['data_path', 'max_rows', 'breakdown', 'slices'],
+    outputs=['unique_constructs', 'entropy', 'max_entropy', 'normalized_score', 'score'],
+    levels={
+        3: 'Excellent coverage (H/Hmax ≥ 0.90)',
+        2: 'Good coverage (0.75 ≤ H/Hmax < 0.90)',
+        1: 'Fair coverage (0.50 ≤ H/Hmax < 0.75)',
+        0: 'Poor coverage (H/Hmax < 0.50)'
+    },
+    metadata=lambda r: f"H/Hmax = {r['normalized_score']:.3f}",
+)
+def main(data_path="data/raw/mmlu_test.csv", max_rows=None, breakdown=False, slices=SLICES_PATH):
+    """With `breakdown`, also reports subject shares and each slice's subject entropy."""
+    df = load_mmlu(data_path, columns=["subject"])
     if max_rows:
         df = df[0:max_rows]
     counts = Counter(df["subject"])
@@ -23,25 +46,21 @@ def main(data_path="data/raw/mmlu_test.csv", max_rows=None):
     h_max = math.log2(k)
     score_norm = h / h_max
 
-    def rubric(x):
-        """Convert normalized entropy to BCR Coverage score (0-3)."""
-        for thr, s in thresholds:
-            if x >= thr:
-                return s
-        return 0
-
     score = rubric(score_norm)
     print(f"Unique constructs : {k}")
     print(f"H / H_max         : {score_norm:.3f}")
     print(f"BCR Coverage      : {score} / 3")
     
-    return {
+    result = {
         "unique_constructs": int(k),
         "entropy": float(h),
         "max_entropy": float(h_max),
         "normalized_score": float(score_norm),
         "score": int(score)
     }
+    if breakdown:
+        result["breakdown"] = slice_breakdown(df["subject"], slices=slices)
+    return result
 
 if __name__ == "__main__":
     result = main()
@@ -1,14 +1,73 @@
 """
 difficulty_discrimination.py
 Compute % ceiling / floor items using 4 correctness vectors and map
-to BCR Difficulty & Discrimination score.
+to BCR Difficulty & Discrimination score. With enough respondents (e.g. a
+many-model CorrectnessMatrix) an IRT fit supplies item difficulty and
+discrimination parameters and a richer score.
 """
 
+import os
 import pandas as pd
 import numpy as np
 import json
+from src.utils.predictions import as_correct, as_matrix
+from src.metrics.registry import register_metric
+from src.metrics.slices import SLICES_PATH, breakdown as slice_breakdown, subjects_for
+from src.metrics import irt as irt_fit
 
-def main(files=None):
+IRT_MIN_RESPONDENTS = 8      # irt="auto" fits a 2PL model from this many vectors on
+
+def rubric(p):
+    """Convert percentage of ceiling/floor items to BCR Difficulty & Discrimination score (0-3)."""
+    if p < 5:
+        return 3
+    if p < 10:
+        return 2
+    if p < 20:
+        return 1
+    return 0
+
+def _metadata(r):
+    text = f"{r['ceiling_percentage']:.1f}% ceiling, {r['floor_percentage']:.1f}% floor"
+    if "irt" in r:
+        text += f", {r['irt']['out_of_range_percentage']:.1f}% beyond θ"
+        if "low_discrimination_percentage" in r["irt"]:
+            text += f", {r['irt']['low_discrimination_percentage']:.1f}% low-a"
+    return text
+
+@register_metric(
+    'difficulty_discrimination',
+    description='Difficulty & Discrimination',
+    inputs=['files', 'matrix', 'data_path', 'breakdown', 'slices', 'irt'],
+    outputs=['total_items', 'ceiling_items', 'floor_items', 'ceiling_percentage',
+             'floor_percentage', 'total_percentage', 'score'],
+    levels={
+        3: 'Excellent difficulty range (< 5% ceiling/floor)',
+        2: 'Good difficulty range (5-10% ceiling/floor)',
+        1: 'Fair difficulty range (10-20% ceiling/floor)',
+        0: 'Poor difficulty range (> 20% ceiling/floor)'
+    },
+    metadata=_metadata,
+)
+def main(files=None, matrix=None, data_path=None, breakdown=False, slices=SLICES_PATH,
+         irt="auto"):
+    """`files` are prediction files or already-loaded correctness vectors.
+
+    `matrix` (a CorrectnessMatrix or its .npz path) replaces `files`: every
+    model × variant column counts as one vector, and cells the matrix marks
+    missing are left out. With `breakdown` (and the dataset in `data_path`),
+    ceiling/floor rates are also reported per subject and per slice.
+
+    `irt` is "1pl", "2pl", "off", or "auto" (2PL once there are
+    IRT_MIN_RESPONDENTS vectors). When fitted, the score is the weaker of the
+    share of items outside the respondents' ability range (same cut-offs as
+    ceiling/floor) and the share of weakly discriminating items.
+    """
+    item_ids = labels = None
+    if matrix is not None:
+        matrix = as_matrix(matrix)
+        item_ids = matrix.item_ids
+        files, labels = matrix.responses()
     if files is None:
         files = [
             "data/predictions/gpt4_preds.csv",          # original
@@ -18,29 +77,23 @@ def main(files=None):
         ]
 
     # ------------------------------------------------ load all vectors
-    rows = [np.array(pd.read_csv(f)["is_correct"].values) for f in files]
-    X    = np.vstack(rows)             # shape (P, N)
+    if labels is None:
+        labels = [os.path.basename(f) if isinstance(f, (str, os.PathLike)) else f"vector {i}"
+                  for i, f in enumerate(files)]
+        X = np.vstack([as_correct(f) for f in files])   # shape (P, N)
+    else:
+        X = files                                        # NaN = missing cell
     P, N = X.shape
 
     # ------------------------------------------------ difficulty per item
-    d     = X.mean(axis=0)             # length N
+    d     = np.nanmean(X, axis=0)      # length N
     ceils = (d == 1.0).sum()
     floors= (d == 0.0).sum()
     pct   = 100 * (ceils + floors) / N
 
-    def rubric(p):
-        """Convert percentage of ceiling/floor items to BCR Difficulty & Discrimination score (0-3)."""
-        if p < 5:  
-            return 3
-        if p < 10: 
-            return 2
-        if p < 20: 
-            return 1
-        return 0
-
     score = rubric(pct)
     
-    return {
+    result = {
         "total_items": int(N),
         "ceiling_items": int(ceils),
         "floor_items": int(floors),
@@ -50,6 +103,23 @@ def main(files=None):
         "score": int(score)
     }
 
+    # ------------------------------------------------ item response theory
+    model = "2pl" if irt == "auto" else irt
+    if irt == "auto" and P < IRT_MIN_RESPONDENTS:
+        model = "off"
+    if model != "off":
+        summary = irt_fit.summarize(irt_fit.fit_irt(X, model=model), labels)
+        summary["score"] = min(rubric(summary["out_of_range_percentage"]),
+                               irt_fit.discrimination_rubric(
+                                   summary.get("low_discrimination_percentage", 0.0)))
+        result["irt"] = summary
+        result["ceiling_floor_score"] = result["score"]
+        result["score"] = int(summary["score"])
+    if breakdown:
+        result["breakdown"] = slice_breakdown(subjects_for(data_path, N, item_ids), matrix=X,
+                                              slices=slices)
+    return result
+
 if __name__ == "__main__":
     result = main()
     print(json.dumps(result, indent=2))
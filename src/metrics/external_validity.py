@@ -3,6 +3,9 @@ import pandas as pd
 import numpy as np
 import json
 from src.utils.dataset import load_mmlu
+from src.utils.predictions import as_aligned, as_dataset
+from src.metrics.slices import SLICES_PATH, breakdown as slice_breakdown
+from src.metrics.registry import register_metric
 
 STEM_SUBJECTS = {
     "astronomy","clinical_knowledge","college_biology","college_chemistry",
@@ -12,16 +15,37 @@ STEM_SUBJECTS = {
     "high_school_physics","high_school_statistics"
 }
 
-def main(pred_path="data/predictions/gpt4_preds.csv", data_path="data/raw/mmlu_test_sampled_0.02.csv"):
-    # Load both files using pandas directly
-    df = pd.read_csv(data_path)
-    pred_df = pd.read_csv(pred_path)
-    
-    # Ensure we have the same number of rows
-    if len(df) != len(pred_df):
-        raise ValueError(f"Dataset size mismatch: {len(df)} questions vs {len(pred_df)} predictions")
-    
-    pred = pred_df["is_correct"].values
+def rubric(d):
+    """Convert accuracy gap to BCR External Validity score (0-3)."""
+    if d <= 2:
+        return 3
+    if d <= 5:
+        return 2
+    if d <= 10:
+        return 1
+    return 0
+
+@register_metric(
+    'external_validity',
+    description='External Validity',
+    inputs=['pred_path', 'data_path', 'breakdown', 'slices'],
+    outputs=['stem_items', 'non_stem_items', 'stem_accuracy', 'non_stem_accuracy', 'accuracy_gap', 'score'],
+    levels={
+        3: 'Excellent external validity (gap ≤ 2pp)',
+        2: 'Good external validity (2pp < gap ≤ 5pp)',
+        1: 'Fair external validity (5pp < gap ≤ 10pp)',
+        0: 'Poor external validity (gap > 10pp)'
+    },
+    metadata=lambda r: f"Gap = {r['accuracy_gap']:.1f}pp",
+)
+def main(pred_path="data/predictions/gpt4_preds.csv", data_path="data/raw/mmlu_test_sampled_0.02.csv",
+         breakdown=False, slices=SLICES_PATH):
+    """`pred_path` / `data_path` may also be an already-loaded vector / DataFrame.
+
+    With `breakdown`, also reports accuracy and CI per subject and per slice.
+    """
+    # join on item_id where the prediction file has one, else require equal length
+    pred, df = as_aligned(pred_path, as_dataset(data_path))
 
     mask_stem = np.array(df["subject"].isin(STEM_SUBJECTS).values)
     mask_non = ~mask_stem
@@ -34,23 +58,13 @@ def main(pred_path="data/predictions/gpt4_preds.csv", data_path="data/raw/mmlu_t
     acc_non = acc(mask_non)
     delta = abs(acc_stem - acc_non)
 
-    def rubric(d):
-        """Convert accuracy drop to BCR External Validity score (0-3)."""
-        if d <= 2:   
-            return 3
-        if d <= 5:   
-            return 2
-        if d <= 10:  
-            return 1
-        return 0
-
     score = rubric(delta)
     print(f"STEM items     : {mask_stem.sum()}  •  Acc {acc_stem:5.2f} %")
     print(f"Non-STEM items : {mask_non.sum()}  •  Acc {acc_non:5.2f} %")
     print(f"Gap            : {delta:5.2f} pp")
     print(f"BCR Ext-Validity: {score} / 3")
     
-    return {
+    result = {
         "stem_items": int(mask_stem.sum()),
         "non_stem_items": int(mask_non.sum()),
         "stem_accuracy": float(acc_stem),
@@ -58,6 +72,9 @@ def main(pred_path="data/predictions/gpt4_preds.csv", data_path="data/raw/mmlu_t
         "accuracy_gap": float(delta),
         "score": int(score)
     }
+    if breakdown:
+        result["breakdown"] = slice_breakdown(df["subject"], correct=pred, slices=slices)
+    return result
 
 if __name__ == "__main__":
     result = main()
@@ -0,0 +1,193 @@
+"""
+irt.py
+Item Response Theory fit over a (respondents × items) correctness matrix.
+
+A 1PL (Rasch) or 2PL logistic model, P(correct) = σ(a_i (θ_m − b_i)), is fitted
+by MAP with weak Gaussian priors, alternating one diagonal Newton step for all
+abilities θ, all difficulties b and all discriminations a per iteration.
+Abilities are re-standardized after every step, which removes the slow
+location/scale drift of alternating updates: fits converge in tens of
+iterations, each a handful of in-place float32 NumPy operations on reused
+buffers, so 100 models × 14k items fits in about a second on CPU. Missing
+cells (NaN or a `present` mask) simply drop out of every sum. The priors keep
+items that every model gets right (or wrong) finite instead of diverging.
+"""
+import argparse
+import numpy as np
+import pandas as pd
+from src.utils.predictions import CorrectnessMatrix
+
+PRIOR_SD = {"ability": 1.0, "difficulty": 2.0, "discrimination": 0.5}   # a ~ N(1, 0.5²)
+MAX_DISCRIMINATION = 4.0
+LOW_DISCRIMINATION = 0.35     # Baker's "very low" discrimination
+
+
+def fit_irt(responses, present=None, model="2pl", max_iter=200, tol=1e-4, prior_sd=PRIOR_SD):
+    """Fit a 1PL/2PL model to `responses` (M respondents × I items, 0/1, NaN = missing).
+
+    Returns a dict of ability (M,), difficulty (I,), difficulty_se (I,),
+    discrimination (I,), log_likelihood, iterations and converged. Abilities are
+    standardized to mean 0 (and, for 2PL, unit variance) with b and a rescaled
+    to match.
+    """
+    if model not in ("1pl", "2pl"):
+        raise ValueError(f"Unknown IRT model '{model}' (expected '1pl' or '2pl')")
+    R = np.atleast_2d(np.asarray(responses, dtype=float))
+    W = ~np.isnan(R) if present is None else (np.asarray(present, dtype=bool) & ~np.isnan(R))
+    Y = np.where(W, R, 0.0).astype(np.float32)
+    W = W.astype(np.float32)
+    s_t, s_b, s_a = (prior_sd[k] ** -2 for k in ("ability", "difficulty", "discrimination"))
+
+    # start from smoothed logits of the marginal proportions
+    n_m, n_i = W.sum(axis=1), W.sum(axis=0)
+    theta = np.log((Y.sum(axis=1) + 0.5) / (n_m - Y.sum(axis=1) + 0.5))
+    theta = (theta - theta.mean()) / (theta.std() or 1.0)
+    b = -np.log((Y.sum(axis=0) + 0.5) / (n_i - Y.sum(axis=0) + 0.5))
+    a = np.ones(R.shape[1])
+
+    masked = not W.all()
+    buf_d, buf_p, buf_r, buf_w = (np.empty(R.shape, dtype=np.float32) for _ in range(4))
+
+    def residuals():
+        """(θ − b, weighted residuals, weighted variances) at the current parameters.
+
+        Computed in place in reused float32 buffers; valid until the next call.
+        """
+        np.subtract.outer(theta.astype(np.float32), b.astype(np.float32), out=buf_d)
+        p = np.multiply(buf_d, a.astype(np.float32) / 2, out=buf_p)
+        np.tanh(p, out=p)                         # σ(z) = (1 + tanh(z/2)) / 2
+        np.add(p, 1, out=p)
+        np.multiply(p, 0.5, out=p)
+        np.subtract(Y, p, out=buf_r)
+        np.subtract(1, p, out=buf_w)
+        np.multiply(buf_w, p, out=buf_w)
+        if masked:
+            np.multiply(buf_r, W, out=buf_r)
+            np.multiply(buf_w, W, out=buf_w)
+        return buf_d, buf_r, buf_w
+
+    converged, it = False, 0
+    for it in range(1, max_iter + 1):
+        old = np.concatenate([theta, b, a])
+
+        _, r, w = residuals()
+        a32 = a.astype(np.float32)
+        theta = theta + (r @ a32 - theta * s_t) / (w @ (a32 * a32) + s_t)
+        mu = theta.mean()
+        scale = (theta.std() or 1.0) if model == "2pl" else 1.0
+        theta, b, a = (theta - mu) / scale, (b - mu) / scale, a * scale
+
+        _, r, w = residuals()
+        b = b + (-a * r.sum(axis=0) - b * s_b) / (a * a * w.sum(axis=0) + s_b)
+
+        if model == "2pl":
+            d, r, w = residuals()
+            w *= d
+            a = a + (np.einsum("ij,ij->j", r, d) - (a - 1) * s_a) / \
+                (np.einsum("ij,ij->j", w, d) + s_a)
+            a = np.clip(a, -MAX_DISCRIMINATION, MAX_DISCRIMINATION)
+
+        if np.max(np.abs(np.concatenate([theta, b, a]) - old)) < tol:
+            converged = True
+            break
+
+    d, _, w = residuals()
+    z = a * d
+    loglik = float(np.sum(W * (Y * z - np.logaddexp(0.0, z))))
+    return {
+        "model": model,
+        "ability": theta,
+        "difficulty": b,
+        "difficulty_se": 1.0 / np.sqrt(a * a * w.sum(axis=0) + s_b),
+        "discrimination": a,
+        "log_likelihood": loglik,
+        "iterations": it,
+        "converged": converged,
+    }
+
+
+def discrimination_rubric(low_discrimination_pct):
+    """Convert % of weakly discriminating items (a < LOW_DISCRIMINATION) to a 0-3 score."""
+    if low_discrimination_pct < 10:
+        return 3
+    if low_discrimination_pct < 20:
+        return 2
+    if low_discrimination_pct < 35:
+        return 1
+    return 0
+
+
+def summarize(fit, labels=None):
+    """Metric-style summary of a fit_irt() result."""
+    theta, b, a = fit["ability"], fit["difficulty"], fit["discrimination"]
+    I = len(b)
+    out_of_range = (b < theta.min()) | (b > theta.max())
+    low = a < LOW_DISCRIMINATION
+    q10, q50, q90 = np.percentile(b, [10, 50, 90])
+    summary = {
+        "model": fit["model"],
+        "respondents": int(len(theta)),
+        "items": int(I),
+        "difficulty_mean": float(b.mean()),
+        "difficulty_sd": float(b.std()),
+        "difficulty_quantiles": {"10%": float(q10), "50%": float(q50), "90%": float(q90)},
+        "ability_range": [float(theta.min()), float(theta.max())],
+        "out_of_range_items": int(out_of_range.sum()),
+        "out_of_range_percentage": float(100 * out_of_range.mean()),
+        "log_likelihood": fit["log_likelihood"],
+        "iterations": fit["iterations"],
+        "converged": fit["converged"],
+    }
+    if fit["model"] == "2pl":
+        summary.update({
+            "discrimination_mean": float(a.mean()),
+            "discrimination_median": float(np.median(a)),
+            "low_discrimination_items": int(low.sum()),
+            "low_discrimination_percentage": float(100 * low.mean()),
+            "negative_discrimination_items": int((a < 0).sum()),
+        })
+    if labels is not None:
+        summary["ability"] = {str(k): float(t) for k, t in zip(labels, theta)}
+    return summary
+
+
+def item_table(fit, item_ids=None):
+    """Per-item parameters as a DataFrame (one row per item)."""
+    df = pd.DataFrame({
+        "difficulty": fit["difficulty"],
+        "difficulty_se": fit["difficulty_se"],
+        "discrimination": fit["discrimination"],
+    })
+    if item_ids is not None:
+        df.insert(0, "item_id", list(item_ids))
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit IRT item parameters to a correctness matrix")
+    parser.add_argument("matrix", help="CorrectnessMatrix .npz from run_matrix")
+    parser.add_argument("--model", choices=["1pl", "2pl"], default="2pl")
+    parser.add_argument("--variant", default=None,
+                        help="Use one variant only (default: every model × variant is a respondent)")
+    parser.add_argument("--out", default="data/metrics_results/irt_items.csv")
+    args = parser.parse_args()
+
+    matrix = CorrectnessMatrix.load(args.matrix)
+    responses, labels = matrix.responses(args.variant)
+    fit = fit_irt(responses, model=args.model)
+    item_table(fit, matrix.item_ids).to_csv(args.out, index=False)
+    summary = summarize(fit, labels)
+    print(f"{summary['model'].upper()} fit: {summary['respondents']} respondents × "
+          f"{summary['items']} items, {summary['iterations']} iterations "
+          f"({'converged' if summary['converged'] else 'not converged'})")
+    for label, t in summary["ability"].items():
+        print(f"  {label:32} θ = {t:+.2f}")
+    print(f"Items outside the ability range: {summary['out_of_range_percentage']:.1f}%")
+    if "low_discrimination_percentage" in summary:
+        print(f"Low-discrimination items (a < {LOW_DISCRIMINATION}): "
+              f"{summary['low_discrimination_percentage']:.1f}%")
+    print(f"Item parameters → {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""
+online.py
+Streaming accumulators for watching BCR scores converge while predictions arrive.
+
+Each accumulator takes one item per update() in O(1), merges with the same
+accumulator from another shard via merge(), round-trips through to_dict() /
+from_dict() (JSON-safe) and reports the same result dict as its metric.
+
+run_llm_eval keeps the accuracy, coverage and external-validity states in a
+`<out>.scores.json` sidecar, which merge_shards combines across shards;
+run_matrix follows ceiling/floor agreement across its cells.
+"""
+import json
+import math
+import os
+from collections import Counter
+from src.metrics.power_ci import score_from_width, wilson_ci
+from src.metrics import coverage, difficulty_discrimination, external_validity
+
+
+def _xlogx(c):
+    return c * math.log2(c) if c > 0 else 0.0
+
+
+class AccuracyAccumulator:
+    """Running accuracy and Wilson interval, as power_ci reports them."""
+
+    def __init__(self, n=0, k=0):
+        self.n, self.k = n, k
+
+    def update(self, is_correct):
+        self.n += 1
+        self.k += int(is_correct)
+
+    def merge(self, other):
+        self.n += other.n
+        self.k += other.k
+        return self
+
+    def result(self, alpha=0.05):
+        if self.n == 0:
+            return {"n": 0}
+        lo, hi = wilson_ci(self.k, self.n, alpha)
+        return {
+            "n": self.n,
+            "accuracy": 100 * self.k / self.n,
+            "ci_lower": 100 * lo,
+            "ci_upper": 100 * hi,
+            "ci_width": 100 * (hi - lo),
+            "method": "wilson",
+            "score": score_from_width(hi - lo),
+        }
+
+    def to_dict(self):
+        return {"n": self.n, "k": self.k}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d["n"], d["k"])
+
+
+class CoverageAccumulator:
+    """Per-subject counts with the entropy sum Σ c·log2 c kept up to date in O(1)."""
+
+    def __init__(self, counts=None):
+        self.counts = Counter(counts or {})
+        self.n = sum(self.counts.values())
+        self._s = sum(_xlogx(c) for c in self.counts.values())
+
+    def update(self, subject):
+        c = self.counts[subject]
+        self._s += _xlogx(c + 1) - _xlogx(c)
+        self.counts[subject] = c + 1
+        self.n += 1
+
+    def merge(self, other):
+        self.counts.update(other.counts)
+        self.n = sum(self.counts.values())
+        self._s = sum(_xlogx(c) for c in self.counts.values())
+        return self
+
+    def result(self):
+        k = len(self.counts)
+        if k < 2:
+            return {"n": self.n, "unique_constructs": k}
+        h = math.log2(self.n) - self._s / self.n      # H = log n − Σ c log c / n
+        h_max = math.log2(k)
+        return {
+            "n": self.n,
+            "unique_constructs": k,
+            "entropy": h,
+            "max_entropy": h_max,
+            "normalized_score": h / h_max,
+            "score": coverage.rubric(h / h_max),
+        }
+
+    def to_dict(self):
+        return {"counts": dict(self.counts)}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d["counts"])
+
+
+class ExternalValidityAccumulator:
+    """Running STEM / non-STEM accuracies."""
+
+    def __init__(self, stem=None, non_stem=None, stem_subjects=external_validity.STEM_SUBJECTS):
+        self.stem = stem or AccuracyAccumulator()
+        self.non_stem = non_stem or AccuracyAccumulator()
+        self.stem_subjects = stem_subjects
+
+    def update(self, subject, is_correct):
+        (self.stem if subject in self.stem_subjects else self.non_stem).update(is_correct)
+
+    def merge(self, other):
+        self.stem.merge(other.stem)
+        self.non_stem.merge(other.non_stem)
+        return self
+
+    def result(self):
+        if not (self.stem.n and self.non_stem.n):
+            return {"stem_items": self.stem.n, "non_stem_items": self.non_stem.n}
+        acc_stem = 100 * self.stem.k / self.stem.n
+        acc_non = 100 * self.non_stem.k / self.non_stem.n
+        gap = abs(acc_stem - acc_non)
+        return {
+            "stem_items": self.stem.n,
+            "non_stem_items": self.non_stem.n,
+            "stem_accuracy": acc_stem,
+            "non_stem_accuracy": acc_non,
+            "accuracy_gap": gap,
+            "score": external_validity.rubric(gap),
+        }
+
+    def to_dict(self):
+        return {"stem": self.stem.to_dict(), "non_stem": self.non_stem.to_dict()}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(AccuracyAccumulator.from_dict(d["stem"]),
+                   AccuracyAccumulator.from_dict(d["non_stem"]))
+
+
+class DifficultyAccumulator:
+    """Per-item agreement counts across `n_files` prediction sets.
+
+    An item is judged once all `n_files` results for it have arrived: ceiling
+    if every one is correct, floor if none is. Running totals make result() O(1).
+    """
+
+    def __init__(self, n_files=4, seen=None, correct=None):
+        self.n_files = n_files
+        self.seen = Counter(seen or {})
+        self.correct = Counter(correct or {})
+        self._recount()
+
+    def _recount(self):
+        full = [i for i, s in self.seen.items() if s >= self.n_files]
+        self.complete = len(full)
+        self.ceiling = sum(self.correct[i] == self.n_files for i in full)
+        self.floor = sum(self.correct[i] == 0 for i in full)
+
+    def update(self, item_id, is_correct):
+        self.seen[item_id] += 1
+        self.correct[item_id] += int(is_correct)
+        if self.seen[item_id] == self.n_files:
+            self.complete += 1
+            self.ceiling += self.correct[item_id] == self.n_files
+            self.floor += self.correct[item_id] == 0
+
+    def merge(self, other):
+        self.seen.update(other.seen)
+        self.correct.update(other.correct)
+        self._recount()
+        return self
+
+    def result(self):
+        N = self.complete
+        if N == 0:
+            return {"total_items": 0, "pending_items": len(self.seen)}
+        pct = 100 * (self.ceiling + self.floor) / N
+        return {
+            "total_items": N,
+            "pending_items": len(self.seen) - N,
+            "ceiling_items": self.ceiling,
+            "floor_items": self.floor,
+            "ceiling_percentage": 100 * self.ceiling / N,
+            "floor_percentage": 100 * self.floor / N,
+            "total_percentage": pct,
+            "score": difficulty_discrimination.rubric(pct),
+        }
+
+    def to_dict(self):
+        return {"n_files": self.n_files, "seen": dict(self.seen), "correct": dict(self.correct)}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d["n_files"], d["seen"], d["correct"])
+
+
+ACCUMULATORS = {
+    "power_ci": AccuracyAccumulator,
+    "coverage": CoverageAccumulator,
+    "external_validity": ExternalValidityAccumulator,
+    "difficulty_discrimination": DifficultyAccumulator,
+}
+
+
+def state_path(pred_path):
+    """Sidecar holding the accumulator states of a prediction file."""
+    return pred_path + ".scores.json"
+
+
+def save_states(accumulators, path):
+    """Write {metric: accumulator} as JSON."""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({name: acc.to_dict() for name, acc in accumulators.items()}, f)
+
+
+def load_states(path):
+    with open(path, encoding="utf-8") as f:
+        return {name: ACCUMULATORS[name].from_dict(d) for name, d in json.load(f).items()}
+
+
+def merge_states(pred_paths):
+    """Merge the sidecar states of several shards, or None if one is missing."""
+    paths = [state_path(p) for p in pred_paths]
+    if not paths or not all(os.path.exists(p) for p in paths):
+        return None
+    merged = load_states(paths[0])
+    for p in paths[1:]:
+        for name, acc in load_states(p).items():
+            merged[name].merge(acc)
+    return merged
+
+
+_DETAIL = {
+    "power_ci": lambda r: f"CI width {r['ci_width']:.1f}pp",
+    "coverage": lambda r: f"H/Hmax {r['normalized_score']:.3f}",
+    "external_validity": lambda r: f"STEM gap {r['accuracy_gap']:.1f}pp",
+    "difficulty_discrimination": lambda r: f"{r['total_percentage']:.1f}% ceiling/floor",
+}
+
+
+def describe(accumulators):
+    """One-line summary of the accumulators that have a score yet."""
+    results = {name: acc.result() for name, acc in accumulators.items()}
+    return "  ".join(f"{name} {r['score']}/3 ({_DETAIL[name](r)})"
+                     for name, r in results.items() if "score" in r)
@@ -0,0 +1,76 @@
+"""
+paired.py
+Paired significance of accuracy drops: McNemar tests, paired bootstrap CIs and
+flip matrices for every perturbation at once from a stacked (P, N) matrix.
+"""
+import math
+import numpy as np
+from src.metrics.slices import MAX_BLOCK_CELLS, betainc
+
+
+def flip_counts(base, perts):
+    """2×2 outcome counts of `base` (N,) against each row of `perts` (P, N).
+
+    Returns (both, c2w, w2c, neither), each of shape (P,), from one mat-vec.
+    """
+    base = np.asarray(base, dtype=np.int64)
+    X = np.atleast_2d(np.asarray(perts, dtype=np.int64))
+    both = X @ base
+    c2w = base.sum() - both                  # correct → wrong
+    w2c = X.sum(axis=1) - both               # wrong → correct
+    neither = len(base) - both - c2w - w2c
+    return both, c2w, w2c, neither
+
+
+def mcnemar(b, c):
+    """McNemar tests for discordant counts b, c (arrays).
+
+    Returns (p_exact, chi2, p_chi2): the two-sided exact binomial p-value and
+    the continuity-corrected chi-square statistic with its p-value (1 df).
+    """
+    b, c = np.asarray(b, dtype=np.int64), np.asarray(c, dtype=np.int64)
+    n, k = b + c, np.minimum(b, c)
+    # P(X ≤ k) for X ~ Bin(n, ½) is I_½(n − k, k + 1)
+    p_exact = np.array([1.0 if kk >= nn else min(1.0, 2 * betainc(nn - kk, kk + 1, 0.5))
+                        for kk, nn in zip(k.tolist(), n.tolist())])
+    chi2 = np.where(n > 0, (np.maximum(np.abs(b - c) - 1, 0)) ** 2 / np.maximum(n, 1), 0.0)
+    p_chi2 = np.array([math.erfc(math.sqrt(x / 2)) for x in chi2.tolist()])
+    return p_exact, chi2, p_chi2
+
+
+def paired_bootstrap(base, perts, n_boot=1000, alpha=0.05, seed=42):
+    """Percentile CIs of the accuracy drop (base − pert, in pp) for every row of `perts`.
+
+    All perturbations share the same item resamples, so the CIs are paired;
+    resamples are drawn in bounded blocks of multinomial counts, one matmul each.
+    """
+    base = np.asarray(base, dtype=float)
+    D = base[None, :] - np.atleast_2d(np.asarray(perts, dtype=float))        # (P, N)
+    n = D.shape[1]
+    block = max(1, min(n_boot, MAX_BLOCK_CELLS // max(n, 1)))
+    sizes = [min(block, n_boot - start) for start in range(0, n_boot, block)]
+    drops = []
+    for size, ss in zip(sizes, np.random.SeedSequence(seed).spawn(len(sizes))):
+        counts = np.random.default_rng(ss).multinomial(n, np.full(n, 1 / n), size=size)
+        drops.append(counts @ D.T / n)                                        # (B, P)
+    drops = 100 * np.concatenate(drops)
+    lo, hi = np.percentile(drops, [100 * alpha / 2, 100 * (1 - alpha / 2)], axis=0)
+    return lo, hi
+
+
+def paired_stats(base, perts, n_boot=1000, alpha=0.05, seed=42):
+    """Per-perturbation paired statistics of `base` (N,) vs `perts` (P, N)."""
+    both, c2w, w2c, neither = flip_counts(base, perts)
+    p_exact, chi2, p_chi2 = mcnemar(c2w, w2c)
+    lo, hi = paired_bootstrap(base, perts, n_boot=n_boot, alpha=alpha, seed=seed)
+    N = len(base)
+    return [{
+        "flip_matrix": [[int(both[p]), int(c2w[p])], [int(w2c[p]), int(neither[p])]],
+        "correct_to_wrong_rate": float(100 * c2w[p] / N),
+        "wrong_to_correct_rate": float(100 * w2c[p] / N),
+        "mcnemar_p_exact": float(p_exact[p]),
+        "mcnemar_chi2": float(chi2[p]),
+        "mcnemar_p_chi2": float(p_chi2[p]),
+        "drop_ci_lower": float(lo[p]),
+        "drop_ci_upper": float(hi[p]),
+    } for p in range(len(both))]
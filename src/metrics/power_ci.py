@@ -1,17 +1,73 @@
 """Calculate confidence intervals and power scores for model predictions."""
+from concurrent.futures import ProcessPoolExecutor
+from statistics import NormalDist
+import math
 import numpy as np
 import pandas as pd
 import json
+from src.utils.predictions import as_correct
+from src.metrics.registry import register_metric
+from src.metrics.slices import (MAX_BLOCK_CELLS, SLICES_PATH, betainc,
+                                breakdown as slice_breakdown, subjects_for)
 
 THRESHOLDS = [(0.02, 3), (0.05, 2), (0.10, 1)]   # CI width ⇒ rubric
 
-def bootstrap_ci(correct, n_boot=1000, alpha=0.05):
-    """Calculate the bootstrap confidence interval for the mean accuracy."""
-    rng = np.random.default_rng(42)
-    stats = [rng.choice(correct, size=len(correct)).mean() for _ in range(n_boot)]
+def _bootstrap_block(values, n_resamples, seed_seq):
+    """Means of `n_resamples` bootstrap resamples of `values`, drawn as counts."""
+    rng = np.random.default_rng(seed_seq)
+    n = len(values)
+    if np.isin(values, (0, 1)).all():
+        # resampled mean of a 0/1 vector is Binomial(n, p̂) / n
+        return rng.binomial(n, values.mean(), size=n_resamples) / n
+    counts = rng.multinomial(n, np.full(n, 1 / n), size=n_resamples)    # (B, n)
+    return counts @ values / n
+
+def bootstrap_ci(correct, n_boot=1000, alpha=0.05, seed=42, n_jobs=1):
+    """Calculate the bootstrap confidence interval for the mean accuracy.
+
+    Resamples are drawn in blocks of bounded size, each with its own child of
+    SeedSequence(seed), so the result depends only on the seed — not on
+    `n_jobs`, which shards blocks over worker processes.
+    """
+    values = np.asarray(correct, dtype=float)
+    block = max(1, min(n_boot, MAX_BLOCK_CELLS // max(len(values), 1)))
+    sizes = [min(block, n_boot - start) for start in range(0, n_boot, block)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+    if n_jobs > 1 and len(sizes) > 1:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            parts = list(pool.map(_bootstrap_block, [values] * len(sizes), sizes, seeds))
+    else:
+        parts = [_bootstrap_block(values, k, s) for k, s in zip(sizes, seeds)]
+    stats = np.concatenate(parts)
     lower, upper = np.percentile(stats, [100*alpha/2, 100*(1-alpha/2)])
     return lower, upper
 
+def wilson_ci(k, n, alpha=0.05):
+    """Closed-form Wilson score interval for k successes out of n."""
+    z = NormalDist().inv_cdf(1 - alpha / 2)
+    p = k / n
+    centre = (p + z*z / (2*n)) / (1 + z*z / n)
+    half = z * math.sqrt(p * (1 - p) / n + z*z / (4*n*n)) / (1 + z*z / n)
+    return max(0.0, centre - half), min(1.0, centre + half)
+
+def _beta_ppf(q, a, b):
+    """Inverse of I_x(a, b) in x, by bisection."""
+    lo, hi = 0.0, 1.0
+    for _ in range(100):
+        mid = (lo + hi) / 2
+        if betainc(a, b, mid) < q:
+            lo = mid
+        else:
+            hi = mid
+    return (lo + hi) / 2
+
+def clopper_pearson_ci(k, n, alpha=0.05):
+    """Exact (Clopper-Pearson) binomial interval for k successes out of n."""
+    lower = 0.0 if k == 0 else _beta_ppf(alpha / 2, k, n - k + 1)
+    upper = 1.0 if k == n else _beta_ppf(1 - alpha / 2, k + 1, n - k)
+    return lower, upper
+
 def score_from_width(ci_width):
     """Convert CI width to BCR power score."""
     for thresh, score in THRESHOLDS:
@@ -19,25 +75,57 @@ def score_from_width(ci_width):
             return score
     return 0
 
-def main(pred_path="data/predictions/gpt4_preds.csv"):
-    df = pd.read_csv(pred_path)          
-    acc  = df["is_correct"].mean()
-    lo, hi = bootstrap_ci(df["is_correct"].values)
+@register_metric(
+    'power_ci',
+    description='Power',
+    inputs=['pred_path', 'method', 'n_boot', 'seed', 'n_jobs', 'data_path', 'breakdown', 'slices'],
+    outputs=['accuracy', 'ci_lower', 'ci_upper', 'ci_width', 'method', 'score'],
+    levels={
+        3: 'Excellent power (CI width ≤ 2pp)',
+        2: 'Good power (2pp < CI width ≤ 5pp)',
+        1: 'Fair power (5pp < CI width ≤ 10pp)',
+        0: 'Poor power (CI width > 10pp)'
+    },
+    metadata=lambda r: f"CI width = {r['ci_width']:.1f}pp, Accuracy = {r['accuracy']:.1f}%",
+    timeout=1800,
+)
+def main(pred_path="data/predictions/gpt4_preds.csv", method="bootstrap", n_boot=1000,
+         seed=42, n_jobs=1, data_path=None, breakdown=False, slices=SLICES_PATH):
+    """`pred_path` may also be an already-loaded correctness vector.
+
+    With `breakdown` (and the dataset in `data_path`), also reports accuracy and
+    Wilson CI per subject and per slice.
+    """
+    correct = as_correct(pred_path)
+    acc  = correct.mean()
+    if method == "bootstrap":
+        lo, hi = bootstrap_ci(correct, n_boot=n_boot, seed=seed, n_jobs=n_jobs)
+    elif method == "wilson":
+        lo, hi = wilson_ci(int(correct.sum()), len(correct))
+    elif method == "clopper_pearson":
+        lo, hi = clopper_pearson_ci(int(correct.sum()), len(correct))
+    else:
+        raise ValueError(f"Unknown CI method '{method}'")
     width  = hi - lo
     POWER_SCORE = score_from_width(width)
 
     print(f"Accuracy      : {acc*100:6.2f} %")
-    print(f"95 % CI       : [{lo*100:6.2f}, {hi*100:6.2f}] %")
+    print(f"95 % CI       : [{lo*100:6.2f}, {hi*100:6.2f}] %  ({method})")
     print(f"CI width      : {width*100:6.2f} pp")
     print(f"BCR Power     : {POWER_SCORE} / 3")
-    
-    return {
+
+    result = {
         "accuracy": float(acc * 100),
         "ci_lower": float(lo * 100),
         "ci_upper": float(hi * 100),
         "ci_width": float(width * 100),
+        "method": method,
         "score": int(POWER_SCORE)
     }
+    if breakdown:
+        result["breakdown"] = slice_breakdown(subjects_for(data_path, len(correct)),
+                                              correct=correct, slices=slices)
+    return result
 
 if __name__ == "__main__":
     result = main()
@@ -0,0 +1,75 @@
+"""
+registry.py
+Metric registry: each metric module decorates its main() with @register_metric,
+declaring inputs, output schema, rubric and scheduling hints. Modules are
+imported lazily, once, on first lookup. Third-party metrics plug in through the
+"bcr.metrics" entry-point group (name = metric, value = module to import).
+"""
+import importlib
+from importlib.metadata import entry_points
+
+ENTRY_POINT_GROUP = "bcr.metrics"
+
+# Metrics shipped with the repo, in confidence-table order
+BUILTIN_METRICS = {
+    'construct_validity':        'src.metrics.construct_validity',
+    'coverage':                  'src.metrics.coverage',
+    'external_validity':         'src.metrics.external_validity',
+    'difficulty_discrimination': 'src.metrics.difficulty_discrimination',
+    'robustness':                'src.metrics.robustness',
+    'robustness_multi':          'src.metrics.robustness_multi',
+    'power_ci':                  'src.metrics.power_ci',
+}
+
+_REGISTRY = {}
+
+
+def register_metric(name, description, inputs=(), outputs=(), levels=None, metadata=None,
+                    kind='cpu', deps=(), timeout=300):
+    """Decorator registering `main` as metric `name`.
+
+    inputs   : keyword arguments main() accepts from run_metrics params
+    outputs  : keys the result dict is expected to contain
+    levels   : {score: confidence-level text}; None keeps it out of the table
+    metadata : result -> short summary string for the table
+    kind     : 'io' (network-bound, run on a thread) or 'cpu' (process pool)
+    """
+    def decorator(main):
+        _REGISTRY[name] = {
+            'name': name,
+            'main': main,
+            'description': description,
+            'inputs': tuple(inputs),
+            'outputs': tuple(outputs),
+            'levels': levels,
+            'metadata': metadata,
+            'kind': kind,
+            'deps': tuple(deps),
+            'timeout': timeout,
+        }
+        return main
+    return decorator
+
+
+def _plugins():
+    return {ep.name: ep for ep in entry_points(group=ENTRY_POINT_GROUP)}
+
+
+def available_metrics():
+    """Names of all built-in and plugged-in metrics (nothing is imported)."""
+    return list(BUILTIN_METRICS) + [n for n in _plugins() if n not in BUILTIN_METRICS]
+
+
+def get_metric(name):
+    """Spec dict for metric `name`, importing its module on first use."""
+    if name not in _REGISTRY:
+        if name in BUILTIN_METRICS:
+            importlib.import_module(BUILTIN_METRICS[name])
+        else:
+            plugin = _plugins().get(name)
+            if plugin is None:
+                raise KeyError(f"Unknown metric '{name}'")
+            plugin.load()
+        if name not in _REGISTRY:
+            raise KeyError(f"Module for metric '{name}' did not register it")
+    return _REGISTRY[name]
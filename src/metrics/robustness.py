@@ -5,6 +5,10 @@ Compare accuracy on original vs perturbed sets and print BCR Robustness score.
 import pandas as pd
 import numpy as np
 import json
+from src.utils.predictions import as_correct
+from src.metrics.registry import register_metric
+from src.metrics.paired import paired_stats
+from src.metrics.slices import SLICES_PATH, breakdown as slice_breakdown, subjects_for
 
 def rubric(delta):
     """Convert accuracy drop to BCR Robustness score (0-3)."""
@@ -16,26 +20,56 @@ def rubric(delta):
         return 1
     return 0
 
-def main(orig_path="data/predictions/gpt4_preds.csv", pert_path="data/predictions/gpt4_paraphrase.csv"):
-    orig = np.array(pd.read_csv(orig_path)["is_correct"].values)
-    pert = np.array(pd.read_csv(pert_path)["is_correct"].values)
+@register_metric(
+    'robustness',
+    description='Robustness',
+    inputs=['orig_path', 'pert_path', 'n_boot', 'seed', 'data_path', 'breakdown', 'slices'],
+    outputs=['original_accuracy', 'perturbed_accuracy', 'accuracy_drop', 'score'],
+    levels={
+        3: 'Excellent robustness (drop ≤ 2pp)',
+        2: 'Good robustness (2pp < drop ≤ 5pp)',
+        1: 'Fair robustness (5pp < drop ≤ 10pp)',
+        0: 'Poor robustness (drop > 10pp)'
+    },
+    metadata=lambda r: f"Drop = {r['accuracy_drop']:.1f}pp",
+)
+def main(orig_path="data/predictions/gpt4_preds.csv", pert_path="data/predictions/gpt4_paraphrase.csv",
+         n_boot=1000, seed=42, data_path=None, breakdown=False, slices=SLICES_PATH):
+    """Either argument may be a prediction file or an already-loaded correctness vector.
+
+    The two vectors are item-aligned, so the drop also gets paired statistics:
+    McNemar tests, a paired bootstrap CI (`n_boot` resamples) and the flip matrix.
+
+    With `breakdown` (and the dataset in `data_path`), also reports the drop per
+    subject and per slice.
+    """
+    orig = as_correct(orig_path)
+    pert = as_correct(pert_path)
 
     acc_orig = np.mean(orig)
     acc_pert = np.mean(pert)
     delta_pp = (acc_orig - acc_pert) * 100      # percentage-point drop
 
     score = rubric(delta_pp)
+    paired = paired_stats(orig, pert, n_boot=n_boot, seed=seed)[0]
     print(f"Original accuracy : {acc_orig*100:.2f} %")
     print(f"Perturbed accuracy: {acc_pert*100:.2f} %")
-    print(f"Drop              : {delta_pp:.2f} pp")
+    print(f"Drop              : {delta_pp:.2f} pp  "
+          f"(95% CI [{paired['drop_ci_lower']:.2f}, {paired['drop_ci_upper']:.2f}], "
+          f"McNemar p={paired['mcnemar_p_exact']:.3g})")
     print(f"BCR Robustness    : {score} / 3")
     
-    return {
+    result = {
         "original_accuracy": float(acc_orig * 100),
         "perturbed_accuracy": float(acc_pert * 100),
         "accuracy_drop": float(delta_pp),
+        "paired": paired,
         "score": int(score)
     }
+    if breakdown:
+        result["breakdown"] = slice_breakdown(subjects_for(data_path, len(orig)), correct=orig,
+                                              perturbed=[(pert, None)], slices=slices)
+    return result
 
 if __name__ == '__main__':
     result = main()
@@ -3,8 +3,36 @@ import pandas as pd
 import numpy as np
 import json
 from src.metrics.robustness import rubric          # reuse the function
+from src.utils.predictions import as_correct, as_matrix
+from src.metrics.registry import register_metric
+from src.metrics.paired import paired_stats
+from src.metrics.slices import SLICES_PATH, breakdown as slice_breakdown, subjects_for
 
-def main(pairs=None):
+@register_metric(
+    'robustness_multi',
+    description='Robustness (per perturbation)',
+    inputs=['pairs', 'matrix', 'model', 'n_boot', 'seed', 'data_path', 'breakdown', 'slices'],
+    outputs=['base_accuracy', 'perturbations'],
+)
+def main(pairs=None, matrix=None, model=None, n_boot=1000, seed=42, data_path=None,
+         breakdown=False, slices=SLICES_PATH):
+    """`pairs` is [(prediction file or correctness vector, name), ...]; first is the baseline.
+
+    `matrix` (a CorrectnessMatrix or its .npz path) replaces `pairs` with the
+    variants of `model` (default: its first model), first variant as baseline.
+    Cells the matrix marks missing are left out: each drop and its paired
+    statistics use only the items present in both the baseline and that
+    perturbation. Paired statistics (McNemar, paired bootstrap CI of the
+    drop, flip matrix) for all perturbations come from one pass over the
+    stacked (P, N) matrix when nothing is missing.
+    With `breakdown` (and the dataset in `data_path`), drops are also reported
+    per subject and per slice.
+    """
+    item_ids = None
+    if matrix is not None:
+        matrix = as_matrix(matrix)
+        pairs = list(zip(matrix.model(model), matrix.variants))
+        item_ids = matrix.item_ids
     if pairs is None:
         pairs = [
             ("data/predictions/gpt4_preds.csv",        "Original"),
@@ -13,25 +41,48 @@ def main(pairs=None):
             ("data/predictions/gpt4_shuffle.csv",      "Distractor shuffle"),
         ]
 
-    base = np.array(pd.read_csv(pairs[0][0])["is_correct"].values)
-    acc_base = np.mean(base) * 100
-    
+    # float vectors, NaN = missing cell (only a matrix has any)
+    vectors = [np.asarray(p, dtype=float) if matrix is not None else as_correct(p).astype(float)
+               for p, _ in pairs]
+    base = vectors[0]
+    present = ~np.isnan(base)
+    acc_base = np.mean(base[present]) * 100
+
+    perts = [(v, name) for v, (_, name) in zip(vectors[1:], pairs[1:])]
+    masks = [present & ~np.isnan(p) for p, _ in perts]
+    if all(m.all() for m in masks):
+        paired = paired_stats(base, np.vstack([p for p, _ in perts]), n_boot=n_boot,
+                              seed=seed) if perts else []
+    else:
+        paired = [paired_stats(base[m], p[m][None], n_boot=n_boot, seed=seed)[0]
+                  for (p, _), m in zip(perts, masks)]
+
     results = []
-    for path, name in pairs[1:]:
-        pert = np.array(pd.read_csv(path)["is_correct"].values)
-        delta = acc_base - np.mean(pert)*100
+    for (pert, name), stats, m in zip(perts, paired, masks):
+        delta = (np.mean(base[m]) - np.mean(pert[m])) * 100
         score = rubric(delta)
-        print(f"{name:18}: drop {delta:5.2f} pp  →  score {score}/3")
+        print(f"{name:18}: drop {delta:5.2f} pp  [{stats['drop_ci_lower']:5.2f}, "
+              f"{stats['drop_ci_upper']:5.2f}]  McNemar p={stats['mcnemar_p_exact']:.3g}"
+              f"  →  score {score}/3")
         results.append({
             "name": name,
+            "items": int(m.sum()),
             "accuracy_drop": float(delta),
+            "paired": stats,
             "score": int(score)
         })
     
-    return {
+    result = {
         "base_accuracy": float(acc_base),
         "perturbations": results
     }
+    if breakdown:
+        common = np.logical_and.reduce([present, *masks])     # present in every variant
+        subjects = subjects_for(data_path, len(base), item_ids)[common]
+        result["breakdown"] = slice_breakdown(subjects, correct=base[common],
+                                              perturbed=[(p[common], name) for p, name in perts],
+                                              slices=slices)
+    return result
 
 if __name__ == "__main__":
     result = main()
@@ -0,0 +1,170 @@
+"""
+slices.py
+Per-subject and per-slice metric breakdowns in one vectorized pass.
+
+Subjects are integer-coded once; user-defined slices (named lists of
+subjects, e.g. config/slices.json) become extra groups. Every (item, group)
+membership is a pair of parallel arrays, so each statistic is a single
+np.bincount over all groups at once. The statistics helpers the metrics
+share (Wilson interval, regularized incomplete beta, bootstrap block size)
+live here too.
+"""
+import json
+import math
+import os
+from statistics import NormalDist
+import numpy as np
+import pandas as pd
+from src.utils.dataset import load_mmlu
+
+SLICES_PATH = "config/slices.json"
+MAX_BLOCK_CELLS = 2**22          # bootstrap counts held in memory at once
+
+
+def load_slices(slices=None):
+    """{slice: [subject, ...]} from a JSON path or a dict; None → no slices."""
+    if slices is None:
+        return {}
+    if isinstance(slices, (str, os.PathLike)):
+        with open(slices, encoding="utf-8") as f:
+            return json.load(f)
+    return dict(slices)
+
+
+def subjects_for(data_path, n, item_ids=None):
+    """Subject of each of `n` scored items, from a dataset path or DataFrame.
+
+    With `item_ids` the dataset is joined on them; otherwise it must line up
+    positionally.
+    """
+    if data_path is None:
+        raise ValueError("a per-subject breakdown needs data_path")
+    df = load_mmlu(data_path) if isinstance(data_path, (str, os.PathLike)) else data_path
+    if item_ids is not None:
+        return df.drop_duplicates("item_id").set_index("item_id")["subject"].reindex(item_ids).to_numpy()
+    if len(df) != n:
+        raise ValueError(f"Dataset size mismatch: {len(df)} questions vs {n} predictions")
+    return df["subject"].to_numpy()
+
+
+def group_index(subjects, slices=None):
+    """(items, groups, names, kinds): every (item, group) membership as parallel arrays.
+
+    Groups 0..K-1 are the subjects, followed by one group per slice.
+    """
+    codes, subject_names = pd.factorize(np.asarray(subjects, dtype=object))   # unknown → -1
+    slices = load_slices(slices)
+    member = np.column_stack([np.isin(subject_names, subs) for subs in slices.values()]) \
+        if slices else np.zeros((len(subject_names), 0), dtype=bool)        # (K, S)
+    known = np.flatnonzero(codes >= 0)
+    slice_items, slice_ids = np.nonzero(member[codes[known]])               # (N, S) → pairs
+    items = np.concatenate([known, known[slice_items]])
+    groups = np.concatenate([codes[known], len(subject_names) + slice_ids])
+    names = list(subject_names) + list(slices)
+    kinds = ["subject"] * len(subject_names) + ["slice"] * len(slices)
+    return items, groups, names, kinds
+
+
+def wilson_interval(k, n, alpha=0.05):
+    """Element-wise Wilson score interval for arrays of k successes out of n."""
+    z = NormalDist().inv_cdf(1 - alpha / 2)
+    n = np.maximum(n, 1)
+    p = k / n
+    centre = (p + z*z / (2*n)) / (1 + z*z / n)
+    half = z * np.sqrt(p * (1 - p) / n + z*z / (4*n*n)) / (1 + z*z / n)
+    return np.clip(centre - half, 0, 1), np.clip(centre + half, 0, 1)
+
+
+def _betacf(a, b, x, max_iter=10000, eps=1e-14):
+    """Continued fraction for the regularized incomplete beta (modified Lentz)."""
+    tiny = 1e-300
+    qab, qap, qam = a + b, a + 1, a - 1
+    c, d = 1.0, 1 - qab * x / qap
+    d = 1 / (d if abs(d) > tiny else tiny)
+    h = d
+    for m in range(1, max_iter + 1):
+        m2 = 2 * m
+        for aa in (m * (b - m) * x / ((qam + m2) * (a + m2)),
+                   -(a + m) * (qab + m) * x / ((a + m2) * (qap + m2))):
+            d = 1 + aa * d
+            d = 1 / (d if abs(d) > tiny else tiny)
+            c = 1 + aa / c
+            c = c if abs(c) > tiny else tiny
+            h *= d * c
+        if abs(d * c - 1) < eps:
+            break
+    return h
+
+
+def betainc(a, b, x):
+    """Regularized incomplete beta function I_x(a, b)."""
+    if x <= 0:
+        return 0.0
+    if x >= 1:
+        return 1.0
+    log_front = (math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b)
+                 + a * math.log(x) + b * math.log1p(-x))
+    if x < (a + 1) / (a + b + 2):
+        return math.exp(log_front) * _betacf(a, b, x) / a
+    return 1 - math.exp(log_front) * _betacf(b, a, 1 - x) / b
+
+
+def _entropy_rows(counts):
+    """Normalized Shannon entropy of each row of a count matrix."""
+    n = counts.sum(axis=1, keepdims=True)
+    p = np.divide(counts, n, out=np.zeros(counts.shape), where=n > 0)
+    h = 0.0 - np.sum(np.where(p > 0, p * np.log2(np.where(p > 0, p, 1)), 0), axis=1)
+    k = (counts > 0).sum(axis=1)
+    return h, np.divide(h, np.log2(k), out=np.zeros(len(h)), where=k > 1)
+
+
+def breakdown(subjects, correct=None, perturbed=None, matrix=None, slices=None, alpha=0.05):
+    """Per-subject and per-slice statistics.
+
+    correct   : (N,) 0/1 vector → accuracy and Wilson CI per group
+    perturbed : [(vector, name), ...] → accuracy drop vs `correct` per group
+                (name None → a single `accuracy_drop` column)
+    matrix    : (P, N) 0/1 matrix → ceiling / floor rates per group
+    Without any of them, reports subject counts, shares and (per slice) the
+    normalized entropy of its subject mix.
+    Returns {"subject": {name: stats}, "slice": {name: stats}}.
+    """
+    items, groups, names, kinds = group_index(subjects, slices)
+    G = len(names)
+    n = np.bincount(groups, minlength=G)
+    cols = {"items": n}
+
+    def per_group(values):
+        return np.bincount(groups, weights=np.asarray(values, dtype=float)[items], minlength=G)
+
+    if correct is not None:
+        k = per_group(correct)
+        lo, hi = wilson_interval(k, n, alpha)
+        acc = 100 * k / np.maximum(n, 1)
+        cols.update(accuracy=acc, ci_lower=100 * lo, ci_upper=100 * hi, ci_width=100 * (hi - lo))
+        for vec, name in perturbed or []:
+            col = "accuracy_drop" if name is None else f"accuracy_drop[{name}]"
+            cols[col] = acc - 100 * per_group(vec) / np.maximum(n, 1)
+    if matrix is not None:
+        d = np.nanmean(np.asarray(matrix, dtype=float), axis=0)
+        cols["ceiling_percentage"] = 100 * per_group(d == 1.0) / np.maximum(n, 1)
+        cols["floor_percentage"] = 100 * per_group(d == 0.0) / np.maximum(n, 1)
+    if correct is None and matrix is None:
+        n_subjects = len(names) - kinds.count("slice")
+        cols["share"] = 100 * n / max(len(subjects), 1)
+        # subject mix inside each group: counts over (group, subject) pairs
+        m = int((groups < n_subjects).sum())          # subject pairs come first
+        subject_of = np.zeros(len(subjects), dtype=np.int64)
+        subject_of[items[:m]] = groups[:m]
+        mix = np.bincount(groups * n_subjects + subject_of[items],
+                          minlength=G * n_subjects).reshape(G, n_subjects)
+        cols["entropy"], cols["normalized_entropy"] = _entropy_rows(mix)
+
+    out = {"subject": {}, "slice": {}}
+    for g, (name, kind) in enumerate(zip(names, kinds)):
+        row = {}
+        for col, values in cols.items():
+            v = values[g]
+            row[col] = int(v) if col == "items" else float(v)
+        out[kind][str(name)] = row
+    return out
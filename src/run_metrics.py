@@ -1,11 +1,17 @@
 import argparse
+import inspect
 import json
 import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
 from pathlib import Path
 import pandas as pd
 import numpy as np
 from src.utils.dataset import load_mmlu
-import importlib.util
+from src.utils.predictions import PredictionStore
+from src.utils.fingerprint import Fingerprinter
+from src.metrics.registry import available_metrics as registered_metrics, get_metric
 import sys
 from tabulate import tabulate
 from colorama import init, Fore, Style
@@ -31,6 +37,20 @@ def get_metric_params():
                 ("data/predictions/gpt4_noise.csv", "Surface noise"),
                 ("data/predictions/gpt4_shuffle.csv", "Distractor shuffle")
             ]
+        },
+        'difficulty_discrimination': {
+            'files': [
+                "data/predictions/gpt4_preds.csv",
+                "data/predictions/gpt4_paraphrase.csv",
+                "data/predictions/gpt4_noise.csv",
+                "data/predictions/gpt4_shuffle.csv"
+            ]
+        },
+        'power_ci': {
+            'pred_path': "data/predictions/gpt4_preds.csv",
+            'method': "bootstrap",
+            'n_boot': 1000,
+            'n_jobs': 1
         }
     }
 
@@ -45,88 +65,42 @@ def get_score_color(score):
     else:
         return Fore.RED
 
-def create_confidence_table(results):
-    """Create a confidence level table from metric results."""
-    # Define metric descriptions and their confidence levels
-    metric_info = {
-        'construct_validity': {
-            'description': 'Construct Validity',
-            'levels': {
-                3: 'Excellent construct validity (κ ≥ 0.8)',
-                2: 'Good construct validity (0.6 ≤ κ < 0.8)',
-                1: 'Fair construct validity (0.4 ≤ κ < 0.6)',
-                0: 'Poor construct validity (κ < 0.4)'
-            },
-            'metadata': lambda r: f"κ = {r.get('kappa', 'N/A'):.3f}" if r.get('kappa') is not None else "κ = N/A"
-        },
-        'coverage': {
-            'description': 'Coverage',
-            'levels': {
-                3: 'Excellent coverage (H/Hmax ≥ 0.90)',
-                2: 'Good coverage (0.75 ≤ H/Hmax < 0.90)',
-                1: 'Fair coverage (0.50 ≤ H/Hmax < 0.75)',
-                0: 'Poor coverage (H/Hmax < 0.50)'
-            },
-            'metadata': lambda r: f"H/Hmax = {r.get('normalized_score', 'N/A'):.3f}" if r.get('normalized_score') is not None else "H/Hmax = N/A"
-        },
-        'external_validity': {
-            'description': 'External Validity',
-            'levels': {
-                3: 'Excellent external validity (gap ≤ 2pp)',
-                2: 'Good external validity (2pp < gap ≤ 5pp)',
-                1: 'Fair external validity (5pp < gap ≤ 10pp)',
-                0: 'Poor external validity (gap > 10pp)'
-            },
-            'metadata': lambda r: f"Gap = {r.get('accuracy_gap', 'N/A'):.1f}pp" if r.get('accuracy_gap') is not None else "Gap = N/A"
-        },
-        'difficulty_discrimination': {
-            'description': 'Difficulty & Discrimination',
-            'levels': {
-                3: 'Excellent difficulty range (< 5% ceiling/floor)',
-                2: 'Good difficulty range (5-10% ceiling/floor)',
-                1: 'Fair difficulty range (10-20% ceiling/floor)',
-                0: 'Poor difficulty range (> 20% ceiling/floor)'
-            },
-            'metadata': lambda r: f"{r.get('ceiling_percentage', 'N/A'):.1f}% ceiling, {r.get('floor_percentage', 'N/A'):.1f}% floor" if r.get('ceiling_percentage') is not None and r.get('floor_percentage') is not None else "N/A"
-        },
-        'robustness': {
-            'description': 'Robustness',
-            'levels': {
-                3: 'Excellent robustness (drop ≤ 2pp)',
-                2: 'Good robustness (2pp < drop ≤ 5pp)',
-                1: 'Fair robustness (5pp < drop ≤ 10pp)',
-                0: 'Poor robustness (drop > 10pp)'
-            },
-            'metadata': lambda r: f"Drop = {r.get('accuracy_drop', 'N/A'):.1f}pp" if r.get('accuracy_drop') is not None else "Drop = N/A"
-        },
-        'power_ci': {
-            'description': 'Power',
-            'levels': {
-                3: 'Excellent power (CI width ≤ 2pp)',
-                2: 'Good power (2pp < CI width ≤ 5pp)',
-                1: 'Fair power (5pp < CI width ≤ 10pp)',
-                0: 'Poor power (CI width > 10pp)'
-            },
-            'metadata': lambda r: f"CI width = {r.get('ci_width', 'N/A'):.1f}pp, Accuracy = {r.get('accuracy', 'N/A'):.1f}%" if r.get('ci_width') is not None and r.get('accuracy') is not None else "N/A"
-        }
+def in_table(metric):
+    """Whether a metric has a 0-3 rubric and so a confidence table row."""
+    try:
+        return get_metric(metric)['levels'] is not None
+    except KeyError:
+        return False
+
+def table_row(metric, result):
+    """Format one metric result as a confidence table row."""
+    info = get_metric(metric)
+    score = result.get('score', 0)
+    try:
+        metadata = info['metadata'](result)
+    except Exception as e:
+        print(f"Error formatting metadata for {metric}: {e}")
+        metadata = "N/A"
+    return {
+        'Metric': info['description'],
+        'Score': score,
+        'Confidence Level': info['levels'][score],
+        'Metadata': metadata
     }
 
+def print_row(metric, result):
+    """Stream one finished metric to the console as soon as it is available."""
+    if not in_table(metric):
+        return
+    row = table_row(metric, result)
+    score_color = get_score_color(row['Score'])
+    print(f"{Fore.CYAN}✓ {row['Metric']}{Style.RESET_ALL}: "
+          f"{score_color}{row['Score']} / 3 — {row['Confidence Level']} ({row['Metadata']}){Style.RESET_ALL}")
+
+def create_confidence_table(results):
+    """Create a confidence level table from metric results."""
     # Create the table
-    table_data = []
-    for metric, info in metric_info.items():
-        if metric in results:
-            score = results[metric].get('score', 0)
-            try:
-                metadata = info['metadata'](results[metric])
-            except Exception as e:
-                print(f"Error formatting metadata for {metric}: {e}")
-                metadata = "N/A"
-            table_data.append({
-                'Metric': info['description'],
-                'Score': score,
-                'Confidence Level': info['levels'][score],
-                'Metadata': metadata
-            })
+    table_data = [table_row(metric, result) for metric, result in results.items() if in_table(metric)]
 
     # Convert to DataFrame
     df = pd.DataFrame(table_data)
@@ -154,25 +128,150 @@ def create_confidence_table(results):
     
     return df
 
-def run_metric(metric_name, params=None):
-    """Run a metric and get its results."""
-    # Get the path to the metric script
-    script_path = os.path.join('src', 'metrics', f'{metric_name}.py')
-    
-    # Load the module
-    spec = importlib.util.spec_from_file_location(metric_name, script_path)
-    module = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(module)
-    
+def run_metric(metric_name, params=None, store=None):
+    """Run a metric and get its results.
+
+    With a PredictionStore, file paths in `params` are replaced by vectors
+    loaded once and shared across metrics.
+    """
     # Run the metric and get results
     try:
-        if params and hasattr(module.main, '__code__') and module.main.__code__.co_argcount > 0:
-            return module.main(**params.get(metric_name, {}))
-        return module.main()
+        metric = get_metric(metric_name)          # imported once, on first use
+        metric_params = {k: v for k, v in (params or {}).get(metric_name, {}).items()
+                         if k in metric['inputs']}
+        if store is not None:
+            metric_params = store.resolve(metric_params)
+        result = metric['main'](**metric_params)
     except Exception as e:
         print(f"Error running {metric_name}: {str(e)}")
         return None
 
+    missing = [k for k in metric['outputs'] if k not in (result or {})]
+    if missing:
+        print(f"Warning: {metric_name} result is missing {', '.join(missing)}")
+    return result
+
+def metric_fingerprint(metric_name, params, fp):
+    """Hash of a metric's input file contents, parameters, code and dependencies.
+
+    Inputs left to main()'s defaults (e.g. coverage's data_path) are hashed too.
+    """
+    spec = get_metric(metric_name)
+    defaults = {k: p.default for k, p in inspect.signature(spec['main']).parameters.items()
+                if k in spec['inputs'] and p.default is not inspect.Parameter.empty}
+    metric_params = {**defaults, **{k: v for k, v in params.get(metric_name, {}).items()
+                                    if k in spec['inputs']}}
+    return fp.digest(metric=metric_name,
+                     params=fp.value(metric_params),
+                     code=fp.code(spec['main']),
+                     deps={d: metric_fingerprint(d, params, fp) for d in spec['deps']})
+
+def load_cached_result(output_dir, metric_name, fingerprint):
+    """Previously saved result of a metric if it was computed from the same fingerprint."""
+    result_file = os.path.join(output_dir, f"{metric_name}_result.json")
+    fp_file = os.path.join(output_dir, f".{metric_name}.fingerprint")
+    try:
+        with open(fp_file) as f:
+            if f.read().strip() != fingerprint:
+                return None
+        with open(result_file) as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+def _submit_thread(fn, *args):
+    """Run fn(*args) on a daemon thread so a timed-out metric cannot block exit."""
+    future = Future()
+
+    def target():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=target, daemon=True).start()
+    return future
+
+def run_scheduled(metrics, params, store=None, on_result=None, max_workers=None, timeout=None,
+                  done=None):
+    """Run metrics concurrently, respecting their registered deps and timeouts.
+
+    `done` holds results already available (e.g. cached) that deps may rely on.
+    `on_result(metric, result)` is called as each metric finishes. Returns
+    ({metric: result} for the metrics that succeeded, [timed-out metrics]).
+    Timed-out process-pool metrics are terminated; timed-out thread metrics
+    cannot be killed and are abandoned.
+    """
+    pending = list(metrics)
+    running = {}                 # future -> (metric, deadline)
+    results, finished, timed_out = dict(done or {}), set(done or {}), []
+    procs = ProcessPoolExecutor(max_workers=max_workers)
+    try:
+        while pending or running:
+            for metric in [m for m in pending if set(get_metric(m)['deps']) <= finished]:
+                pending.remove(metric)
+                spec = get_metric(metric)
+                if any(d not in results for d in spec['deps']):
+                    print(f"Skipping {metric}: a dependency failed")
+                    finished.add(metric)
+                    continue
+                try:
+                    metric_params = params.get(metric, {})
+                    if store is not None:
+                        metric_params = store.resolve(metric_params)
+                except Exception as e:
+                    print(f"Error running {metric}: {str(e)}")
+                    finished.add(metric)
+                    continue
+                print(f"Running {metric} ({spec['kind']})...")
+                args = (metric, {metric: metric_params})
+                future = _submit_thread(run_metric, *args) if spec['kind'] == 'io' \
+                    else procs.submit(run_metric, *args)
+                running[future] = (metric, time.monotonic() + (timeout or spec['timeout']))
+
+            if not running:
+                continue
+            next_deadline = min(deadline for _, deadline in running.values())
+            done, _ = wait(running, timeout=max(0.0, next_deadline - time.monotonic()),
+                           return_when=FIRST_COMPLETED)
+            for future in done:
+                metric, _ = running.pop(future)
+                finished.add(metric)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"Error running {metric}: {str(e)}")
+                    continue
+                if result is not None:
+                    results[metric] = result
+                    if on_result is not None:
+                        on_result(metric, result)
+
+            now = time.monotonic()
+            for future, (metric, deadline) in list(running.items()):
+                if now >= deadline:
+                    print(f"Timed out: {metric} (> {timeout or get_metric(metric)['timeout']}s)")
+                    future.cancel()
+                    running.pop(future)
+                    finished.add(metric)
+                    timed_out.append(metric)
+    finally:
+        stuck = bool(running) or bool(timed_out)
+        workers = list((getattr(procs, '_processes', None) or {}).values())  # shutdown clears it
+        if stuck:
+            for p in workers:
+                p.terminate()
+        procs.shutdown(wait=not stuck, cancel_futures=True)
+        if stuck:
+            for p in workers:
+                p.join(timeout=5)
+                if p.is_alive():
+                    p.kill()
+                    p.join()
+    return results, timed_out
+
 def main():
     parser = argparse.ArgumentParser(description='Run benchmark metrics')
     parser.add_argument('--metrics', type=str, nargs='+',
@@ -187,22 +286,41 @@ def main():
                       help='Path to perturbed predictions file (default: data/predictions/gpt4_paraphrase.csv)')
     parser.add_argument('--pert-files', type=str, nargs='+',
                       help='Additional perturbation files for robustness_multi (default: gpt4_paraphrase.csv gpt4_noise.csv gpt4_shuffle.csv)')
+    parser.add_argument('--matrix', type=str, default=None,
+                      help='Correctness tensor from run_matrix; feeds difficulty_discrimination and robustness_multi')
+    parser.add_argument('--matrix-model', type=str, default=None,
+                      help='Model of --matrix used by robustness_multi (default: first)')
+    parser.add_argument('--irt', choices=['auto', 'off', '1pl', '2pl'], default='auto',
+                      help='IRT fit for difficulty_discrimination (auto: 2PL with >= 8 response vectors)')
+    parser.add_argument('--ci-method', type=str, default='bootstrap',
+                      choices=['bootstrap', 'wilson', 'clopper_pearson'],
+                      help='Confidence interval method for power_ci (default: bootstrap)')
+    parser.add_argument('--n-boot', type=int, default=1000,
+                      help='Bootstrap resamples for power_ci and the paired robustness CIs (default: 1000)')
+    parser.add_argument('--n-jobs', type=int, default=1,
+                      help='Worker processes for bootstrap resampling (default: 1)')
+    parser.add_argument('--jobs', type=int, default=None,
+                      help='Worker processes for CPU-bound metrics (default: CPU count)')
+    parser.add_argument('--timeout', type=float, default=None,
+                      help='Per-metric timeout in seconds (default: per-metric setting)')
+    parser.add_argument('--sequential', action='store_true',
+                      help='Run metrics one after another in this process')
+    parser.add_argument('--breakdown', action='store_true',
+                      help='Also report per-subject and per-slice results')
+    parser.add_argument('--slices', type=str, default='config/slices.json',
+                      help='JSON file of named subject slices for --breakdown (default: config/slices.json)')
+    parser.add_argument('--base-url', type=str, default=None,
+                      help='OpenAI-compatible endpoint for construct_validity, e.g. the stub server (default: $BCR_BASE_URL)')
+    parser.add_argument('--force', action='store_true',
+                      help='Recompute every metric even if its inputs, parameters and code are unchanged')
     
     args = parser.parse_args()
     
     # Create output directory if it doesn't exist
     os.makedirs(args.output_dir, exist_ok=True)
     
-    # Define available metrics
-    available_metrics = [
-        'construct_validity',
-        'coverage',
-        'external_validity',
-        'difficulty_discrimination',
-        'robustness',
-        'robustness_multi',
-        'power_ci'
-    ]
+    # Built-in metrics plus any registered through the "bcr.metrics" entry point
+    available_metrics = registered_metrics()
     
     # Determine which metrics to run
     metrics_to_run = args.metrics if args.metrics else available_metrics
@@ -215,7 +333,15 @@ def main():
     })
     params['robustness'].update({
         'orig_path': args.pred_path,
-        'pert_path': args.pert_path
+        'pert_path': args.pert_path,
+        'n_boot': args.n_boot
+    })
+    params['robustness_multi']['n_boot'] = args.n_boot
+    params['power_ci'].update({
+        'pred_path': args.pred_path,
+        'method': args.ci_method,
+        'n_boot': args.n_boot,
+        'n_jobs': args.n_jobs
     })
     
     # Update robustness_multi pairs if pert-files provided
@@ -224,29 +350,76 @@ def main():
         params['robustness_multi']['pairs'] = [(args.pred_path, "Original")] + [
             (f, n) for f, n in zip(args.pert_files, pert_names)
         ]
+        params['difficulty_discrimination']['files'] = [args.pred_path] + args.pert_files
+
+    if args.matrix:
+        params['robustness_multi'] = {'matrix': args.matrix, 'model': args.matrix_model,
+                                      'n_boot': args.n_boot}
+        params['difficulty_discrimination'] = {'matrix': args.matrix}
+    params['difficulty_discrimination']['irt'] = args.irt
+    if args.base_url:
+        params.setdefault('construct_validity', {})['base_url'] = args.base_url
     
+    if args.breakdown:
+        for metric in ['coverage', 'external_validity', 'difficulty_discrimination',
+                       'robustness', 'robustness_multi', 'power_ci']:
+            params.setdefault(metric, {}).update({'breakdown': True, 'slices': args.slices})
+            if metric != 'coverage':
+                params[metric]['data_path'] = args.data_path
+
+    # Each prediction file / dataset is read once and shared by all metrics
+    store = PredictionStore(data_path=args.data_path)
+
     # Run each metric
-    results = {}
+    unknown = [m for m in metrics_to_run if m not in available_metrics]
+    for metric in unknown:
+        print(f"Warning: Unknown metric '{metric}', skipping...")
+    metrics_to_run = [m for m in metrics_to_run if m in available_metrics]
+
+    # Skip metrics whose inputs, parameters and code match the saved result
+    fp = Fingerprinter(args.output_dir)
+    fingerprints, cached = {}, {}
     for metric in metrics_to_run:
-        if metric not in available_metrics:
-            print(f"Warning: Unknown metric '{metric}', skipping...")
-            continue
-            
-        print(f"\nRunning {metric}...")
         try:
-            result = run_metric(metric, params)
-            if result is not None:
-                results[metric] = result
-                
-                # Save individual metric result
-                output_file = os.path.join(args.output_dir, f"{metric}_result.json")
-                with open(output_file, 'w') as f:
-                    json.dump(result, f, indent=2)
-                    
+            fingerprints[metric] = metric_fingerprint(metric, params, fp)
         except Exception as e:
-            print(f"Error running {metric}: {str(e)}")
+            print(f"Warning: cannot fingerprint {metric} ({e}); it will be rerun")
             continue
-    
+        result = None if args.force else load_cached_result(args.output_dir, metric,
+                                                             fingerprints[metric])
+        if result is not None:
+            cached[metric] = result
+    fp.save()
+    for metric, result in cached.items():
+        print(f"Up to date: {metric}")
+        print_row(metric, result)
+
+    def save_result(metric, result):
+        """Save individual metric result and stream it to the console."""
+        output_file = os.path.join(args.output_dir, f"{metric}_result.json")
+        with open(output_file, 'w') as f:
+            json.dump(result, f, indent=2)
+        if metric in fingerprints:
+            with open(os.path.join(args.output_dir, f".{metric}.fingerprint"), 'w') as f:
+                f.write(fingerprints[metric])
+        print_row(metric, result)
+
+    timed_out = []
+    if args.sequential:
+        results = dict(cached)
+        for metric in [m for m in metrics_to_run if m not in cached]:
+            print(f"\nRunning {metric}...")
+            result = run_metric(metric, params, store)
+            if result is not None:
+                results[metric] = result
+                save_result(metric, result)
+    else:
+        results, timed_out = run_scheduled([m for m in metrics_to_run if m not in cached],
+                                           params, store, on_result=save_result,
+                                           max_workers=args.jobs, timeout=args.timeout,
+                                           done=cached)
+    results = {m: results[m] for m in metrics_to_run if m in results}   # stable order
+
     # Save combined results
     combined_output = os.path.join(args.output_dir, "all_metrics_results.json")
     with open(combined_output, 'w') as f:
@@ -259,5 +432,10 @@ def main():
         confidence_table.to_csv(table_output, index=False)
         print(f"\nResults saved to {args.output_dir}")
 
+    if timed_out:
+        # timed-out worker processes are already terminated; abandoned io
+        # metrics run on daemon threads and do not hold up exit
+        raise SystemExit(f"Timed out: {', '.join(timed_out)}")
+
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,254 @@
+"""Stability of the offline BCR scores under stratified subsampling.
+
+Every offline metric (coverage, external validity, difficulty & discrimination,
+robustness, power) is re-scored on many stratified subsamples of the scored
+items at several fractions, from the existing correctness vectors only; no
+API calls are made. For each metric and fraction the sweep reports the score
+distribution and how often it agrees with the full-data score, and picks the
+smallest fraction from which the rubric is stable.
+
+Each (fraction, block of samples) task gathers the block's (P, m, n)
+correctness slice once and computes every statistic for all m samples with
+whole-array operations; tasks are spread over a process pool.
+"""
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from tabulate import tabulate
+from src.utils.dataset import stratified_indices
+from src.utils.predictions import CorrectnessMatrix, PredictionStore
+from src.metrics import coverage, difficulty_discrimination, external_validity, power_ci, robustness
+from src.metrics.slices import _entropy_rows, subjects_for, wilson_interval
+
+FRACTIONS = [0.01, 0.02, 0.05, 0.10, 1.0]
+PERT_NAMES = ["Paraphrased", "Surface noise", "Distractor shuffle"]
+SWEEP_BLOCK_CELLS = 1 << 25          # correctness cells gathered per task
+VALUE_KEYS = {                       # statistic behind each rubric, as in the metric results
+    "coverage": "normalized_score",
+    "external_validity": "accuracy_gap",
+    "difficulty_discrimination": "total_percentage",
+    "power_ci": "ci_width",
+    "robustness": "accuracy_drop",
+    "robustness_multi": "accuracy_drop",
+}
+
+
+def _scores(rubric, values):
+    return np.array([rubric(v) for v in values.tolist()], dtype=np.int64)
+
+
+def score_samples(inputs, idx, ci_method="bootstrap", n_boot=1000, seed=42):
+    """{metric: (values, scores)} for each row of `idx` (m, n) of item positions.
+
+    `inputs` holds X (P, N) correctness with the baseline first, names of the
+    P − 1 perturbations, integer subject codes, the STEM mask and the
+    ceiling/floor mask of every item.
+    """
+    X, codes, stem, extreme = inputs["X"], inputs["codes"], inputs["stem"], inputs["extreme"]
+    m, n = idx.shape
+    C = X[:, idx]                                         # (P, m, n)
+    acc = 100 * C.sum(axis=2) / n                         # (P, m)
+    out = {}
+
+    K = int(codes.max()) + 1
+    counts = np.bincount((np.arange(m)[:, None] * K + codes[idx]).ravel(),
+                         minlength=m * K).reshape(m, K)
+    _, h_norm = _entropy_rows(counts)
+    out["coverage"] = (h_norm, _scores(coverage.rubric, h_norm))
+
+    s = stem[idx]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        acc_stem = 100 * (C[0] * s).sum(axis=1) / s.sum(axis=1)
+        acc_non = 100 * (C[0] * ~s).sum(axis=1) / (~s).sum(axis=1)
+    gap = np.abs(acc_stem - acc_non)
+    out["external_validity"] = (gap, _scores(external_validity.rubric, gap))
+
+    pct = 100 * extreme[idx].mean(axis=1)
+    out["difficulty_discrimination"] = (pct, _scores(difficulty_discrimination.rubric, pct))
+
+    k = C[0].sum(axis=1)
+    if ci_method == "bootstrap":
+        # resampled mean of a 0/1 vector is Binomial(n, p̂) / n, as in power_ci
+        boots = np.random.default_rng(seed).binomial(n, k[:, None] / n, size=(m, n_boot)) / n
+        lo, hi = np.percentile(boots, [2.5, 97.5], axis=1)
+    elif ci_method == "wilson":
+        lo, hi = wilson_interval(k, n)
+    else:
+        lo, hi = np.array([power_ci.clopper_pearson_ci(int(x), n) for x in k.tolist()]).T
+    out["power_ci"] = (100 * (hi - lo), _scores(power_ci.score_from_width, hi - lo))
+
+    for p, name in enumerate(inputs["names"], start=1):
+        drop = acc[0] - acc[p]
+        key = "robustness" if p == 1 else f"robustness_multi[{name}]"
+        out[key] = (drop, _scores(robustness.rubric, drop))
+        if p == 1 and len(inputs["names"]) > 1:
+            out[f"robustness_multi[{name}]"] = out[key]
+    return out
+
+
+def _sweep_block(inputs, fraction, n, n_samples, seed_seq, ci_method, n_boot):
+    sample_seed, boot_seed = seed_seq.spawn(2)
+    if n == len(inputs["codes"]):
+        idx = np.arange(n)[None, :]                       # the full set: one "sample"
+    else:
+        idx = stratified_indices(inputs["codes"], n=n, seed=sample_seed, n_samples=n_samples)
+    return fraction, score_samples(inputs, idx, ci_method, n_boot, boot_seed)
+
+
+def sweep(inputs, fractions=FRACTIONS, n_samples=200, seed=42, ci_method="bootstrap",
+          n_boot=1000, n_jobs=1):
+    """{fraction: {metric: (values, scores)}} over `n_samples` subsamples per fraction.
+
+    Samples are drawn in blocks with their own child of SeedSequence(seed), so
+    results depend on the seed, not on `n_jobs`.
+    """
+    N = len(inputs["codes"])
+    P = len(inputs["X"])
+    block = max(1, SWEEP_BLOCK_CELLS // (P * N))
+    tasks = []
+    for fraction, ss in zip(fractions, np.random.SeedSequence(seed).spawn(len(fractions))):
+        n = N if fraction >= 1 else max(1, int(round(fraction * N)))
+        total = 1 if n == N else n_samples
+        sizes = [min(block, total - start) for start in range(0, total, block)]
+        tasks += [(fraction, n, size, child) for size, child in zip(sizes, ss.spawn(len(sizes)))]
+
+    args = [(inputs, f, n, size, child, ci_method, n_boot) for f, n, size, child in tasks]
+    if n_jobs > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            parts = list(pool.map(_sweep_block, *zip(*args)))
+    else:
+        parts = [_sweep_block(*a) for a in args]
+
+    results = {}
+    for fraction, block_out in parts:
+        acc = results.setdefault(fraction, {})
+        for metric, (values, scores) in block_out.items():
+            v, s = acc.get(metric, (np.empty(0), np.empty(0, dtype=np.int64)))
+            acc[metric] = (np.concatenate([v, values]), np.concatenate([s, scores]))
+    return results
+
+
+def summarize(results, n_items, stability=0.95):
+    """Score distributions per fraction and the smallest stable fraction per metric.
+
+    A fraction is stable for a metric when at least `stability` of its
+    subsamples get the full-data score, and so is every larger fraction.
+    """
+    fractions = sorted(results)
+    full = results[fractions[-1]]
+    report = {"items": int(n_items), "stability": stability, "full_scores": {},
+              "fractions": {}, "stable_fraction": {}}
+    for metric, (_, scores) in full.items():
+        report["full_scores"][metric] = int(scores[0])
+    for f in fractions:
+        entry = {"items": int(max(1, round(f * n_items)) if f < 1 else n_items), "metrics": {}}
+        for metric, (values, scores) in results[f].items():
+            finite = values[np.isfinite(values)]
+            q = np.percentile(finite, [5, 50, 95]).tolist() if len(finite) else [None] * 3
+            entry["metrics"][metric] = {
+                "samples": int(len(scores)),
+                "score_distribution": {str(s): int((scores == s).sum()) for s in range(4)},
+                "mean_score": float(scores.mean()),
+                "agreement": float((scores == report["full_scores"][metric]).mean()),
+                VALUE_KEYS.get(metric.split("[")[0], "value"): {
+                    "mean": float(finite.mean()) if len(finite) else None,
+                    "p5": q[0], "p50": q[1], "p95": q[2],
+                },
+            }
+        report["fractions"][str(f)] = entry
+    for metric in full:
+        stable = None
+        for f in reversed(fractions):
+            if report["fractions"][str(f)]["metrics"][metric]["agreement"] < stability:
+                break
+            stable = f
+        report["stable_fraction"][metric] = stable
+    return report
+
+
+def load_inputs(pred_path, pert_files, data_path, matrix=None, matrix_model=None):
+    """Correctness vectors and per-item masks for the sweep, on the items every input covers."""
+    if matrix is not None:
+        cm = CorrectnessMatrix.load(matrix)
+        X = cm.model(matrix_model)                     # NaN = missing cell
+        keep = ~np.isnan(X).any(axis=0)                # present in every variant
+        subjects = subjects_for(data_path, X.shape[1], cm.item_ids)[keep]
+        X = X[:, keep].astype(np.uint8)
+        names = cm.variants[1:]
+        d = X.mean(axis=0)
+    else:
+        store = PredictionStore(data_path=data_path)
+        paths = [pred_path] + list(pert_files)
+        keep = np.logical_and.reduce([store.present(p) for p in paths])
+        X = store.stack(paths)[:, keep]
+        names = [n for n, _ in zip(PERT_NAMES, pert_files)]
+        d = X.mean(axis=0)
+        subjects = store.dataset(data_path)["subject"].to_numpy()[keep]
+    known = np.array([s is not None and s == s for s in subjects])
+    codes = np.unique(subjects[known].astype(str), return_inverse=True)[1]
+    return {
+        "X": X[:, known],
+        "names": list(names),
+        "codes": codes.astype(np.int64),
+        "stem": np.isin(subjects[known], list(external_validity.STEM_SUBJECTS)),
+        "extreme": ((d == 0.0) | (d == 1.0))[known],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pred-path', default="data/predictions/gpt4_preds.csv")
+    parser.add_argument('--pert-files', nargs='+', default=[
+        "data/predictions/gpt4_paraphrase.csv",
+        "data/predictions/gpt4_noise.csv",
+        "data/predictions/gpt4_shuffle.csv"])
+    parser.add_argument('--data-path', default="data/raw/mmlu_test_sampled_0.02.csv")
+    parser.add_argument('--matrix', default=None,
+                        help='CorrectnessMatrix instead of prediction files (variants of --matrix-model)')
+    parser.add_argument('--matrix-model', default=None)
+    parser.add_argument('--fractions', type=float, nargs='+', default=FRACTIONS,
+                        help='Subsample sizes as fractions of the scored items (1.0 is always added)')
+    parser.add_argument('--n-samples', type=int, default=200, help='Subsamples per fraction')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--ci-method', choices=['bootstrap', 'wilson', 'clopper_pearson'],
+                        default='bootstrap')
+    parser.add_argument('--n-boot', type=int, default=1000)
+    parser.add_argument('--stability', type=float, default=0.95,
+                        help='Share of subsamples that must match the full-data score')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count())
+    parser.add_argument('--out', default="data/metrics_results/stability.json")
+    args = parser.parse_args()
+
+    inputs = load_inputs(args.pred_path, args.pert_files, args.data_path,
+                         args.matrix, args.matrix_model)
+    N = len(inputs["codes"])
+    fractions = sorted(set(args.fractions) | {1.0})
+    print(f"Sweeping {N} items × {len(inputs['X'])} vectors: fractions {fractions}, "
+          f"{args.n_samples} samples each")
+    results = sweep(inputs, fractions, n_samples=args.n_samples, seed=args.seed,
+                    ci_method=args.ci_method, n_boot=args.n_boot, n_jobs=args.jobs)
+    report = summarize(results, N, stability=args.stability)
+
+    rows = []
+    for metric, full in report["full_scores"].items():
+        row = [metric, full]
+        for f in fractions:
+            st = report["fractions"][str(f)]["metrics"][metric]
+            row.append(f"{100 * st['agreement']:.0f}% ({st['mean_score']:.2f})")
+        stable = report["stable_fraction"][metric]
+        rows.append(row + ["—" if stable is None else f"{stable:g}"])
+    headers = ["Metric", "Full"] + [f"{f:g} (n={report['fractions'][str(f)]['items']})"
+                                    for f in fractions] + ["Stable from"]
+    print("\nAgreement with the full-data score (mean score):")
+    print(tabulate(rows, headers=headers, tablefmt="simple"))
+
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 """Utility functions for the benchmark."""
 from .dataset import load_mmlu
-from .perturb import inject_noise, shuffle_choices
+from .perturb import inject_noise, inject_noise_batch, shuffle_choices
 
-__all__ = ['load_mmlu', 'inject_noise', 'shuffle_choices'] 
\ No newline at end of file
+__all__ = ['load_mmlu', 'inject_noise', 'inject_noise_batch', 'shuffle_choices'] 
\ No newline at end of file
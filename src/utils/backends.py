@@ -0,0 +1,268 @@
+# backends.py
+"""Model backends: one chat interface over OpenAI, OpenAI-compatible servers and local callables.
+
+    backend = make_backend()                               # OpenAI, or $BCR_BASE_URL if set
+    backend = make_backend("http://localhost:8000/v1")     # vLLM, llama.cpp, the stub server
+    backend = make_backend("my_pkg.model:generate")        # in-process callable
+    reply = await backend.achat(model, messages, temperature=0, max_tokens=4)
+
+Retries, timeouts and rate limits are handled here for every backend:
+transient failures (429, 5xx, timeouts, dropped connections) are retried
+with full-jitter exponential back-off, a 429's Retry-After is honoured, a
+RateLimiter is charged before each attempt, and request failures that
+persist (or are not transient, e.g. 400/401) are raised as BackendError.
+Anything else, such as a bug in a local callable, propagates unchanged.
+HTTP backends in a process share one pooled client per event loop
+(keep-alive, HTTP/2 when `h2` is installed), so thousands of requests reuse
+a handful of connections.
+"""
+import asyncio
+import importlib
+import importlib.util
+import inspect
+import random
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import NamedTuple
+import openai
+from src.utils.endpoint import resolve_api_key, resolve_base_url
+
+MAX_RETRIES = 3          # attempts per request
+TIMEOUT     = 60.0       # seconds per attempt
+BASE_DELAY  = 1.0        # back-off: uniform(0, min(MAX_DELAY, BASE_DELAY * 2**attempt))
+MAX_DELAY   = 30.0
+HTTP2       = importlib.util.find_spec("h2") is not None
+
+_sync_http = None
+_async_http = weakref.WeakKeyDictionary()     # event loop → pooled client
+_http_lock = threading.Lock()
+REPLAY_KEY = "replay"                          # placeholder key, never sent
+
+
+class BackendError(Exception):
+    """A request that failed for good (non-transient error or retries exhausted)."""
+
+
+class Reply(NamedTuple):
+    content: str | None
+    prompt_tokens: int | None = None
+    completion_tokens: int | None = None
+
+
+def http_client(asynchronous=True):
+    """The shared pooled HTTP client (one per event loop for async use)."""
+    global _sync_http
+    with _http_lock:
+        if not asynchronous:
+            if _sync_http is None:
+                _sync_http = openai.DefaultHttpxClient(http2=HTTP2)
+            return _sync_http
+        loop = asyncio.get_running_loop()
+        if loop not in _async_http:
+            _async_http[loop] = openai.DefaultAsyncHttpxClient(http2=HTTP2)
+        return _async_http[loop]
+
+
+def _retry_after(error):
+    """Seconds from a Retry-After header on the error's response, if any."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class Backend:
+    """Shared retry / timeout / rate-limit handling; subclasses make one attempt.
+
+    Subclasses implement `_call` and `_acall(model, messages, temperature,
+    max_tokens, **extra) -> Reply`, list their request errors in `fail_on`
+    and the transient ones among them in `retry_on`. `stats` counts calls,
+    retries, 429s and failures.
+    """
+    retry_on = (TimeoutError, asyncio.TimeoutError)
+    fail_on = retry_on
+    rate_limited_on = ()
+
+    def __init__(self, max_retries=MAX_RETRIES, timeout=TIMEOUT):
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.stats = {"calls": 0, "retries": 0, "rate_limited": 0, "failures": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _delay(self, attempt, error):
+        delay = random.uniform(0, min(MAX_DELAY, BASE_DELAY * 2 ** attempt))
+        if isinstance(error, self.rate_limited_on):
+            self._count("rate_limited")
+            delay = max(delay, _retry_after(error) or 0.0)
+        return delay
+
+    def _attempts(self):
+        """Yield attempt numbers; the caller sleeps / re-raises between them."""
+        for attempt in range(1, self.max_retries + 1):
+            self._count("calls" if attempt == 1 else "retries")
+            yield attempt
+
+    def _give_up(self, error):
+        self._count("failures")
+        raise BackendError(f"{type(error).__name__}: {error}") from error
+
+    def chat(self, model, messages, temperature=0.0, max_tokens=None, **extra):
+        """One chat completion, retried on transient errors; returns a Reply."""
+        for attempt in self._attempts():
+            try:
+                return self._call(model, messages, temperature, max_tokens, **extra)
+            except self.fail_on as e:
+                if not isinstance(e, self.retry_on) or attempt == self.max_retries:
+                    self._give_up(e)
+                time.sleep(self._delay(attempt, e))
+
+    async def achat(self, model, messages, temperature=0.0, max_tokens=None, limiter=None,
+                    **extra):
+        """Async chat; `limiter` (RateLimiter / LimiterChain) is charged per attempt."""
+        tokens = sum(len(str(m.get("content", ""))) for m in messages) // 4 + (max_tokens or 0)
+        for attempt in self._attempts():
+            if limiter is not None:
+                await limiter.acquire(tokens)
+            try:
+                return await self._acall(model, messages, temperature, max_tokens, **extra)
+            except self.fail_on as e:
+                if not isinstance(e, self.retry_on) or attempt == self.max_retries:
+                    self._give_up(e)
+                await asyncio.sleep(self._delay(attempt, e))
+
+
+class OpenAIBackend(Backend):
+    """The OpenAI chat-completions API (or any server speaking it, see below)."""
+    retry_on = (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError,
+                openai.InternalServerError)
+    fail_on = openai.APIError                 # HTTP status, connection and timeout errors
+    rate_limited_on = openai.RateLimitError
+
+    def __init__(self, base_url=None, api_key=None, **kwargs):
+        super().__init__(**kwargs)
+        self.base_url = base_url
+        self.api_key = api_key or resolve_api_key(base_url)
+        self._client = None
+        self._aclients = weakref.WeakKeyDictionary()
+
+    def _options(self, http):
+        return {"api_key": self.api_key, "base_url": self.base_url, "timeout": self.timeout,
+                "max_retries": 0, "http_client": http}        # retries handled by Backend
+
+    def _call(self, model, messages, temperature, max_tokens, **extra):
+        if self._client is None:
+            self._client = openai.OpenAI(**self._options(http_client(asynchronous=False)))
+        resp = self._client.chat.completions.create(model=model, messages=messages,
+                                                    temperature=temperature,
+                                                    max_tokens=max_tokens, **extra)
+        return self._reply(resp)
+
+    async def _acall(self, model, messages, temperature, max_tokens, **extra):
+        loop = asyncio.get_running_loop()
+        client = self._aclients.get(loop)
+        if client is None:
+            client = self._aclients[loop] = openai.AsyncOpenAI(**self._options(http_client()))
+        resp = await client.chat.completions.create(model=model, messages=messages,
+                                                    temperature=temperature,
+                                                    max_tokens=max_tokens, **extra)
+        return self._reply(resp)
+
+    @staticmethod
+    def _reply(resp):
+        usage = getattr(resp, "usage", None)
+        return Reply(resp.choices[0].message.content,
+                     getattr(usage, "prompt_tokens", None),
+                     getattr(usage, "completion_tokens", None))
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.base_url or 'api.openai.com'})"
+
+
+class OpenAICompatibleBackend(OpenAIBackend):
+    """A local or third-party OpenAI-compatible server at `base_url`; no key needed."""
+
+    def __init__(self, base_url, api_key=None, **kwargs):
+        super().__init__(base_url=base_url, api_key=api_key or resolve_api_key(base_url), **kwargs)
+
+
+class CallableBackend(Backend):
+    """An in-process model: `fn(messages, model=, temperature=, max_tokens=, **extra)`.
+
+    `fn` returns the reply text (or a Reply) and may be a coroutine function;
+    a plain function runs in a worker thread so it does not block the caller
+    and can be timed out. Only timeouts are retried; exceptions raised by
+    `fn` itself propagate.
+    """
+
+    def __init__(self, fn, **kwargs):
+        super().__init__(**kwargs)
+        self.fn = fn
+        self._pool = None
+
+    def _call(self, model, messages, temperature, max_tokens, **extra):
+        kwargs = dict(model=model, temperature=temperature, max_tokens=max_tokens, **extra)
+        if inspect.iscoroutinefunction(self.fn):
+            return self._reply(asyncio.run(asyncio.wait_for(self.fn(messages, **kwargs),
+                                                            self.timeout)))
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(thread_name_prefix="callable-backend")
+        future = self._pool.submit(self.fn, messages, **kwargs)
+        try:
+            return self._reply(future.result(timeout=self.timeout))
+        except FutureTimeout:
+            raise TimeoutError(f"{self!r} took longer than {self.timeout}s") from None
+
+    async def _acall(self, model, messages, temperature, max_tokens, **extra):
+        kwargs = dict(model=model, temperature=temperature, max_tokens=max_tokens, **extra)
+        if inspect.iscoroutinefunction(self.fn):
+            out = self.fn(messages, **kwargs)
+        else:
+            out = asyncio.to_thread(self.fn, messages, **kwargs)
+        return self._reply(await asyncio.wait_for(out, self.timeout))
+
+    @staticmethod
+    def _reply(out):
+        return out if isinstance(out, Reply) else Reply(out)
+
+    def __repr__(self):
+        return f"CallableBackend({getattr(self.fn, '__qualname__', self.fn)!r})"
+
+
+def load_callable(target):
+    """'package.module:attr' → the object it names."""
+    module, _, attr = target.partition(":")
+    obj = importlib.import_module(module)
+    for part in attr.split("."):
+        obj = getattr(obj, part)
+    return obj
+
+
+def make_backend(target=None, api_key=None, replay=False, **kwargs):
+    """Backend for a target: None / 'openai', an http(s) base URL, or 'module:callable'.
+
+    None follows $BCR_BASE_URL / $OPENAI_BASE_URL before falling back to OpenAI.
+    With `replay` (a replay-mode cache answers every request) the backend is
+    never called, so no API key is looked up.
+    """
+    if replay:
+        api_key = api_key or REPLAY_KEY
+    if callable(target):
+        return CallableBackend(target, **kwargs)
+    if target in (None, "openai"):
+        base_url = resolve_base_url(None)
+        if base_url:
+            return OpenAICompatibleBackend(base_url, api_key=api_key, **kwargs)
+        return OpenAIBackend(api_key=api_key, **kwargs)
+    if "://" in target:
+        return OpenAICompatibleBackend(target, api_key=api_key, **kwargs)
+    if ":" in target:
+        return CallableBackend(load_callable(target), **kwargs)
+    raise ValueError(f"Unknown backend {target!r}: expected 'openai', a URL or 'module:callable'")
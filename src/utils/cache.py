@@ -0,0 +1,206 @@
+# cache.py
+"""Content-addressed on-disk cache for LLM responses (SQLite backed)."""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_PATH = "data/cache/llm_cache.sqlite"
+
+
+class CacheMiss(KeyError):
+    """Raised in replay mode when a prompt has no stored response."""
+
+
+class ResponseCache:
+    """Map hash(model, temperature, messages, max_tokens) → response text.
+
+    `max_bytes` bounds the stored response size; least-recently-used entries
+    are evicted first. With `replay=True` the cache is read-only and a miss
+    raises CacheMiss instead of allowing a paid call.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, max_bytes=None, replay=False):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.replay = replay
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, model TEXT, response TEXT,"
+            " size INTEGER, created REAL, last_access REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_access ON responses(last_access)")
+        self._bytes = self._total_bytes()      # approximate; re-synced on eviction
+
+    def _total_bytes(self):
+        return self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def key(model, temperature, messages, max_tokens, sample=None, **extra):
+        """Stable SHA-256 of the request parameters that determine the response.
+
+        `sample` tells apart independent draws of the same sampled request.
+        """
+        if sample is not None:
+            extra = {**extra, "sample": sample}
+        blob = json.dumps({"model": model, "temperature": temperature, "messages": messages,
+                           "max_tokens": max_tokens, **extra},
+                          sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Return the cached response or None (CacheMiss in replay mode)."""
+        with self._lock:
+            row = self._db.execute("SELECT response FROM responses WHERE key=?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                if self.replay:
+                    raise CacheMiss(key)
+                return None
+            self.hits += 1
+            if not self.replay:
+                self._db.execute("UPDATE responses SET last_access=? WHERE key=?", (time.time(), key))
+            return row[0]
+
+    def put(self, key, response, model=None):
+        """Store a response; no-op in replay mode."""
+        if self.replay or response is None:
+            return
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, size, now, now),
+            )
+            self._bytes += size
+            if self.max_bytes is not None and self._bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        total = self._total_bytes()
+        target = int(self.max_bytes * 0.9)       # headroom so eviction is amortised
+        victims = []
+        for key, size in self._db.execute("SELECT key, size FROM responses ORDER BY last_access"):
+            if total <= target:
+                break
+            victims.append((key,))
+            total -= size
+        self._db.executemany("DELETE FROM responses WHERE key=?", victims)
+        self._bytes = total
+
+    def stats(self):
+        """Hit/miss counters for this session plus current store size."""
+        with self._lock:
+            entries, size = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": int(entries),
+            "bytes": int(size),
+        }
+
+    def close(self):
+        self._db.close()
+
+
+def cache_from_env():
+    """Build the shared cache from BCR_CACHE / BCR_CACHE_PATH / BCR_CACHE_MAX_MB.
+
+    BCR_CACHE is one of "on" (default), "replay" or "off".
+    """
+    mode = os.environ.get("BCR_CACHE", "on").lower()
+    if mode == "off":
+        return None
+    max_mb = os.environ.get("BCR_CACHE_MAX_MB")
+    return ResponseCache(
+        path=os.environ.get("BCR_CACHE_PATH", DEFAULT_PATH),
+        max_bytes=int(float(max_mb) * 2**20) if max_mb else None,
+        replay=(mode == "replay"),
+    )
+
+
+def _record_usage(meta, reply):
+    """Fill `meta` with token usage of a fresh Reply or mark a cache hit (None)."""
+    if meta is None:
+        return
+    meta["cached"] = reply is None
+    meta["prompt_tokens"] = getattr(reply, "prompt_tokens", None)
+    meta["completion_tokens"] = getattr(reply, "completion_tokens", None)
+
+
+def _cache_key(cache, model, temperature, messages, max_tokens, sample, extra):
+    """Cache key of a request, or None when it bypasses the cache.
+
+    Sampled requests (temperature > 0) are only cached under an explicit
+    `sample` index; otherwise a rerun would replay one draw as if it were fresh.
+    In replay mode such a request can never be answered and is a CacheMiss.
+    """
+    if cache is None:
+        return None
+    if temperature and sample is None:
+        if cache.replay:
+            raise CacheMiss("sampled request without a sample index is not cached")
+        return None
+    return ResponseCache.key(model, temperature, messages, max_tokens, sample=sample, **extra)
+
+
+def cached_chat(backend, cache, model, temperature, messages, max_tokens, validate=None,
+                meta=None, sample=None, **extra):
+    """`backend.chat` (see src.utils.backends) through the cache; returns the reply text.
+
+    Extra keyword arguments (e.g. `response_format`) are forwarded to the API
+    and become part of the cache key. `validate(content)` runs on a fresh reply
+    before it is stored; if it raises, the reply is not cached, so a retry
+    really asks again. A `meta` dict, if given, receives `cached` and the
+    reply's token usage. Calls with temperature > 0 are cached only when a
+    `sample` index is given (see _cache_key).
+    """
+    key = _cache_key(cache, model, temperature, messages, max_tokens, sample, extra)
+    if key is not None:
+        hit = cache.get(key)
+        if hit is not None:
+            _record_usage(meta, None)
+            return hit
+    reply = backend.chat(model, messages, temperature=temperature, max_tokens=max_tokens, **extra)
+    content = reply.content
+    _record_usage(meta, reply)
+    if validate is not None:
+        validate(content)
+    if key is not None:
+        cache.put(key, content, model=model)
+    return content
+
+
+async def acached_chat(backend, cache, model, temperature, messages, max_tokens, limiter=None,
+                       validate=None, meta=None, sample=None, **extra):
+    """Async twin of cached_chat over `backend.achat`.
+
+    `limiter` (a RateLimiter) is only charged when the backend is actually called.
+    """
+    key = _cache_key(cache, model, temperature, messages, max_tokens, sample, extra)
+    if key is not None:
+        hit = cache.get(key)
+        if hit is not None:
+            _record_usage(meta, None)
+            return hit
+    reply = await backend.achat(model, messages, temperature=temperature, max_tokens=max_tokens,
+                                limiter=limiter, **extra)
+    content = reply.content
+    _record_usage(meta, reply)
+    if validate is not None:
+        validate(content)
+    if key is not None:
+        cache.put(key, content, model=model)
+    return content
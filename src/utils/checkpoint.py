@@ -0,0 +1,57 @@
+# checkpoint.py
+"""Append-only JSONL checkpoints for long, resumable runs."""
+import json
+import os
+
+
+class JsonlCheckpoint:
+    """Buffer per-item records and append them to `path` every `flush_every` items.
+
+    Each flush is fsync'ed, so at most `flush_every` records are lost on a
+    crash. A torn final line (e.g. from a kill mid-write) is ignored on load.
+    """
+
+    def __init__(self, path, flush_every=50, key="item_id"):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.flush_every = flush_every
+        self.key = key
+        self._buffer = []
+
+    def load(self):
+        """Return {key: record} for every complete record already on disk."""
+        done = {}
+        if not os.path.exists(self.path):
+            return done
+        with open(self.path, "rb") as f:
+            data = f.read()
+        complete = data[:data.rfind(b"\n") + 1]
+        if len(complete) != len(data):            # drop a torn final write
+            with open(self.path, "wb") as f:
+                f.write(complete)
+        for line in complete.decode("utf-8").splitlines():
+            try:
+                rec = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            done[rec[self.key]] = rec
+        return done
+
+    def reset(self):
+        """Start a fresh checkpoint, discarding any previous one."""
+        self._buffer = []
+        open(self.path, "w", encoding="utf-8").close()
+
+    def append(self, record):
+        self._buffer.append(record)
+        if len(self._buffer) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in self._buffer))
+            f.flush()
+            os.fsync(f.fileno())
+        self._buffer = []
@@ -0,0 +1,87 @@
+# concurrency.py
+"""Asyncio helpers for bounded, rate-limited and retried API calls."""
+import asyncio
+import random
+import time
+
+
+class RateLimiter:
+    """Token bucket over requests/minute and tokens/minute (either may be None)."""
+
+    def __init__(self, requests_per_min=None, tokens_per_min=None):
+        self.rpm = requests_per_min
+        self.tpm = tokens_per_min
+        self._requests = float(requests_per_min or 0)
+        self._tokens = float(tokens_per_min or 0)
+        self._last = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed, self._last = now - self._last, now
+        if self.rpm:
+            self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        if self.tpm:
+            self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    async def acquire(self, tokens=0):
+        """Wait until one request costing `tokens` tokens fits in both buckets."""
+        if self.tpm:
+            tokens = min(tokens, self.tpm)           # never wait for an impossible budget
+        async with self._lock:
+            while True:
+                self._refill()
+                wait = 0.0
+                if self.rpm and self._requests < 1:
+                    wait = max(wait, (1 - self._requests) * 60 / self.rpm)
+                if self.tpm and self._tokens < tokens:
+                    wait = max(wait, (tokens - self._tokens) * 60 / self.tpm)
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            if self.rpm:
+                self._requests -= 1
+            if self.tpm:
+                self._tokens -= tokens
+
+
+class LimiterChain:
+    """Charge each request against several limiters, e.g. a global and a per-provider budget."""
+
+    def __init__(self, *limiters):
+        self.limiters = [l for l in limiters if l is not None]
+
+    async def acquire(self, tokens=0):
+        for limiter in self.limiters:
+            await limiter.acquire(tokens)
+
+
+async def retry_async(fn, max_retries=3, base_delay=1.0, max_delay=30.0, retry_on=(Exception,)):
+    """Await `fn()` up to `max_retries` times with full-jitter exponential back-off."""
+    for attempt in range(1, max_retries + 1):
+        try:
+            return await fn()
+        except retry_on:
+            if attempt == max_retries:
+                raise
+            await asyncio.sleep(random.uniform(0, min(max_delay, base_delay * 2 ** attempt)))
+
+
+async def map_bounded(fn, items, concurrency=16, on_result=None):
+    """Apply async `fn` to every item with at most `concurrency` in flight.
+
+    Results are returned in input order; `on_result(i, result)` is called as
+    each one completes.
+    """
+    items = list(items)
+    results = [None] * len(items)
+    pending = iter(enumerate(items))     # shared by all workers
+
+    async def worker():
+        for i, item in pending:
+            results[i] = await fn(item)
+            if on_result is not None:
+                on_result(i, results[i])
+
+    await asyncio.gather(*(worker() for _ in range(max(1, min(concurrency, len(items))))))
+    return results
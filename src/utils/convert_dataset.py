@@ -0,0 +1,21 @@
+"""Convert an MMLU-style dataset between CSV, Parquet and Arrow IPC.
+
+    python -m src.utils.convert_dataset data/raw/mmlu_test.csv data/raw/mmlu_test.parquet
+"""
+import argparse
+import time
+from src.utils.dataset import load_mmlu, save_mmlu
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("src", help="Input dataset (.csv, .parquet, .arrow/.feather)")
+    parser.add_argument("dst", help="Output dataset; format follows the suffix")
+    args = parser.parse_args()
+
+    start = time.time()
+    df = load_mmlu(args.src)            # also attaches item_id so it travels with the file
+    save_mmlu(df, args.dst)
+    print(f"Wrote {args.dst} with {len(df)} rows in {time.time() - start:.2f}s")
+
+if __name__ == "__main__":
+    main()
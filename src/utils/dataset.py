@@ -1,20 +1,168 @@
 # dataset.py  (helper you can import anywhere)
 import ast
+import hashlib
+import json
+import os
+import zlib
+import numpy as np
 import pandas as pd
 import random, string, copy
 from typing import List, Tuple
 
 
-def load_mmlu(path: str = "mmlu_test.csv") -> pd.DataFrame:
-    """Load and parse the MMLU dataset from CSV, converting choices from string to list."""
-    df = pd.read_csv(path)
-    df["choices"] = df["choices"].apply(ast.literal_eval)   # "[0,4,2,6]" → [0,4,2,6]
+def item_id(subject: str, question: str, choices: List[str], answer: int) -> str:
+    """Stable content hash identifying one benchmark item."""
+    blob = json.dumps([subject, question, list(choices), int(answer)], ensure_ascii=False)
+    return hashlib.sha1(blob.encode("utf-8")).hexdigest()[:16]
+
+def shard_of(item_ids, n: int) -> np.ndarray:
+    """Shard index in [0, n) of each item, from a stable hash of its id."""
+    return np.fromiter((zlib.crc32(str(i).encode("utf-8")) % n for i in item_ids),
+                       dtype=np.int64, count=len(item_ids))
+
+def parse_shard(spec: str) -> Tuple[int, int]:
+    """'i/n' → (i, n) with 0 <= i < n."""
+    i, sep, n = spec.partition("/")
+    if not sep or not (0 <= int(i) < int(n)):
+        raise ValueError(f"shard must look like i/n with 0 <= i < n, got {spec!r}")
+    return int(i), int(n)
+
+def add_item_ids(df: pd.DataFrame) -> pd.DataFrame:
+    """Add an `item_id` column from item content unless one is already present."""
+    if "item_id" not in df.columns:
+        df["item_id"] = [item_id(s, q, c, a) for s, q, c, a in
+                         zip(df["subject"], df["question"], df["choices"], df["answer"])]
+    return df
+
+PARQUET_SUFFIXES = {".parquet", ".pq"}
+ARROW_SUFFIXES   = {".arrow", ".feather", ".ipc"}
+
+def _is_columnar(path: str) -> bool:
+    return os.path.splitext(str(path))[1].lower() in PARQUET_SUFFIXES | ARROW_SUFFIXES
+
+def _read_columnar(path: str, columns=None, memory_map=True) -> pd.DataFrame:
+    try:
+        import pyarrow.feather as feather
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError(f"Reading {path} requires pyarrow (pip install pyarrow)") from e
+    if os.path.splitext(str(path))[1].lower() in PARQUET_SUFFIXES:
+        table = pq.read_table(path, columns=columns, memory_map=memory_map)
+    else:
+        table = feather.read_table(path, columns=columns, memory_map=memory_map)
+    return table.to_pandas()
+
+def load_mmlu(path: str = "mmlu_test.csv", columns=None, memory_map=True) -> pd.DataFrame:
+    """Load and parse the MMLU dataset, with `choices` as Python lists.
+
+    Parquet (.parquet) and Arrow IPC (.arrow/.feather) files store `choices` as a
+    native list<string> column and are read memory-mapped; CSV files fall back to
+    parsing each cell with ast.literal_eval. `columns` projects the read.
+
+    Derived datasets keep the `item_id` of the item they were generated from;
+    raw files get one computed from content.
+    """
+    if _is_columnar(path):
+        df = _read_columnar(path, columns=columns, memory_map=memory_map)
+        if "choices" in df.columns:
+            df["choices"] = df["choices"].map(list)          # ndarray → list
+    else:
+        df = pd.read_csv(path, usecols=columns)
+        if "choices" in df.columns:
+            df["choices"] = df["choices"].apply(ast.literal_eval)   # "[0,4,2,6]" → [0,4,2,6]
+    if {"subject", "question", "choices", "answer"} <= set(df.columns):
+        add_item_ids(df)
     return df
 
-def stratified_sample(df, frac=0.2, seed: int = 42):
-    """Stratified sample of the dataset."""
-    return (
-        df.groupby("subject", group_keys=False)
-          .apply(lambda x: x.sample(frac=frac, random_state=seed))
-          .reset_index(drop=True)
-    )
+def save_mmlu(df: pd.DataFrame, path: str) -> None:
+    """Write a dataset as CSV, Parquet or Arrow IPC depending on the suffix."""
+    os.makedirs(os.path.dirname(str(path)) or ".", exist_ok=True)
+    if not _is_columnar(path):
+        if "choices" in df.columns and isinstance(df["choices"].dtype, pd.ArrowDtype):
+            df = df.assign(choices=df["choices"].map(list))   # python repr, as load_mmlu expects
+        df.to_csv(path, index=False)
+        return
+    try:
+        import pyarrow as pa
+        import pyarrow.feather as feather
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError(f"Writing {path} requires pyarrow (pip install pyarrow)") from e
+    out = df.copy()
+    if "choices" in out.columns and not isinstance(out["choices"].dtype, pd.ArrowDtype):
+        out["choices"] = out["choices"].map(lambda c: [str(x) for x in c])
+    # plain Arrow schema: pandas metadata would pin Arrow-backed dtypes some readers reject
+    table = pa.Table.from_pandas(out, preserve_index=False).replace_schema_metadata(None)
+    if os.path.splitext(str(path))[1].lower() in PARQUET_SUFFIXES:
+        pq.write_table(table, path)
+    else:
+        feather.write_feather(table, path, compression="uncompressed")   # mmap-friendly
+
+def choices_column(rows: np.ndarray, index=None) -> pd.Series:
+    """Build a `choices` column from an (N, k) object array padded with None.
+
+    With pyarrow installed this is an Arrow list<string> column assembled from
+    flat values and offsets, which save_mmlu writes without per-row conversion.
+    """
+    present = rows != None                                   # noqa: E711 (element-wise)
+    try:
+        import pyarrow as pa
+    except ImportError:
+        return pd.Series([list(r[m]) for r, m in zip(rows, present)], index=index)
+    offsets = np.concatenate([[0], np.cumsum(present.sum(axis=1))]).astype(np.int32)
+    values = pa.array(rows[present].astype(str), type=pa.string())
+    return pd.Series(pd.arrays.ArrowExtensionArray(pa.ListArray.from_arrays(offsets, values)),
+                     index=index)
+
+SAMPLE_BLOCK_CELLS = 1 << 24     # random keys per block in stratified_indices
+
+def allocate(counts, n: int) -> np.ndarray:
+    """Largest-remainder allocation of `n` draws across strata of sizes `counts`.
+
+    Quotas are proportional to stratum size and always sum to exactly `n`;
+    leftover units go to the largest fractional parts (ties: first stratum).
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    total = int(counts.sum())
+    if not 0 <= n <= total:
+        raise ValueError(f"cannot draw {n} items from {total}")
+    quota = counts * n / max(total, 1)
+    alloc = np.floor(quota).astype(np.int64)
+    extra = np.argsort(-(quota - alloc), kind="stable")[: n - int(alloc.sum())]
+    alloc[extra] += 1
+    return alloc
+
+def stratified_indices(strata, n: int = None, frac: float = None, seed: int = 42,
+                       n_samples: int = 1) -> np.ndarray:
+    """(n_samples, n) row positions of independent stratified samples, sorted per row.
+
+    `strata` labels each row (e.g. df["subject"]); give the sample size as `n`
+    or as `frac` of all rows. Every sample has exactly the largest-remainder
+    allocation per stratum. All samples come from one (n_samples, N) draw of
+    random keys: sorting rows by stratum + key puts each stratum's rows in a
+    random order, and the first alloc[g] of stratum g are taken. Sample m is
+    the same for any n_samples > m. Keys are drawn in blocks of at most
+    SAMPLE_BLOCK_CELLS to bound memory.
+    """
+    codes, _ = pd.factorize(np.asarray(strata, dtype=object), sort=True)
+    N = len(codes)
+    if n is None:
+        n = int(round(frac * N))
+    counts = np.bincount(codes)
+    alloc = allocate(counts, n)
+    sorted_codes = np.sort(codes)
+    rank = np.arange(N) - np.repeat(np.cumsum(counts) - counts, counts)
+    take = rank < alloc[sorted_codes]                 # same positions for every sample
+    rng = np.random.default_rng(seed)
+    block = max(1, SAMPLE_BLOCK_CELLS // max(N, 1))
+    out = np.empty((n_samples, n), dtype=np.int64)
+    for start in range(0, n_samples, block):
+        keys = codes + rng.random((min(block, n_samples - start), N))
+        order = np.argsort(keys, axis=1, kind="stable")
+        out[start:start + len(keys)] = np.sort(order[:, take], axis=1)
+    return out
+
+def stratified_sample(df, frac=0.2, seed: int = 42, n: int = None, by: str = "subject"):
+    """Stratified sample of the dataset with exactly `n` (or round(frac·N)) rows."""
+    idx = stratified_indices(df[by], n=n, frac=frac, seed=seed)[0]
+    return df.iloc[idx].reset_index(drop=True)
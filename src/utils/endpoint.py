@@ -0,0 +1,49 @@
+# endpoint.py
+"""Where API calls go: one base-URL setting shared by every caller.
+
+An explicit base URL wins, then BCR_BASE_URL, then OPENAI_BASE_URL; with
+none of them set the OpenAI API is used. Pointing BCR_BASE_URL at the stub
+server (src.evaluation.stub_server) sends the evaluators, the paraphrase
+generator and construct validity there without code or flag changes.
+
+OPENAI_API_KEY is only ever sent to the OpenAI API itself; other endpoints
+get BCR_API_KEY (or a provider-specific key) or a placeholder.
+"""
+import os
+from urllib.parse import urlsplit
+
+BASE_URL_ENV = ("BCR_BASE_URL", "OPENAI_BASE_URL")
+OPENAI_HOST = "api.openai.com"
+
+
+def resolve_base_url(base_url=None):
+    """The endpoint to call, or None for the OpenAI default."""
+    if base_url:
+        return base_url
+    for name in BASE_URL_ENV:
+        if os.environ.get(name):
+            return os.environ[name]
+    return None
+
+
+def is_openai(base_url=None):
+    """True for the OpenAI API: no base URL, or one on api.openai.com."""
+    return not base_url or urlsplit(base_url).hostname == OPENAI_HOST
+
+
+def resolve_api_key(base_url=None, env=("BCR_API_KEY",)):
+    """The key to send to `base_url`.
+
+    The OpenAI API uses OPENAI_API_KEY and raises ValueError without it. Any
+    other endpoint gets the first key found in the `env` variables (never
+    OPENAI_API_KEY), or "stub" when none is set, since a stub or local server
+    needs no key.
+    """
+    if is_openai(base_url):
+        if os.environ.get("OPENAI_API_KEY"):
+            return os.environ["OPENAI_API_KEY"]
+        raise ValueError("OPENAI_API_KEY not found in environment variables")
+    for name in env:
+        if name != "OPENAI_API_KEY" and os.environ.get(name):
+            return os.environ[name]
+    return "stub"
@@ -0,0 +1,74 @@
+# fingerprint.py
+"""Content fingerprints of metric inputs, for skipping metrics whose inputs are unchanged."""
+import hashlib
+import inspect
+import json
+import os
+import sys
+
+STAT_CACHE = ".fingerprints.json"     # path -> (size, mtime_ns, sha256), kept in the results dir
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class Fingerprinter:
+    """Hash files by content, remembering digests by (size, mtime) so unchanged
+    files are not re-read on the next run."""
+
+    def __init__(self, cache_dir):
+        self.path = os.path.join(cache_dir, STAT_CACHE)
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self._known = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            self._known = {}
+
+    def file(self, path):
+        """sha256 of a file's content."""
+        key = os.path.abspath(path)
+        st = os.stat(key)
+        known = self._known.get(key)
+        if known and known[0] == st.st_size and known[1] == st.st_mtime_ns:
+            return known[2]
+        h = hashlib.sha256()
+        with open(key, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        self._known[key] = [st.st_size, st.st_mtime_ns, h.hexdigest()]
+        return h.hexdigest()
+
+    def value(self, v):
+        """JSON-able stand-in for a parameter: existing files become their digest."""
+        if isinstance(v, (str, os.PathLike)) and os.path.isfile(v):
+            return {"file": self.file(v)}
+        if isinstance(v, (list, tuple)):
+            return [self.value(x) for x in v]
+        if isinstance(v, dict):
+            return {k: self.value(x) for k, x in sorted(v.items())}
+        return v
+
+    def code(self, fn):
+        """Digests of the module defining `fn` and every src.* module it imports, transitively.
+
+        Keyed by path relative to the repository root, so same-named modules
+        in different packages do not collide.
+        """
+        files, stack = set(), [sys.modules[fn.__module__]]
+        while stack:
+            module = stack.pop()
+            src = getattr(module, "__file__", None)
+            if not src or src in files:
+                continue
+            files.add(src)
+            for obj in vars(module).values():
+                name = obj.__name__ if inspect.ismodule(obj) else getattr(obj, "__module__", None)
+                if isinstance(name, str) and name.startswith("src.") and name in sys.modules:
+                    stack.append(sys.modules[name])
+        return {os.path.relpath(f, ROOT): self.file(f) for f in sorted(files)}
+
+    def digest(self, **parts):
+        return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(self._known, f)
@@ -1,6 +1,9 @@
 # perturb.py
 import random, string, copy
+from concurrent.futures import ProcessPoolExecutor
 from typing import List, Tuple
+import numpy as np
+import pandas as pd
 
 def inject_noise(text: str, prob_space=0.15, prob_char=0.10) -> str:
     """Randomly double spaces and insert benign punctuation."""
@@ -20,3 +23,123 @@ def shuffle_choices(choices: List[str], answer_idx: int) -> Tuple[List[str], int
     shuffled = [choices[i] for i in idxs]
     new_answer = idxs.index(answer_idx)
     return shuffled, new_answer
+
+
+# ---------------------------------------------------------------- batch engine
+# Randomness is a counter-based hash of (item key, character position), so each
+# item's noise depends only on its id and the seed — never on row order or on
+# how the column is sharded across processes. Each consumer mixes its own
+# constant tag into the item key, so the noise and shuffle streams of an item
+# are independent even though both count from zero.
+
+NOISE_PUNCT = np.array([ord(c) for c in ",.;:-"], dtype=np.uint32)
+_ALPHA_BMP = None
+SHUFFLE_TAG = np.uint64(0x53485546464C4531)     # "SHUFFLE1": domain tag of the shuffle stream
+
+
+def item_keys(item_ids, seed: int = 42) -> np.ndarray:
+    """64-bit per-item random keys derived from stable item ids and a seed."""
+    ids = pd.util.hash_array(np.asarray(item_ids, dtype=object))     # fixed-key SipHash
+    return hash_bits(ids, np.full(len(ids), seed, dtype=np.uint64))
+
+
+def hash_bits(keys: np.ndarray, counters: np.ndarray) -> np.ndarray:
+    """splitmix64(key + counter·φ) element-wise: 64 random bits per (key, counter)."""
+    with np.errstate(over="ignore"):
+        z = keys + counters.astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return z ^ (z >> np.uint64(31))
+
+
+_DRAW_BITS = 21                  # three independent 21-bit draws per 64-bit hash
+
+
+def _draw(z: np.ndarray, slot: int) -> np.ndarray:
+    """Integer draw in [0, 2**21) from the `slot`-th 21-bit slice of each hash."""
+    return (z >> np.uint64(slot * _DRAW_BITS)) & np.uint64((1 << _DRAW_BITS) - 1)
+
+
+def _isalpha(codes: np.ndarray) -> np.ndarray:
+    """str.isalpha over an array of code points (BMP via lookup table)."""
+    global _ALPHA_BMP
+    if _ALPHA_BMP is None:
+        _ALPHA_BMP = np.fromiter((chr(i).isalpha() for i in range(0x10000)), bool, 0x10000)
+    out = np.zeros(codes.shape, dtype=bool)
+    bmp = codes < 0x10000
+    out[bmp] = _ALPHA_BMP[codes[bmp]]
+    if not bmp.all():
+        out[~bmp] = [chr(c).isalpha() for c in codes[~bmp]]
+    return out
+
+
+def _noise_chunk(texts, keys, prob_space, prob_char):
+    lens = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts))
+    codes = np.frombuffer("".join(texts).encode("utf-32-le"), dtype="<u4")
+    owner = np.repeat(np.arange(len(texts)), lens)
+    pos = np.arange(len(codes)) - np.repeat(np.cumsum(lens) - lens, lens)
+
+    z = hash_bits(keys[owner], pos)
+    scale = 1 << _DRAW_BITS
+    add_space = (codes == 32) & (_draw(z, 0) < int(prob_space * scale))     # double-space
+    add_punct = _isalpha(codes) & (_draw(z, 1) < int(prob_char * scale))    # harmless char
+    extra = add_space | add_punct
+
+    width = 1 + extra.astype(np.int64)
+    dest = np.cumsum(width) - width
+    out = np.empty(int(width.sum()), dtype="<u4")
+    out[dest] = codes
+    pick = (_draw(z[extra], 2) * np.uint64(len(NOISE_PUNCT))) >> np.uint64(_DRAW_BITS)
+    out[dest[extra] + 1] = np.where(add_space[extra], 32, NOISE_PUNCT[pick.astype(np.int64)])
+
+    new_lens = np.bincount(owner, weights=width, minlength=len(texts)).astype(np.int64)
+    ends = np.cumsum(new_lens)
+    joined = out.tobytes().decode("utf-32-le")
+    return [joined[e - n:e] for e, n in zip(ends.tolist(), new_lens.tolist())]
+
+
+def inject_noise_batch(texts, item_ids, seed: int = 42, prob_space=0.15, prob_char=0.10,
+                       n_jobs: int = 1, chunk_size: int = 50_000) -> List[str]:
+    """Vectorized inject_noise over a whole column.
+
+    Output for an item is a pure function of (item id, seed), so results are
+    identical for any row order, `chunk_size` or `n_jobs`.
+    """
+    texts = list(texts)
+    keys = item_keys(item_ids, seed)
+    chunks = [(texts[i:i + chunk_size], keys[i:i + chunk_size])
+              for i in range(0, len(texts), chunk_size)]
+    if n_jobs > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            parts = pool.map(_noise_chunk, *zip(*chunks),
+                             [prob_space] * len(chunks), [prob_char] * len(chunks))
+            return [t for part in parts for t in part]
+    return [t for c_texts, c_keys in chunks
+            for t in _noise_chunk(c_texts, c_keys, prob_space, prob_char)]
+
+
+def shuffle_choices_batch(choices, answers, item_ids, seed: int = 42,
+                          replicates: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+    """Vectorized shuffle_choices for a whole column, `replicates` times per item.
+
+    Each permutation is the argsort of per-(item, replicate, slot) hash keys,
+    so replicate r of an item is a pure function of (item id, seed, r).
+    Returns (choices, answers) with shapes (K, N, k) and (K, N); rows with
+    fewer than k options are padded with None at the end.
+    """
+    rows = [list(c) for c in choices]
+    n, K = len(rows), replicates
+    lens = np.fromiter(map(len, rows), dtype=np.int64, count=n)
+    k = int(lens.max()) if n else 0
+    grid = np.empty((n, k), dtype=object)                      # (N, k), padded with None
+    for j in range(k):
+        grid[:, j] = [r[j] if j < len(r) else None for r in rows]
+
+    counters = np.arange(K * k, dtype=np.uint64).reshape(K, 1, k)
+    item = item_keys(item_ids, seed) ^ SHUFFLE_TAG
+    keys = hash_bits(item[None, :, None], counters)                            # (K, N, k)
+    keys[:, np.arange(k)[None, :] >= lens[:, None]] = np.iinfo(np.uint64).max  # padding last
+    perm = np.argsort(keys, axis=-1, kind="stable")
+
+    new_answers = np.argmax(perm == np.asarray(answers, dtype=np.int64)[None, :, None], axis=-1)
+    return grid[np.arange(n)[None, :, None], perm], new_answers
@@ -0,0 +1,295 @@
+# predictions.py
+"""Load prediction files once and share compact correctness vectors between metrics.
+
+A prediction file holds one record per item: `item_id` (content hash of the
+item), `choice`, `is_correct`, `latency_ms`, `prompt_tokens`,
+`completion_tokens`, `cached` and the `raw` reply. Older files with only an
+`is_correct` column are still read positionally.
+"""
+import os
+import warnings
+import numpy as np
+import pandas as pd
+from src.utils.dataset import load_mmlu, save_mmlu, _is_columnar, _read_columnar
+
+RECORD_COLUMNS = ["item_id", "choice", "is_correct", "latency_ms",
+                  "prompt_tokens", "completion_tokens", "cached", "raw"]
+RECORD_DTYPES = {"choice": "Int8", "is_correct": "uint8", "latency_ms": "float32",
+                 "prompt_tokens": "Int32", "completion_tokens": "Int32", "cached": "boolean"}
+
+
+def read_predictions(path, columns=None):
+    """Read a prediction file (CSV, Parquet or Arrow IPC by suffix) as a DataFrame."""
+    if _is_columnar(path):
+        return _read_columnar(path, columns=columns)
+    if columns is not None:
+        header = pd.read_csv(path, nrows=0).columns
+        columns = [c for c in columns if c in header]
+    return pd.read_csv(path, usecols=columns)
+
+
+def save_predictions(records, path):
+    """Write prediction records (list of dicts or DataFrame) with compact dtypes."""
+    df = pd.DataFrame(records)
+    df = df.astype({c: t for c, t in RECORD_DTYPES.items() if c in df.columns})
+    os.makedirs(os.path.dirname(str(path)) or ".", exist_ok=True)
+    if _is_columnar(path):
+        save_mmlu(df, path)
+    else:
+        df.to_csv(path, index=False)
+
+
+def align_correct(df, item_ids):
+    """Hash-join prediction records onto `item_ids` in O(N).
+
+    Returns (correct, present): a uint8 vector in `item_ids` order (0 where
+    missing) and a boolean mask of the items that have a usable record.
+    """
+    ok = df["is_correct"].notna().to_numpy()
+    df = df[ok].drop_duplicates("item_id", keep="last")
+    pos = pd.Index(df["item_id"]).get_indexer(item_ids)
+    present = pos >= 0
+    correct = np.zeros(len(pos), dtype=np.uint8)
+    correct[present] = df["is_correct"].to_numpy(dtype=np.uint8)[pos[present]]
+    return correct, present
+
+
+def merge_predictions(paths, item_ids=None, allow_missing=False):
+    """Concatenate prediction shards into one record table.
+
+    Raises ValueError if an item appears in more than one shard or, given the
+    dataset's `item_ids`, if an item has no record (unless `allow_missing`).
+    Records come back in `item_ids` order when it is given.
+    """
+    parts = [read_predictions(p) for p in paths]
+    merged = pd.concat(parts, ignore_index=True)
+    dup = merged["item_id"].duplicated(keep=False)
+    if dup.any():
+        owners = {p: int(part["item_id"].isin(merged.loc[dup, "item_id"]).sum())
+                  for p, part in zip(paths, parts)}
+        raise ValueError(f"{merged.loc[dup, 'item_id'].nunique()} items occur in several "
+                         f"shards: {', '.join(f'{p} ({k})' for p, k in owners.items() if k)}")
+    if item_ids is None:
+        return merged
+    ids = pd.Index(item_ids).drop_duplicates()
+    pos = pd.Index(merged["item_id"]).get_indexer(ids)
+    if (pos < 0).any() and not allow_missing:
+        raise ValueError(f"{(pos < 0).sum()} of {len(ids)} dataset items have no record")
+    extra = len(merged) - (pos >= 0).sum()
+    if extra:
+        warnings.warn(f"{extra} records are not in the dataset and were dropped")
+    return merged.iloc[pos[pos >= 0]].reset_index(drop=True)
+
+
+def read_correct(path):
+    """Read the `is_correct` column of a prediction file as a uint8 vector."""
+    return read_predictions(path, columns=["is_correct"])["is_correct"].to_numpy(dtype=np.uint8)
+
+
+def as_correct(pred):
+    """Accept a prediction file path or an already-loaded vector; return uint8."""
+    if isinstance(pred, (str, os.PathLike)):
+        return read_correct(pred)
+    return np.asarray(pred, dtype=np.uint8)
+
+
+def as_aligned(pred, df):
+    """(correctness vector, dataset rows) for a prediction file or vector and a dataset.
+
+    Files with an `item_id` column are joined onto the dataset by id and the
+    dataset is cut to the items that have a prediction; anything else must
+    line up positionally.
+    """
+    if isinstance(pred, (str, os.PathLike)):
+        records = read_predictions(pred, columns=["item_id", "is_correct"])
+        if "item_id" in records.columns and "item_id" in df.columns:
+            correct, present = align_correct(records, df["item_id"])
+            if not present.all():
+                warnings.warn(f"{pred}: {(~present).sum()} dataset items have no prediction")
+                return correct[present], df[present].reset_index(drop=True)
+            return correct, df
+    correct = as_correct(pred)
+    if len(df) != len(correct):
+        raise ValueError(f"Dataset size mismatch: {len(df)} questions vs {len(correct)} predictions")
+    return correct, df
+
+
+def as_dataset(data):
+    """Accept a dataset path or an already-loaded DataFrame."""
+    if isinstance(data, (str, os.PathLike)):
+        return load_mmlu(data)
+    return data
+
+
+class CorrectnessMatrix:
+    """Item × model × variant correctness tensor written by the evaluation matrix runner.
+
+    `correct` has shape (N items, M models, V variants); axis labels are kept
+    alongside it in one .npz file. An optional boolean `present` mask of the
+    same shape marks which cells were actually evaluated (default: all).
+    """
+
+    def __init__(self, correct, item_ids, models, variants, present=None):
+        self.correct = np.asarray(correct, dtype=np.uint8)
+        self.item_ids = list(item_ids)
+        self.models = list(models)
+        self.variants = list(variants)
+        self.present = None if present is None else np.asarray(present, dtype=bool)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as z:
+            return cls(z["correct"], z["item_ids"].tolist(), z["models"].tolist(),
+                       z["variants"].tolist(), z["present"] if "present" in z else None)
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(str(path)) or ".", exist_ok=True)
+        extra = {} if self.present is None or self.present.all() else {"present": self.present}
+        np.savez_compressed(path, correct=self.correct, item_ids=np.array(self.item_ids),
+                            models=np.array(self.models), variants=np.array(self.variants),
+                            **extra)
+
+    def responses(self, variant=None):
+        """(respondents × items) float matrix, NaN where a cell is missing, and its row labels.
+
+        Every model × variant is one respondent, or only `variant` if given.
+        """
+        v = slice(None) if variant is None else [self.variants.index(variant)]
+        R = self.correct[:, :, v].astype(float)
+        if self.present is not None:
+            R[~self.present[:, :, v]] = np.nan
+        variants = self.variants if variant is None else [variant]
+        labels = [f"{m}/{var}" for m in self.models for var in variants]
+        return R.reshape(R.shape[0], -1).T, labels
+
+    def model(self, name=None):
+        """(V, N) float correctness of one model (default: the first), NaN where missing."""
+        m = 0 if name is None else self.models.index(name)
+        X = self.correct[:, m, :].T.astype(float)
+        if self.present is not None:
+            X[~self.present[:, m, :].T] = np.nan
+        return X
+
+    def __repr__(self):
+        N, M, V = self.correct.shape
+        return f"CorrectnessMatrix({N} items × {M} models × {V} variants)"
+
+
+def as_matrix(matrix):
+    """Accept a .npz path or an already-loaded CorrectnessMatrix."""
+    if isinstance(matrix, (str, os.PathLike)):
+        return CorrectnessMatrix.load(matrix)
+    return matrix
+
+
+class PredictionStore:
+    """In-process cache of correctness vectors, one read per file.
+
+    Given the reference dataset (`data_path`), files that carry an `item_id`
+    column are hash-joined onto its items, so partial files and shards in any
+    order are fine; files without one are taken positionally and must have
+    the same length. `resolve` restricts each metric to the items every one
+    of its inputs covers.
+    """
+
+    PATH_KEYS = ("pred_path", "orig_path", "pert_path")
+
+    def __init__(self, data_path=None):
+        self._vectors = {}
+        self._present = {}
+        self._datasets = {}
+        self._matrices = {}
+        self.data_path = data_path
+        self._item_ids = None
+
+    @property
+    def item_ids(self):
+        """Item ids of the reference dataset (loaded on first use), or None."""
+        if self._item_ids is None and self.data_path is not None and os.path.exists(self.data_path):
+            self._item_ids = pd.Index(self.dataset(self.data_path)["item_id"])
+        return self._item_ids
+
+    def get(self, path):
+        """Correctness vector for `path` as np.uint8, aligned to `item_ids`."""
+        key = os.path.abspath(path)
+        if key not in self._vectors:
+            df = read_predictions(path, columns=["item_id", "is_correct"])
+            if self.item_ids is not None and "item_id" in df.columns:
+                correct, present = align_correct(df, self.item_ids)
+            else:
+                correct = df["is_correct"].to_numpy(dtype=np.uint8)
+                present = np.ones(len(correct), dtype=bool)
+                if self.item_ids is not None and len(correct) != len(self.item_ids):
+                    raise ValueError(f"Dataset size mismatch: {len(self.item_ids)} questions "
+                                     f"vs {len(correct)} predictions in {path}")
+            self._vectors[key] = correct
+            self._present[key] = present
+        return self._vectors[key]
+
+    def present(self, path):
+        """Boolean mask of dataset items that have a prediction in `path`."""
+        self.get(path)
+        return self._present[os.path.abspath(path)]
+
+    def stack(self, paths):
+        """(P, N) uint8 matrix of several prediction files."""
+        return np.vstack([self.get(p) for p in paths])
+
+    def packed(self, path):
+        """Bit-packed copy of a vector (N/8 bytes) for long-lived storage."""
+        return np.packbits(self.get(path))
+
+    def dataset(self, path):
+        """Parsed dataset, loaded once per path."""
+        key = os.path.abspath(path)
+        if key not in self._datasets:
+            self._datasets[key] = load_mmlu(path)
+        return self._datasets[key]
+
+    def matrix(self, path):
+        """CorrectnessMatrix, loaded once per path."""
+        key = os.path.abspath(path)
+        if key not in self._matrices:
+            self._matrices[key] = CorrectnessMatrix.load(path)
+        return self._matrices[key]
+
+    def resolve(self, params):
+        """Swap file paths in a metric's params for loaded vectors / DataFrames.
+
+        When some inputs miss items, every vector (and the reference dataset)
+        is cut down to the items all of them cover.
+        """
+        out = dict(params)
+        paths = [out[k] for k in self.PATH_KEYS if isinstance(out.get(k), (str, os.PathLike))]
+        paths += list(out.get("files") or []) + [p for p, _ in out.get("pairs") or []]
+        keep = None
+        if paths:
+            keep = np.logical_and.reduce([self.present(p) for p in paths])
+            if keep.all():
+                keep = None
+            else:
+                warnings.warn(f"Scoring {keep.sum()} of {len(keep)} items: "
+                              "the rest lack a prediction in at least one input")
+
+        def vec(p):
+            v = self.get(p)
+            return v if keep is None else v[keep]
+
+        for k in self.PATH_KEYS:
+            if isinstance(out.get(k), (str, os.PathLike)):
+                out[k] = vec(out[k])
+        if isinstance(out.get("data_path"), (str, os.PathLike)):
+            out["data_path"] = self.dataset(out["data_path"])
+            if keep is not None and len(out["data_path"]) == len(keep):
+                out["data_path"] = out["data_path"][keep].reset_index(drop=True)
+        if out.get("files") is not None:
+            out["files"] = [vec(f) for f in out["files"]]
+        if isinstance(out.get("matrix"), (str, os.PathLike)):
+            out["matrix"] = self.matrix(out["matrix"])
+        if out.get("pairs") is not None:
+            out["pairs"] = [(vec(p), name) for p, name in out["pairs"]]
+        return out
+
+    @property
+    def nbytes(self):
+        return sum(v.nbytes for v in self._vectors.values())
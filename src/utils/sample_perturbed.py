@@ -1,10 +1,11 @@
 import pandas as pd
 import numpy as np
+from src.utils.dataset import load_mmlu, save_mmlu
 
 def main():
-    # Load the sampled test set to get the indices
-    sampled_df = pd.read_csv("data/raw/mmlu_test_sampled_0.02.csv")
-    sampled_indices = set(sampled_df.index)
+    # Load the sampled test set to get its item ids
+    sampled_df = load_mmlu("data/raw/mmlu_test_sampled_0.02.csv")
+    sampled_ids = sampled_df["item_id"]
     
     # Process each perturbed dataset
     perturbed_files = [
@@ -15,12 +16,15 @@ def main():
     
     for file in perturbed_files:
         print(f"Processing {file}...")
-        df = pd.read_csv(file)
-        # Sample the same indices as the test set
-        sampled = df.iloc[list(sampled_indices)]
+        df = load_mmlu(file).drop_duplicates("item_id").reset_index(drop=True)
+        # Select the same items as the test set, joined on item_id (in test-set order)
+        pos = pd.Index(df["item_id"]).get_indexer(sampled_ids)
+        if (pos < 0).any():
+            print(f"  {(pos < 0).sum()} sampled items missing from {file}, skipped")
+        sampled = df.iloc[pos[pos >= 0]]
         # Save to predictions directory
         output_file = file.replace("perturbed", "predictions").replace("mmlu_", "gpt4_")
-        sampled.to_csv(output_file, index=False)
+        save_mmlu(sampled, output_file)
         print(f"Saved sampled dataset to {output_file}")
 
 if __name__ == "__main__":